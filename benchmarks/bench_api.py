@@ -0,0 +1,228 @@
+"""
+Benchmark de la API completa sin servicios externos: main.py corre en proceso con
+los fakes de benchmarks/fakes.py (latencia y errores configurables) y cada escenario
+se ejecuta con el test client de Flask desde N hilos.
+
+Escenarios:
+    companies    GET /companies?batch_size=...
+    contacts     POST /contacts
+    patch        PATCH /companies/<id>
+    enrichment   POST /contacts/enrichment con --contacts contactos por request
+
+Reporta por escenario latencias p50/p95/p99, throughput y códigos de respuesta, y
+al final el pico de memoria (RSS) del proceso. Con --output guarda los resultados
+en JSON; con --baseline los compara contra una corrida anterior y falla (exit 1)
+si el p95 o el throughput empeoran más que --tolerance.
+
+Con --serve PORT en lugar de medir levanta la app con los fakes en ese puerto,
+para usar benchmarks/load_test.py o cualquier otra herramienta externa.
+
+Requiere las dependencias de requirements.txt (no necesita credenciales).
+
+Uso:
+    python benchmarks/bench_api.py --concurrency 16 --duration 10
+    python benchmarks/bench_api.py --scenario enrichment --latency-ms 50 --error-rate 0.01
+    python benchmarks/bench_api.py --output base.json
+    python benchmarks/bench_api.py --baseline base.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# La configuración se lee al importar main: límites altos para que la cuota no corte la medición
+os.environ.setdefault("CLAY_LIMITS", str(10 ** 12))
+os.environ.setdefault("CLAY_LIMIT_ADVERTISING", str(10 ** 12))
+
+from fakes import FakeProfile, install_fakes  # noqa: E402  (agrega src/ al path)
+
+SCENARIOS = ("companies", "contacts", "patch", "enrichment")
+
+
+def percentile(samples: list, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def contact(index: int) -> dict:
+    return {
+        "web_linkedin_url": f"https://www.linkedin.com/in/contact-{index}",
+        "biz_identifier": f"BIZ{index % 10000:08d}",
+        "biz_name": f"Empresa {index % 10000}",
+        "role": "Gerente de Compras",
+        "full_name": f"Contacto Número {index}",
+        "cat": "Retail",
+        "phone_number": "+52 55 1234 5678",
+        "phone_exists": True,
+        "src_scraped_name": "linkedin",
+    }
+
+
+def build_request(scenario: str, sequence: int, args) -> dict:
+    """Argumentos para client.open() del request número sequence del escenario"""
+    if scenario == "companies":
+        return {"path": f"/companies?batch_size={args.batch_size}", "method": "GET"}
+    if scenario == "contacts":
+        return {"path": "/contacts", "method": "POST", "json": contact(sequence)}
+    if scenario == "patch":
+        biz_identifier = f"BIZ{sequence % 10000:08d}"
+        return {
+            "path": f"/companies/{biz_identifier}",
+            "method": "PATCH",
+            "json": {"biz_identifier": biz_identifier, "biz_name": f"Empresa {sequence}", "contact_found_flg": True},
+        }
+    first = sequence * args.contacts
+    return {
+        "path": "/contacts/enrichment",
+        "method": "POST",
+        "json": {
+            "source": "bench",
+            "list_id": "bench-list",
+            "contacts": [contact(first + offset) for offset in range(args.contacts)],
+        },
+    }
+
+
+def run_scenario(app, scenario: str, args) -> dict:
+    latencies = []
+    status_codes = {}
+    lock = threading.Lock()
+    sequence = iter(range(10 ** 12))
+    deadline = time.perf_counter() + args.duration
+
+    def worker() -> None:
+        client = app.test_client()
+        local_latencies = []
+        local_codes = {}
+        while time.perf_counter() < deadline:
+            with lock:
+                number = next(sequence)
+            request_kwargs = build_request(scenario, number, args)
+            start_time = time.perf_counter()
+            response = client.open(**request_kwargs)
+            response.get_data()
+            local_latencies.append((time.perf_counter() - start_time) * 1000)
+            local_codes[response.status_code] = local_codes.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for code, count in local_codes.items():
+                status_codes[code] = status_codes.get(code, 0) + count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for code, count in status_codes.items() if code >= 500)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regresiones de p95 y throughput respecto de la corrida base"""
+    regressions = []
+    for scenario, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {previous['p95_ms']:.1f} ms -> {current['p95_ms']:.1f} ms")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {previous['throughput_rps']:.1f} -> {current['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Repetible; por defecto todos")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=100, help="batch_size de /companies")
+    parser.add_argument("--contacts", type=int, default=200, help="Contactos por request de /contacts/enrichment")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latencia de cada llamada a un fake")
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de error de cada llamada a un fake")
+    parser.add_argument("--scraped-fraction", type=float, default=0.3)
+    parser.add_argument("--output", help="Guarda los resultados en este archivo JSON")
+    parser.add_argument("--baseline", help="Resultados JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Levanta la app con fakes en PORT en vez de medir")
+    args = parser.parse_args()
+
+    import main as api
+
+    # Los logs por request distorsionan la medición
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    install_fakes(api.services, FakeProfile(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        scraped_fraction=args.scraped_fraction,
+    ))
+
+    if args.serve:
+        from werkzeug.serving import make_server
+        print(f"Sirviendo la app con fakes en http://0.0.0.0:{args.serve}")
+        make_server("0.0.0.0", args.serve, api.app, threaded=True).serve_forever()
+        return 0
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "serve")},
+        "scenarios": {},
+    }
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            stats = run_scenario(api.app, scenario, args)
+            results["scenarios"][scenario] = stats
+            print(
+                f"{scenario:<11} {stats['requests']:>7} req  {stats['throughput_rps']:8.1f} req/s  "
+                f"p50 {stats['p50_ms']:7.1f} ms  p95 {stats['p95_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms  "
+                f"códigos {stats['status_codes']}"
+            )
+    finally:
+        api.shutdown_services(timeout=5)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    print(f"RSS pico: {results['peak_rss_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("❌ Regresiones respecto de la base:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"✅ Sin regresiones (tolerancia {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
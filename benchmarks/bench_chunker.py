@@ -0,0 +1,106 @@
+"""
+Micro-benchmark del chunker de payloads para Clay.
+
+Compara el loop anterior (rearma current_chunk + [contact] y serializa el chunk
+completo por cada contacto) contra ContactChunker (serializa cada contacto una vez)
+sobre contactos sintéticos.
+
+El loop anterior medía con json.dumps(...).encode() (separadores ", " y ": ", no
+ASCII escapado); ContactChunker mide con serialization.dumps (JSON compacto), así que
+los cortes cambiaron: caben más contactos por chunk. Se verifica que ContactChunker
+corte igual que el mismo loop con serialization.dumps y se reporta cuántos chunks
+producía el loop anterior.
+
+Uso:
+    python benchmarks/bench_chunker.py --sizes 10000 100000
+    python benchmarks/bench_chunker.py --sizes 100000 --skip-legacy
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chunker import ContactChunker, MAX_PAYLOAD_BYTES
+from serialization import dumps
+
+
+def synthetic_contacts(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    roles = ["CEO", "CTO", "Director Comercial", "Gerente de Compras", "Jefe de Marketing"]
+    return [
+        {
+            "web_linkedin_url": f"https://www.linkedin.com/in/contacto-{i}-{rng.randint(1000, 99999)}",
+            "biz_identifier": f"RFC{rng.randint(100000, 999999)}",
+            "biz_name": f"Empresa Ñandú {rng.randint(1, 5000)} S.A. de C.V.",
+            "role": rng.choice(roles),
+            "full_name": f"Nombre{i} Apellido{rng.randint(1, 999)}",
+            "cat": rng.choice(["A", "B", "C"]),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_dumps(obj) -> bytes:
+    # Serialización anterior de los payloads de Cloud Tasks
+    return json.dumps(obj).encode("utf-8")
+
+
+def legacy_chunks(contacts: list, base_payload: dict, max_payload_bytes: int, serialize=legacy_dumps) -> list:
+    """Implementación anterior de post_contacts_enrichment (cuadrática)"""
+    def payload_size(contacts_chunk):
+        payload = {**base_payload, "contacts": contacts_chunk}
+        return len(serialize(payload))
+
+    chunks = []
+    current_chunk = []
+    for contact in contacts:
+        tentative_chunk = current_chunk + [contact]
+        if payload_size(tentative_chunk) <= max_payload_bytes:
+            current_chunk = tentative_chunk
+            continue
+        if not current_chunk:
+            raise ValueError("CONTACT_PAYLOAD_EXCEEDS_100KB_LIMIT")
+        chunks.append(current_chunk)
+        current_chunk = [contact]
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+
+def timed(fn):
+    start_time = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--skip-legacy", action="store_true", help="No ejecutar el loop anterior")
+    args = parser.parse_args()
+
+    base_payload = {"source": "scraper", "campaign": "benchmark"}
+
+    for size in args.sizes:
+        contacts = synthetic_contacts(size)
+        chunks, elapsed = timed(lambda: ContactChunker(base_payload, MAX_PAYLOAD_BYTES).chunk(contacts))
+        line = f"{size:>7} contactos  chunks={len(chunks):>5}  ContactChunker={elapsed * 1000:9.1f}ms"
+
+        if not args.skip_legacy:
+            legacy, legacy_elapsed = timed(lambda: legacy_chunks(contacts, base_payload, MAX_PAYLOAD_BYTES))
+            expected = legacy_chunks(contacts, base_payload, MAX_PAYLOAD_BYTES, serialize=dumps)
+            assert chunks == expected, "Los cortes de chunk difieren del loop anterior con serialization.dumps"
+            line += (
+                f"  anterior={legacy_elapsed * 1000:9.1f}ms  x{legacy_elapsed / elapsed:6.1f}"
+                f"  chunks anteriores={len(legacy):>5}"
+            )
+
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Micro-benchmark de serialización JSON sobre las formas reales de la API:
+
+    contact    un contacto de /contacts/enrichment (tamaños del chunker)
+    chunk      payload de un chunk de Cloud Tasks ({**base_payload, "contacts": [...]})
+    companies  respuesta de GET /companies con --companies empresas (filas con datetime)
+    message    mensaje de Pub/Sub de un contacto
+
+Compara la llamada anterior (json.dumps(...).encode("utf-8")), el fallback de
+serialization.dumps con la biblioteca estándar y orjson (si está instalado), y
+verifica que ambos backends produzcan exactamente los mismos bytes para estas formas
+(ver en src/serialization.py los casos en que difieren).
+
+Uso:
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --contacts 500 --companies 5000 --seconds 2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import serialization  # noqa: E402
+from bench_api import contact  # noqa: E402
+
+
+def shapes(contacts: int, companies: int) -> dict:
+    now = datetime.now(timezone.utc)
+    chunk_contacts = [contact(index) for index in range(contacts)]
+    return {
+        "contact": contact(1),
+        "chunk": {"source": "scraper", "list_id": "lista-ñandú", "contacts": chunk_contacts},
+        "companies": {
+            "success": True,
+            "data": [
+                {"biz_identifier": f"BIZ{index:08d}", "biz_name": f"Compañía Número {index} S.A. de C.V.", "scrapping_d": now}
+                for index in range(companies)
+            ],
+            "next_cursor": "eyJhZnRlciI6IkJJWjAwMDAwMDk5In0=",
+            "lease": None,
+            "time_taken": 0.123,
+            "timestamp": now.isoformat(),
+        },
+        "message": {**contact(2), "insert_d": now},
+    }
+
+
+def legacy_dumps(obj) -> bytes:
+    # Como las llamadas anteriores; default=str para las filas con datetime
+    return json.dumps(obj, default=str).encode("utf-8")
+
+
+def measure(fn, obj, seconds: float) -> tuple:
+    """(operaciones por segundo, MB/s de salida) durante al menos seconds"""
+    size = len(fn(obj))
+    operations = 0
+    start_time = time.perf_counter()
+    deadline = start_time + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(10):
+            fn(obj)
+        operations += 10
+    elapsed = time.perf_counter() - start_time
+    return operations / elapsed, operations * size / elapsed / (1024 * 1024)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contacts", type=int, default=200, help="Contactos del chunk")
+    parser.add_argument("--companies", type=int, default=1000, help="Empresas de la respuesta de /companies")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Tiempo de medición por forma y variante")
+    args = parser.parse_args()
+
+    variants = [("json.dumps+encode", legacy_dumps), ("stdlib compacto", serialization._stdlib_dumps)]
+    if serialization.orjson is not None:
+        variants.append(("orjson", serialization._orjson_dumps))
+    else:
+        print("orjson no está instalado: solo se mide la biblioteca estándar")
+
+    mismatches = []
+    for name, obj in shapes(args.contacts, args.companies).items():
+        if serialization.orjson is not None:
+            for sort_keys in (False, True):
+                if serialization._stdlib_dumps(obj, sort_keys) != serialization._orjson_dumps(obj, sort_keys):
+                    mismatches.append(f"{name} (sort_keys={sort_keys})")
+
+        baseline = None
+        for variant, fn in variants:
+            ops, megabytes = measure(fn, obj, args.seconds)
+            baseline = baseline or ops
+            print(
+                f"{name:<10} {variant:<18} {len(fn(obj)):>9} bytes  {ops:12.1f} ops/s  "
+                f"{megabytes:8.1f} MB/s  x{ops / baseline:5.2f}"
+            )
+
+    if mismatches:
+        print(f"❌ orjson y la biblioteca estándar producen bytes distintos: {', '.join(mismatches)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Benchmark de latencia por request: construir los clientes de Google en cada request
+(comportamiento anterior de get_services) vs. reutilizarlos desde el ServiceRegistry.
+
+Requiere las dependencias de requirements.txt y credenciales por defecto de Google
+(gcloud auth application-default login). No realiza llamadas a las APIs: solo mide
+el costo de obtener los servicios, que es lo que pagaba cada request.
+
+Uso:
+    python benchmarks/bench_service_registry.py --requests 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from config import Config
+from bigquery_services import BigQueryService
+from pub_sub_services import PubSubService
+from cloud_tasks import CloudTasks
+from service_registry import ServiceRegistry
+
+
+def build_services():
+    """Réplica del get_services() anterior: clientes nuevos en cada llamada"""
+    return (
+        BigQueryService(project=Config.GOOGLE_CLOUD_PROJECT_ID, dataset=Config.BIGQUERY_DATASET),
+        PubSubService(project_id=Config.GOOGLE_CLOUD_PROJECT_ID),
+        CloudTasks(
+            project=Config.GOOGLE_CLOUD_PROJECT_ID,
+            location=Config.CLOUD_TASKS_LOCATION,
+            queue=Config.CLOUD_TASKS_QUEUE
+        ),
+    )
+
+
+def build_registry() -> ServiceRegistry:
+    registry = ServiceRegistry()
+    registry.register("bigquery", lambda: BigQueryService(
+        project=Config.GOOGLE_CLOUD_PROJECT_ID, dataset=Config.BIGQUERY_DATASET
+    ))
+    registry.register("pubsub", lambda: PubSubService(project_id=Config.GOOGLE_CLOUD_PROJECT_ID))
+    registry.register("cloud_tasks", lambda: CloudTasks(
+        project=Config.GOOGLE_CLOUD_PROJECT_ID,
+        location=Config.CLOUD_TASKS_LOCATION,
+        queue=Config.CLOUD_TASKS_QUEUE
+    ))
+    return registry
+
+
+def measure(label: str, fn, requests: int) -> None:
+    samples = []
+    for _ in range(requests):
+        start_time = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start_time) * 1000)
+    samples.sort()
+    p95 = samples[max(0, int(len(samples) * 0.95) - 1)]
+    print(
+        f"{label:<28} p50={statistics.median(samples):9.3f}ms "
+        f"p95={p95:9.3f}ms max={samples[-1]:9.3f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    measure("clientes por request", build_services, args.requests)
+
+    registry = build_registry()
+    measure(
+        "registry (proceso)",
+        lambda: (registry.get("bigquery"), registry.get("pubsub"), registry.get("cloud_tasks")),
+        args.requests
+    )
+
+
+if __name__ == "__main__":
+    main()
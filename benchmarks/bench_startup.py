@@ -0,0 +1,109 @@
+"""
+Benchmark de cold start: tiempo de import de main.py medido con `python -X importtime`.
+
+Lanza un intérprete nuevo (sin caché de módulos en memoria), importa la app y
+suma el tiempo acumulado del módulo main. Falla (exit code 1) si supera el
+presupuesto o si en el arranque se importó algún módulo pesado que debería
+cargarse de forma perezosa (clientes de Google Cloud, Slack, pandas).
+
+Requiere las dependencias de requirements.txt (Flask, flask-cors, python-dotenv).
+
+Uso:
+    python benchmarks/bench_startup.py --budget-ms 500 --runs 5
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Módulos que no deben importarse al arrancar el worker
+FORBIDDEN_AT_STARTUP = (
+    "pandas",
+    "pandas_gbq",
+    "google.cloud.bigquery",
+    "google.cloud.pubsub_v1",
+    "google.cloud.firestore",
+    "google.cloud.tasks_v2",
+    "google.cloud.secretmanager",
+    "slack_sdk",
+    "slack",
+)
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def measure_once(module: str):
+    """Importa el módulo en un proceso nuevo y retorna (cumulative_us de main, {modulo: (self_us, cumulative_us)})"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us))
+
+    if module not in modules:
+        raise RuntimeError(f"{module} no aparece en la salida de -X importtime")
+    return modules[module][1], modules
+
+
+def forbidden_imports(modules) -> list:
+    return sorted(
+        name for name in modules
+        if any(name == forbidden or name.startswith(forbidden + ".") for forbidden in FORBIDDEN_AT_STARTUP)
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=500.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    samples_ms = []
+    modules = {}
+    for _ in range(args.runs):
+        cumulative_us, modules = measure_once(args.module)
+        samples_ms.append(cumulative_us / 1000)
+
+    median_ms = statistics.median(samples_ms)
+    print(f"import {args.module}: mediana {median_ms:.1f} ms, mín {min(samples_ms):.1f} ms, máx {max(samples_ms):.1f} ms ({args.runs} runs)")
+
+    print(f"\nTop {args.top} módulos por tiempo propio (última corrida):")
+    heaviest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in heaviest:
+        print(f"  {self_us / 1000:8.1f} ms  (acum. {cumulative_us / 1000:8.1f} ms)  {name}")
+
+    failed = False
+    eager = forbidden_imports(modules)
+    if eager:
+        failed = True
+        print("\n❌ Módulos pesados importados en el arranque:")
+        for name in eager:
+            print(f"  {name}")
+
+    if median_ms > args.budget_ms:
+        failed = True
+        print(f"\n❌ Cold start {median_ms:.1f} ms supera el presupuesto de {args.budget_ms:.1f} ms")
+
+    if not failed:
+        print(f"\n✅ Cold start dentro del presupuesto ({args.budget_ms:.1f} ms)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+Fakes en proceso de los servicios externos (BigQuery, Pub/Sub, Cloud Tasks,
+Firestore y Slack) para medir la API sin red ni credenciales.
+
+Cada fake expone los mismos métodos que usa main.py / EnrichmentPipeline y recibe
+un FaultInjector que agrega latencia (con jitter) y errores con una probabilidad
+dada, de modo que se puede reproducir un backend lento o inestable.
+
+Uso:
+    from fakes import FakeProfile, install_fakes
+    install_fakes(main.services, FakeProfile(latency_ms=20, error_rate=0.01))
+
+Requiere las dependencias de requirements.txt (las clases de resultado, como
+QuotaReservation, se importan de los módulos reales).
+"""
+import hashlib
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Mismas métricas que los servicios reales, para que /metrics muestre el desglose
+from metrics import timed  # noqa: E402
+from serialization import dumps  # noqa: E402
+from cloud_tasks import CloudTasks, RecentTaskCache  # noqa: E402
+from google.api_core.exceptions import AlreadyExists  # noqa: E402
+
+
+class FakeServiceError(Exception):
+    """Error inyectado por un fake"""
+
+
+class FaultInjector:
+    """Latencia y errores configurables por operación"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        overrides: Optional[Dict[str, Dict[str, float]]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        # {"reserve_quota": {"latency_ms": 80, "error_rate": 0.05}, ...}
+        self.overrides = overrides or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+
+    def __call__(self, operation: str) -> None:
+        settings = self.overrides.get(operation, {})
+        latency_ms = settings.get("latency_ms", self.latency_ms)
+        jitter_ms = settings.get("jitter_ms", self.jitter_ms)
+        error_rate = settings.get("error_rate", self.error_rate)
+
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            delay = max(0.0, latency_ms + self._random.uniform(-jitter_ms, jitter_ms)) / 1000
+            fail = self._random.random() < error_rate
+
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeServiceError(f"FAKE_ERROR: {operation}")
+
+
+@dataclass
+class FakeProfile:
+    """Configuración común a todos los fakes"""
+    latency_ms: float = 5.0
+    jitter_ms: float = 2.0
+    error_rate: float = 0.0
+    companies: int = 10000
+    # Fracción de URLs de contactos que BigQuery reporta como ya scrapeadas
+    scraped_fraction: float = 0.3
+    overrides: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    seed: Optional[int] = 42
+
+    def injector(self) -> FaultInjector:
+        return FaultInjector(self.latency_ms, self.jitter_ms, self.error_rate, self.overrides, self.seed)
+
+
+class FakeBigQueryService:
+    def __init__(self, injector: FaultInjector, companies: int = 10000, scraped_fraction: float = 0.3) -> None:
+        self.injector = injector
+        self.scraped_fraction = scraped_fraction
+        self.companies = [
+            {
+                "biz_identifier": f"BIZ{index:08d}",
+                "biz_name": f"Empresa {index}",
+                "scrapping_d": None,
+                "contact_found_flg": None,
+            }
+            for index in range(companies)
+        ]
+        self.status_updates = 0
+
+    def _select(self, batch_size: int, excluded_identifiers=None, after_identifier=None) -> List[Dict]:
+        excluded = set(excluded_identifiers or ())
+        selected = []
+        for company in self.companies:
+            if after_identifier is not None and company["biz_identifier"] <= after_identifier:
+                continue
+            if company["biz_identifier"] in excluded:
+                continue
+            selected.append(dict(company))
+            if len(selected) >= int(batch_size):
+                break
+        return selected
+
+    @timed("bigquery")
+    def obtener_empresas_no_scrapeadas_batch(self, batch_size: int, table_name: str, excluded_identifiers=None, after_identifier=None) -> List[Dict]:
+        self.injector("obtener_empresas_no_scrapeadas_batch")
+        return self._select(batch_size, excluded_identifiers, after_identifier)
+
+    def iterar_empresas_no_scrapeadas(self, batch_size: int, table_name: str, page_size: int = 1000, excluded_identifiers=None, after_identifier=None) -> Iterator[Dict]:
+        self.injector("iterar_empresas_no_scrapeadas")
+        return iter(self._select(batch_size, excluded_identifiers, after_identifier))
+
+    def actualizar_empresas_scrapeadas(self, table_name: str, biz_identifier: str, biz_name: str, contact_found_flg: bool) -> None:
+        self.injector("actualizar_empresas_scrapeadas")
+        self.status_updates += 1
+
+    @timed("bigquery")
+    def update_companies_scraped_status(self, table_name: str, companies_status: List[Dict]) -> int:
+        self.injector("update_companies_scraped_status")
+        self.status_updates += len(companies_status)
+        return len(companies_status)
+
+    @timed("bigquery")
+    def verify_if_contacts_was_scraped(self, table_name: str, contacts_urls: List[str]) -> Optional[Set[str]]:
+        self.injector("verify_if_contacts_was_scraped")
+        # Determinista por URL: la misma URL siempre da el mismo resultado
+        threshold = int(self.scraped_fraction * 2 ** 32)
+        return {
+            url for url in contacts_urls
+            if int.from_bytes(hashlib.sha1(url.encode("utf-8")).digest()[:4], "big") < threshold
+        }
+
+
+class FakePubSubService:
+    def __init__(self, injector: FaultInjector) -> None:
+        self.injector = injector
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.published_bytes = 0
+
+    @timed("pubsub")
+    def publish_message(self, topic_name: str, data: dict, wait: bool = True, timeout: Optional[float] = 30, callback: Optional[Callable] = None):
+        future: Future = Future()
+        try:
+            payload = dumps(data)
+            self.injector("publish_message")
+            with self._lock:
+                self.published += 1
+                self.published_bytes += len(payload)
+                message_id = str(next(self._ids))
+            future.set_result(message_id)
+        except Exception as error:
+            future.set_exception(error)
+        if callback is not None:
+            future.add_done_callback(callback)
+        if not wait:
+            return future
+        return future.result(timeout=timeout)
+
+    @timed("pubsub")
+    def publish_messages(self, topic_name: str, messages: List[dict], timeout: float = 30) -> List[Dict]:
+        results = []
+        for index, data in enumerate(messages):
+            try:
+                message_id = self.publish_message(topic_name, data, timeout=timeout)
+                results.append({"index": index, "success": True, "message_id": message_id, "error": None})
+            except Exception as error:
+                results.append({"index": index, "success": False, "message_id": None, "error": str(error)})
+        return results
+
+    def pending_count(self) -> int:
+        return 0
+
+    def drain(self, timeout: float = 30) -> int:
+        return 0
+
+
+class FakeCloudTasks(CloudTasks):
+    """
+    CloudTasks sin cliente gRPC: reutiliza el despacho concurrente y la deduplicación
+    reales y solo reemplaza la RPC CreateTask (que responde ALREADY_EXISTS si el
+    nombre de la tarea ya se usó, como el servicio).
+    """
+
+    def __init__(self, injector: FaultInjector, max_concurrency: int = 8) -> None:
+        self.project, self.location, self.queue = "fake", "fake", "fake"
+        self.max_concurrency = max_concurrency
+        self.recent_tasks = RecentTaskCache()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="cloud-tasks")
+        self.injector = injector
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._names: Set[str] = set()
+        self.created = 0
+
+    @timed("cloud_tasks")
+    def create_http_task(self, url: str, json_payload: Dict, scheduled_seconds_from_now: Optional[float] = None,
+                         task_id: Optional[str] = None, deadline_in_seconds: Optional[int] = None,
+                         headers: Optional[Dict] = None):
+        dumps(json_payload)
+        self.injector("create_http_task")
+        with self._lock:
+            task_id = task_id or f"task-{next(self._ids)}"
+            if task_id in self._names:
+                raise AlreadyExists(f"Task {task_id} already exists")
+            self._names.add(task_id)
+            self.created += 1
+        return SimpleNamespace(name=f"projects/fake/locations/fake/queues/fake/tasks/{task_id}")
+
+
+class FakeFirestoreService:
+    def __init__(self, injector: FaultInjector) -> None:
+        self.injector = injector
+        self.counter_shards = 0
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(collection: str, document_name: str) -> str:
+        return f"{collection}/{document_name}"
+
+    @timed("firestore")
+    def get_current_count(self, collection: str, document_name: str) -> int:
+        self.injector("get_current_count")
+        with self._lock:
+            return self._counts.get(self._key(collection, document_name), 0)
+
+    @timed("firestore")
+    def get_current_counts(self, collection: str, documents: List[str]) -> Dict[str, int]:
+        self.injector("get_current_counts")
+        with self._lock:
+            return {document_name: self._counts.get(self._key(collection, document_name), 0) for document_name in documents}
+
+    @timed("firestore")
+    def update_current_count(self, collection: str, document_name: str, count: int) -> None:
+        self.injector("update_current_count")
+        with self._lock:
+            self._counts[self._key(collection, document_name)] = count
+
+    @timed("firestore")
+    def increment_current_count(self, collection: str, document_name: str, increment: int) -> None:
+        self.injector("increment_current_count")
+        with self._lock:
+            key = self._key(collection, document_name)
+            self._counts[key] = self._counts.get(key, 0) + increment
+
+    @timed("firestore")
+    def reserve_quota(self, collection: str, documents: List[str], amount: int, limit: int = 50000, advertising_threshold: int = 40000):
+        from firebase_services import QuotaReservation
+
+        self.injector("reserve_quota")
+        with self._lock:
+            current = {document_name: self._counts.get(self._key(collection, document_name), 0) for document_name in documents}
+            new_counts = {document_name: count + amount for document_name, count in current.items()}
+            limit_exceeded = [document_name for document_name in documents if new_counts[document_name] > limit]
+            threshold_exceeded = [document_name for document_name in documents if new_counts[document_name] > advertising_threshold]
+            if limit_exceeded:
+                return QuotaReservation(False, amount, current, limit_exceeded, threshold_exceeded)
+            for document_name in documents:
+                self._counts[self._key(collection, document_name)] = new_counts[document_name]
+            return QuotaReservation(True, amount, new_counts, [], threshold_exceeded)
+
+    @timed("firestore")
+    def release_quota(self, collection: str, documents: List[str], amount: int) -> None:
+        if amount <= 0:
+            return
+        self.injector("release_quota")
+        with self._lock:
+            for document_name in documents:
+                key = self._key(collection, document_name)
+                self._counts[key] = self._counts.get(key, 0) - amount
+
+
+class FakeSlackService:
+    def __init__(self, injector: FaultInjector) -> None:
+        self.injector = injector
+        self.messages: List[str] = []
+        self._lock = threading.Lock()
+
+    @timed("slack")
+    def post_message(self, text: str):
+        self.injector("post_message")
+        with self._lock:
+            self.messages.append(text)
+        return {"ok": True}
+
+    def send_message(self, message: Dict) -> bool:
+        try:
+            self.post_message(message["text"])
+        except FakeServiceError:
+            return False
+        return True
+
+    def format_message(self, message: Dict) -> Dict:
+        return {"text": message["text"]}
+
+
+def build_fakes(profile: FakeProfile) -> Dict[str, object]:
+    """Una instancia de cada fake; todas comparten el mismo FaultInjector"""
+    injector = profile.injector()
+    return {
+        "bigquery": FakeBigQueryService(injector, profile.companies, profile.scraped_fraction),
+        "pubsub": FakePubSubService(injector),
+        "cloud_tasks": FakeCloudTasks(injector),
+        "firestore": FakeFirestoreService(injector),
+        "slack": FakeSlackService(injector),
+    }
+
+
+def install_fakes(services, profile: Optional[FakeProfile] = None) -> Dict[str, object]:
+    """
+    Reemplaza en el ServiceRegistry de main.py los servicios externos por fakes.
+    Debe llamarse antes del primer request: los servicios derivados (pipeline,
+    buffer, notifier, cuota local) se construyen con lo que haya registrado cuando
+    se piden por primera vez. Los leases de empresas y el estado de los lotes del
+    acumulador quedan en memoria.
+    """
+    from batch_status import InMemoryBatchStatusStore
+    from company_leases import InMemoryLeaseStore
+
+    fakes = build_fakes(profile or FakeProfile())
+    for name, fake in fakes.items():
+        services.register(name, lambda fake=fake: fake)
+    services.register("company_leases", InMemoryLeaseStore, required=False)
+    services.register("enrichment_batch_status", InMemoryBatchStatusStore, required=False)
+    return fakes
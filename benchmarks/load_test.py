@@ -0,0 +1,84 @@
+"""
+Prueba de carga simple (solo stdlib): N hilos haciendo requests contra una URL
+durante D segundos; reporta requests por segundo y latencias p50/p95/p99.
+
+Para comparar el servidor de desarrollo con gunicorn, desde src/:
+
+    python main.py                                   # Flask dev server en :8080
+    python ../benchmarks/load_test.py --url http://localhost:8080/status
+
+    gunicorn -c gunicorn.conf.py wsgi:app            # PORT=8080
+    python ../benchmarks/load_test.py --url http://localhost:8080/status
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def percentile(samples: list, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080/status")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", help="Body JSON para POST/PATCH")
+    parser.add_argument("--header", action="append", default=[], help="Header extra 'Nombre: valor'")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15)
+    args = parser.parse_args()
+
+    headers = {"Content-Type": "application/json"}
+    for header in args.header:
+        name, value = header.split(":", 1)
+        headers[name.strip()] = value.strip()
+    body = json.dumps(json.loads(args.body)).encode("utf-8") if args.body else None
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker() -> None:
+        local_latencies = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            request = urllib.request.Request(args.url, data=body, headers=headers, method=args.method)
+            start_time = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                local_latencies.append((time.perf_counter() - start_time) * 1000)
+            except (urllib.error.URLError, OSError):
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"URL:           {args.method} {args.url}")
+    print(f"Concurrencia:  {args.concurrency} hilos durante {elapsed:.1f}s")
+    print(f"Requests:      {len(latencies)} OK, {errors[0]} errores")
+    print(f"Throughput:    {len(latencies) / elapsed:.1f} req/s")
+    print(
+        f"Latencia (ms): p50={percentile(latencies, 0.50):.1f} "
+        f"p95={percentile(latencies, 0.95):.1f} p99={percentile(latencies, 0.99):.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
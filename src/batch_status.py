@@ -0,0 +1,91 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from logging import Logger
+import logging
+from typing import Dict, List, Optional
+
+from google.cloud import firestore
+
+logger: Logger = logging.getLogger(__name__)
+
+# Firestore permite como máximo 500 escrituras por batch
+FIRESTORE_MAX_WRITES = 500
+
+
+class BatchStatusStore(ABC):
+    """
+    Estado de los lotes del modo acumulador (EnrichmentBatcher), visible para
+    cualquier instancia: el worker que aceptó el lote guarda una copia cada vez que
+    cambia y GET /contacts/enrichment/batches/<batch_id> la lee aunque el request
+    llegue a otra instancia.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600) -> None:
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def save(self, batches: List[Dict]) -> None:
+        """Guarda (reemplaza) el estado de los lotes"""
+
+    @abstractmethod
+    def get(self, batch_id: str) -> Optional[Dict]:
+        """Estado del lote, o None si no existe o ya expiró"""
+
+
+class InMemoryBatchStatusStore(BatchStatusStore):
+    """Estado en memoria del proceso: para pruebas locales o un único worker"""
+
+    def __init__(self, ttl_seconds: float = 3600, max_batches: int = 100000) -> None:
+        super().__init__(ttl_seconds)
+        self.max_batches = max_batches
+        self._batches: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, batches: List[Dict]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            for batch in batches:
+                self._batches.pop(batch["batch_id"], None)
+                self._batches[batch["batch_id"]] = {"batch": batch, "expires_at": expires_at}
+            while len(self._batches) > self.max_batches:
+                self._batches.popitem(last=False)
+
+    def get(self, batch_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._batches.get(batch_id)
+            if entry is None or entry["expires_at"] <= time.time():
+                return None
+            return entry["batch"]
+
+
+class FirestoreBatchStatusStore(BatchStatusStore):
+    """
+    Un documento por lote con expires_at; conviene una política de TTL de Firestore
+    sobre ese campo para que los lotes viejos se borren solos.
+    """
+
+    def __init__(self, db: firestore.Client, collection: str, ttl_seconds: float = 3600) -> None:
+        super().__init__(ttl_seconds)
+        self.db = db
+        self.collection = collection
+
+    def save(self, batches: List[Dict]) -> None:
+        collection = self.db.collection(self.collection)
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        for start in range(0, len(batches), FIRESTORE_MAX_WRITES):
+            write_batch = self.db.batch()
+            for batch in batches[start:start + FIRESTORE_MAX_WRITES]:
+                write_batch.set(collection.document(batch["batch_id"]), {**batch, "expires_at": expires_at})
+            write_batch.commit()
+
+    def get(self, batch_id: str) -> Optional[Dict]:
+        snapshot = self.db.collection(self.collection).document(batch_id).get()
+        if not snapshot.exists:
+            return None
+        batch = snapshot.to_dict()
+        if batch.pop("expires_at") <= datetime.now(timezone.utc):
+            return None
+        return batch
@@ -1,13 +1,12 @@
 from datetime import datetime, date
 from math import log
 import os
-import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional, Set
 from logging import Logger
 import logging
 from google.cloud import bigquery
 from google.api_core.exceptions import NotFound
-from pandas_gbq import to_gbq
+from metrics import timed
 
 logger: Logger = logging.getLogger(__name__)
 
@@ -38,19 +37,19 @@ class BigQueryService:
         try:
             # Verificar si la tabla ya existe
             self.__bq_client.get_table(table_ref)
-            logger.info(f"ℹ️ La tabla {dataset_id}.{table_id} ya existe")
+            logger.info("ℹ️ La tabla %s.%s ya existe", dataset_id, table_id)
         except NotFound:
             # La tabla no existe, crearla
             try:
                 table = bigquery.Table(table_ref, schema=schema)
                 table = self.__bq_client.create_table(table)
-                logger.info(f"✅ Tabla de control {dataset_id}.{table_id} creada exitosamente con schema correcto")
+                logger.info("✅ Tabla de control %s.%s creada exitosamente con schema correcto", dataset_id, table_id)
                 return table
             except Exception as e:
-                logger.error(f"❌ Error creando tabla: {e}")
+                logger.error("❌ Error creando tabla: %s", e)
                 raise
         except Exception as e:
-                logger.error(f"❌ Error verificando tabla: {e}")
+                logger.error("❌ Error verificando tabla: %s", e)
                 raise
 
     def create_table_linkedin_info(self, table_name:str):
@@ -80,22 +79,27 @@ class BigQueryService:
         try:
             # Intentar obtener la tabla (si existe)
             self.__bq_client.get_table(table_ref)
-            logger.info(f"✅ Tabla de datos {dataset_id}.{table_id} ya existe")
+            logger.info("✅ Tabla de datos %s.%s ya existe", dataset_id, table_id)
         except NotFound:
             # Si no existe, crearla
             table = bigquery.Table(table_ref, schema=schema)
             table = self.__bq_client.create_table(table)
-            logger.info(f"✅ Tabla de datos {dataset_id}.{table_id} creada exitosamente")
+            logger.info("✅ Tabla de datos %s.%s creada exitosamente", dataset_id, table_id)
 
-    def obtener_empresas_no_scrapeadas_batch(self, batch_size: int , table_name: str) -> Dict[str, Dict]:
+    @timed("bigquery")
+    def obtener_empresas_no_scrapeadas_batch(self, batch_size: int , table_name: str, excluded_identifiers: Optional[List[str]] = None, after_identifier: Optional[str] = None) -> List[Dict]:
         """
-        Obtener múltiples empresas en una sola consulta BigQuery
+        Obtener múltiples empresas en una sola consulta BigQuery, ordenadas por biz_identifier
+        excluded_identifiers: biz_identifiers a omitir (p. ej. con lease vigente de otro scraper)
+        after_identifier: cursor de paginación, solo empresas con biz_identifier mayor a este
         Retorna: [
             {
                 'biz_name': str,
                 'biz_identifier': str
             }
         ]
+        Los errores de la consulta se lanzan: una lista vacía significa que no hay más
+        empresas, no que BigQuery falló.
         """
         project_id = self.__project_id
         dataset_id = self.__dataset
@@ -104,21 +108,54 @@ class BigQueryService:
         try:
             
             # Query para obtener todas las empresas de una vez
-            where_clause = "(contact_found_flg = 0 or contact_found_flg is null) and scrapping_d is null"
-            query = f"SELECT biz_identifier, biz_name FROM `{project_id}.{dataset_id}.{table_id}` WHERE {where_clause} LIMIT {batch_size}"
+            query, job_config = self.__query_empresas_no_scrapeadas(batch_size, table_name, excluded_identifiers, after_identifier)
 
-            query_job = self.__bq_client.query(query)
-            logger.info(f"✅ Consulta BigQuery ejecutada correctamente ")
+            query_job = self.__bq_client.query(query, job_config=job_config)
+            logger.info("✅ Consulta BigQuery ejecutada correctamente ")
             results = list(query_job.result())
         
             return results
 
         except Exception as e:
-            logger.error(f"❌ Error obteniendo empresas no scrapeadas en batch: {e}")
-            # En caso de error, asumir que todas necesitan scraping
-            result = {}
-            return result
+            logger.error("❌ Error obteniendo empresas no scrapeadas en batch: %s", e)
+            raise
+
+
+    def iterar_empresas_no_scrapeadas(self, batch_size: int, table_name: str, page_size: int = 1000, excluded_identifiers: Optional[List[str]] = None, after_identifier: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Igual que obtener_empresas_no_scrapeadas_batch pero sin materializar el resultado:
+        retorna un iterador que descarga las filas página por página (page_size filas),
+        de modo que la memoria no depende de batch_size.
+
+        Los errores de la consulta se lanzan al llamar al método; los de descarga de
+        páginas, al iterar.
+        """
+        query, job_config = self.__query_empresas_no_scrapeadas(batch_size, table_name, excluded_identifiers, after_identifier)
+        query_job = self.__bq_client.query(query, job_config=job_config)
+        rows = query_job.result(page_size=page_size)
+        logger.info("✅ Consulta BigQuery ejecutada correctamente, %s empresas por transmitir", rows.total_rows)
+        # Las Row se serializan tal cual (serialization.dumps): no hace falta copiarlas a dict
+        return iter(rows)
+
+    def __query_empresas_no_scrapeadas(self, batch_size: int, table_name: str, excluded_identifiers: Optional[List[str]] = None, after_identifier: Optional[str] = None):
+        """
+        Arma la consulta de empresas no scrapeadas y sus parámetros.
+        El orden por biz_identifier permite paginar por keyset: el predicado del cursor
+        (biz_identifier > @after_identifier) se resuelve en BigQuery, sin OFFSET.
+        """
+        where_clause = "(contact_found_flg = 0 or contact_found_flg is null) and scrapping_d is null"
+        query_parameters = []
+        if after_identifier is not None:
+            where_clause += " and biz_identifier > @after_identifier"
+            query_parameters.append(bigquery.ScalarQueryParameter("after_identifier", "STRING", after_identifier))
+        if excluded_identifiers:
+            where_clause += " and biz_identifier NOT IN UNNEST(@excluded_identifiers)"
+            query_parameters.append(
+                bigquery.ArrayQueryParameter("excluded_identifiers", "STRING", list(excluded_identifiers))
+            )
 
+        query = f"SELECT biz_identifier, biz_name FROM `{self.__project_id}.{self.__dataset}.{table_name}` WHERE {where_clause} ORDER BY biz_identifier LIMIT {int(batch_size)}"
+        return query, bigquery.QueryJobConfig(query_parameters=query_parameters)
 
     def actualizar_empresas_scrapeadas(self, table_name:str, biz_identifier:str, biz_name:str, contact_found_flg:bool):
         """Actualiza los datos de scraping de una empresa en la tabla de control"""
@@ -147,10 +184,10 @@ class BigQueryService:
             query_job = self.__bq_client.query(query, job_config=job_config)
             query_job.result()  # Esperar a que termine
             
-            logger.info(f"✅ Empresa {biz_name} actualizada en tabla de control")
+            logger.info("✅ Empresa %s actualizada en tabla de control", biz_name)
             
         except Exception as error_message:
-            logger.error(f"❌ Error actualizando empresa scrapeada: {error_message}")
+            logger.error("❌ Error actualizando empresa scrapeada: %s", error_message)
             
             # Manejar específicamente errores de rate limiting (400)
             error_str = str(error_message).lower()
@@ -159,10 +196,67 @@ class BigQueryService:
             else:
                 raise Exception(f"BIGQUERY_ERROR: {error_message}")
 
-    def update_companies_scraped_status(self, table_name:str, companies_status:list[str]):
+    @timed("bigquery")
+    def update_companies_scraped_status(self, table_name:str, companies_status:list[dict]) -> int:
+        """
+        Actualiza en bloque los datos de scraping de varias empresas con un solo MERGE.
+
+        Reemplaza N sentencias UPDATE (una por empresa, limitadas por la cuota de DML
+        concurrente) por una sola sentencia que recibe las actualizaciones como un
+        parámetro ARRAY<STRUCT>. Si una empresa aparece varias veces, gana la última.
+
+        Args:
+            table_name: Tabla de control de empresas
+            companies_status: [{"biz_identifier": str, "biz_name": str, "contact_found_flg": bool}]
+        Returns:
+            Número de filas modificadas
+        """
+        dataset_id = self.__dataset
+        table_id = table_name
+        project_id = self.__project_id
+
+        updates = {}
+        for company in companies_status:
+            updates[(company["biz_identifier"], company["biz_name"])] = company
+        if not updates:
+            return 0
+
+        try:
+            query = f"""
+            MERGE `{project_id}.{dataset_id}.{table_id}` AS target
+            USING UNNEST(@updates) AS source
+            ON target.biz_identifier = source.biz_identifier AND target.biz_name = source.biz_name
+            WHEN MATCHED THEN
+                UPDATE SET scrapping_d = @scraping_d, contact_found_flg = source.contact_found_flg
+            """
+
+            job_config = bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ArrayQueryParameter("updates", "STRUCT", [
+                        bigquery.StructQueryParameter(
+                            None,
+                            bigquery.ScalarQueryParameter("biz_identifier", "STRING", company["biz_identifier"]),
+                            bigquery.ScalarQueryParameter("biz_name", "STRING", company["biz_name"]),
+                            bigquery.ScalarQueryParameter("contact_found_flg", "INT64", int(bool(company.get("contact_found_flg")))),
+                        )
+                        for company in updates.values()
+                    ]),
+                    bigquery.ScalarQueryParameter("scraping_d", "DATE", date.today()),
+                ]
+            )
+
+            query_job = self.__bq_client.query(query, job_config=job_config)
+            query_job.result()  # Esperar a que termine
+
+            affected_rows = query_job.num_dml_affected_rows or 0
+            logger.info("✅ MERGE de %s empresas en tabla de control, filas modificadas: %s", len(updates), affected_rows)
+            return affected_rows
 
-        return None
+        except Exception as error_message:
+            logger.error("❌ Error actualizando empresas scrapeadas en bloque: %s", error_message)
+            raise Exception(f"BIGQUERY_ERROR: {error_message}")
 
+    @timed("bigquery")
     def verify_if_company_was_scraped(self, table_name:str, companies_status:list[dict]) -> list[dict]:
         """Verifica si la empresa fue scrapeada"""
         dataset_id = self.__dataset
@@ -196,44 +290,47 @@ class BigQueryService:
             )
 
             query_job = self.__bq_client.query(query, job_config=job_config)
-            df_results = (query_job.result())
-            
-            results = df_results.to_dict(orient="records")
-            logger.info(f"✅ Empresas verificadas correctamente: {len(results)}")
+            results = [dict(row.items()) for row in query_job.result()]
+            logger.info("✅ Empresas verificadas correctamente: %s", len(results))
             return results
 
         except Exception as error_message:
-            logger.error(f"❌ Error verificando si la empresa fue scrapeada: {error_message}")
+            logger.error("❌ Error verificando si la empresa fue scrapeada: %s", error_message)
             return None
 
-    def verify_if_contacts_was_scraped(self, table_name:str, contacts_urls:list[str]) -> list[str]:
-        """Verifica si los contactos ya fueron scrapeados"""
+    @timed("bigquery")
+    def verify_if_contacts_was_scraped(self, table_name:str, contacts_urls:list[str]) -> Optional[Set[str]]:
+        """
+        Verifica si los contactos ya fueron scrapeados.
+
+        Solo proyecta la columna web_linkedin_url y arma el set directamente desde el
+        iterador de filas (sin DataFrame), para escanear y traer el mínimo de bytes.
+
+        Returns:
+            set con las URLs de LinkedIn que ya existen en la tabla, o None si hubo un error
+        """
         dataset_id = self.__dataset
         table_id = table_name
         project_id = self.__project_id
         
         try:
             if not contacts_urls:
-                return []
+                return set()
 
             query = f"""
-            SELECT * FROM `{project_id}.{dataset_id}.{table_id}` WHERE web_linkedin_url IN UNNEST(@web_linkedin_urls)
+            SELECT DISTINCT web_linkedin_url FROM `{project_id}.{dataset_id}.{table_id}` WHERE web_linkedin_url IN UNNEST(@web_linkedin_urls)
             """
-            logger.info(f"✅ Query: {query}")
 
             job_config = bigquery.QueryJobConfig(
                 query_parameters=[
-                    bigquery.ArrayQueryParameter("web_linkedin_urls", "STRING", contacts_urls)
+                    bigquery.ArrayQueryParameter("web_linkedin_urls", "STRING", list(set(contacts_urls)))
                 ]
             )
-            logger.info(f"✅ Job config: {job_config}")
             query_job = self.__bq_client.query(query, job_config=job_config)
-            df_results = (query_job.result())
-            logger.info(f"✅ Results: {df_results}")
-            results = df_results.to_dataframe()
-            logger.info(f"✅ Results: {results}")
+            results = {row["web_linkedin_url"] for row in query_job.result()}
+            logger.info("✅ Contactos ya scrapeados: %s de %s", len(results), len(contacts_urls))
             return results
 
         except Exception as error_message:
-            logger.error(f"❌ Error verificando si los contactos fueron scrapeados: {error_message}")
-            return None
\ No newline at end of file
+            logger.error("❌ Error verificando si los contactos fueron scrapeados: %s", error_message)
+            return None
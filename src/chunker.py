@@ -0,0 +1,84 @@
+from logging import Logger
+import logging
+from typing import Dict, List, Optional
+
+from serialization import dumps
+
+logger: Logger = logging.getLogger(__name__)
+
+# Límite por request del webhook de Clay (con margen sobre los 100KB)
+MAX_PAYLOAD_BYTES = 90 * 1024
+
+# serialization.dumps es compacto: "," entre elementos de una lista
+LIST_SEPARATOR_BYTES = len(",")
+
+
+def serialized_size(value) -> int:
+    """Bytes que ocupa value serializado tal como se envía a Clay"""
+    return len(dumps(value))
+
+
+class ContactChunker:
+    """
+    Divide contactos en payloads {**base_payload, "contacts": [...]} que no superan
+    max_payload_bytes, en tiempo lineal.
+
+    Cada contacto se serializa una sola vez; el tamaño del payload se lleva como un
+    contador: sobre (con la lista vacía) + tamaño de los contactos + separadores.
+    Los cortes son idénticos a los de serializar el chunk completo en cada paso.
+    """
+
+    def __init__(self, base_payload: Dict, max_payload_bytes: int = MAX_PAYLOAD_BYTES) -> None:
+        self.base_payload = base_payload
+        self.max_payload_bytes = max_payload_bytes
+        self.envelope_bytes = serialized_size({**base_payload, "contacts": []})
+
+    def payload_size(self, contacts_bytes: int, contacts_count: int) -> int:
+        """Tamaño del payload para contactos que suman contacts_bytes"""
+        separators = LIST_SEPARATOR_BYTES * (contacts_count - 1) if contacts_count > 1 else 0
+        return self.envelope_bytes + contacts_bytes + separators
+
+    def contact_sizes(self, contacts: List[Dict]) -> List[int]:
+        return [serialized_size(contact) for contact in contacts]
+
+    def chunk(self, contacts: List[Dict], sizes: Optional[List[int]] = None) -> List[List[Dict]]:
+        """
+        Agrupa los contactos en chunks bajo el límite de bytes.
+
+        Args:
+            contacts: Contactos a agrupar, en orden
+            sizes: Tamaños ya calculados de cada contacto (opcional)
+        Returns:
+            Lista de chunks (listas de contactos)
+        Raises:
+            ValueError: Si el primer contacto por sí solo supera el límite
+        """
+        if sizes is None:
+            sizes = self.contact_sizes(contacts)
+
+        chunks = []
+        current_chunk = []
+        current_bytes = 0
+
+        for contact, size in zip(contacts, sizes):
+            if self.payload_size(current_bytes + size, len(current_chunk) + 1) <= self.max_payload_bytes:
+                current_chunk.append(contact)
+                current_bytes += size
+                continue
+            if not current_chunk:
+                raise ValueError("CONTACT_PAYLOAD_EXCEEDS_100KB_LIMIT")
+
+            chunks.append(current_chunk)
+            current_chunk = [contact]
+            current_bytes = size
+
+        if current_chunk:
+            chunks.append(current_chunk)
+
+        logger.info("✅ %s contactos agrupados en %s chunks", len(contacts), len(chunks))
+        return chunks
+
+
+def chunk_contacts(contacts: List[Dict], base_payload: Dict, max_payload_bytes: int = MAX_PAYLOAD_BYTES) -> List[List[Dict]]:
+    """Atajo para ContactChunker(base_payload, max_payload_bytes).chunk(contacts)"""
+    return ContactChunker(base_payload, max_payload_bytes).chunk(contacts)
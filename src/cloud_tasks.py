@@ -1,23 +1,100 @@
 import datetime
-import json
-from typing import Dict, Optional
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
+from google.api_core.exceptions import AlreadyExists
 from google.cloud import tasks_v2
 from google.protobuf import duration_pb2, timestamp_pb2
+from metrics import timed
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+
+def task_id_for(url: str, json_payload: Dict) -> str:
+    """Deterministic task ID: sha256 of the target URL and the canonical JSON payload.
+
+    The same chunk sent to the same webhook always maps to the same task name, so
+    Cloud Tasks rejects a re-submission with ALREADY_EXISTS. The hex digest also
+    spreads names evenly, which Cloud Tasks recommends over sequential IDs.
+    """
+    canonical = dumps(json_payload, sort_keys=True)
+    digest = hashlib.sha256(url.encode("utf-8") + b"\n" + canonical).hexdigest()
+    return f"chunk-{digest}"
+
+
+class RecentTaskCache:
+    """Thread-safe TTL cache of task IDs created (or found existing) recently."""
+
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 100000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._expires_at: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, task_id: str) -> bool:
+        with self._lock:
+            expires_at = self._expires_at.get(task_id)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._expires_at[task_id]
+                return False
+            return True
+
+    def add(self, task_id: str) -> None:
+        with self._lock:
+            self._expires_at[task_id] = time.monotonic() + self.ttl_seconds
+            self._expires_at.move_to_end(task_id)
+            while len(self._expires_at) > self.max_entries:
+                self._expires_at.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._expires_at)
+
 
 class CloudTasks:
 
-    def __init__(self, project: str, location: str, queue: str):
+    def __init__(
+        self,
+        project: str,
+        location: str,
+        queue: str,
+        max_concurrency: int = 8,
+        dedup_ttl_seconds: float = 3600,
+        dedup_max_entries: int = 100000,
+    ):
         self.project = project
         self.location = location
         self.queue = queue
+        self.max_concurrency = max_concurrency
+        self.recent_tasks = RecentTaskCache(dedup_ttl_seconds, dedup_max_entries)
         self.client = tasks_v2.CloudTasksClient()
+        # Shared by every request, so max_concurrency caps in-flight RPCs per process.
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="cloud-tasks")
+
+    task_id_for = staticmethod(task_id_for)
+
+    def close(self) -> None:
+        """Stop accepting bulk dispatches; tasks already submitted still finish."""
+        self.executor.shutdown(wait=False)
+
+    def was_recently_created(self, task_id: str) -> bool:
+        """True if this process created (or saw ALREADY_EXISTS for) task_id within the TTL."""
+        return task_id in self.recent_tasks
 
+    @timed("cloud_tasks")
     def create_http_task(
         self,
         url: str,
         json_payload: Dict,
-        scheduled_seconds_from_now: Optional[int] = None,
+        scheduled_seconds_from_now: Optional[float] = None,
         task_id: Optional[str] = None,
         deadline_in_seconds: Optional[int] = None,
         headers: Optional[Dict] = None,
@@ -36,8 +113,8 @@ class CloudTasks:
         location = self.location
         queue = self.queue
 
-        # Create a client.
-        client = tasks_v2.CloudTasksClient()
+        # Reuse the client (and its gRPC channel) created in __init__.
+        client = self.client
 
         # Construct the task.
         task = tasks_v2.Task(
@@ -45,7 +122,7 @@ class CloudTasks:
                 http_method=tasks_v2.HttpMethod.POST,
                 url=url,
                 headers=headers,
-                body=json.dumps(json_payload).encode(),
+                body=dumps(json_payload),
             ),
             name=(
                 client.task_path(project, location, queue, task_id)
@@ -78,3 +155,68 @@ class CloudTasks:
                 task=task,
             )
         )
+
+    @timed("cloud_tasks")
+    def create_http_tasks_bulk(
+        self,
+        url: str,
+        json_payloads: List[Dict],
+        headers: Optional[Dict] = None,
+        deadline_in_seconds: Optional[int] = None,
+        task_ids: Optional[List[str]] = None,
+        scheduled_seconds: Optional[List[float]] = None,
+    ) -> List[Dict]:
+        """Create one HTTP POST task per payload, dispatching them concurrently.
+
+        Tasks run on the instance's executor, shared with every other request in
+        this process, so at most max_concurrency CreateTask RPCs are in flight.
+
+        Every task gets a deterministic name (task_id_for), so a retried request
+        does not create the same task twice: payloads whose task was created
+        recently by this process are skipped without an RPC, and ALREADY_EXISTS
+        from the server counts as success. Both are reported with duplicate=True.
+        Args:
+            url: The target URL of every task.
+            json_payloads: The JSON payloads to send, one task each.
+            headers: Headers shared by every task.
+            deadline_in_seconds: The deadline in seconds for each task.
+            task_ids: Precomputed task IDs, one per payload (defaults to task_id_for).
+            scheduled_seconds: Seconds from now to schedule each task for, one per
+                payload (see DispatchScheduler); None creates them all immediately.
+        Returns:
+            One result per payload, in the same order:
+            {"index": int, "success": bool, "duplicate": bool, "task_name": str | None, "error": str | None}
+        """
+        if not json_payloads:
+            return []
+
+        if task_ids is None:
+            task_ids = [task_id_for(url, json_payload) for json_payload in json_payloads]
+
+        if scheduled_seconds is None:
+            scheduled_seconds = [None] * len(json_payloads)
+
+        def dispatch(index: int, json_payload: Dict, task_id: str, scheduled_seconds_from_now: Optional[float]) -> Dict:
+            if task_id in self.recent_tasks:
+                return {"index": index, "success": True, "duplicate": True, "task_name": task_id, "error": None}
+            try:
+                task = self.create_http_task(
+                    url=url,
+                    json_payload=json_payload,
+                    scheduled_seconds_from_now=scheduled_seconds_from_now,
+                    task_id=task_id,
+                    headers=headers,
+                    deadline_in_seconds=deadline_in_seconds,
+                )
+                self.recent_tasks.add(task_id)
+                return {"index": index, "success": True, "duplicate": False, "task_name": task.name, "error": None}
+            except AlreadyExists:
+                self.recent_tasks.add(task_id)
+                logger.info("La tarea %s ya existía, se omite", task_id)
+                return {"index": index, "success": True, "duplicate": True, "task_name": task_id, "error": None}
+            except Exception as error:
+                logger.error("❌ Error creando la tarea %s: %s", index, error)
+                return {"index": index, "success": False, "duplicate": False, "task_name": None, "error": str(error)}
+
+        # The CloudTasksClient is thread-safe, so every worker shares its channel.
+        return list(self.executor.map(dispatch, range(len(json_payloads)), json_payloads, task_ids, scheduled_seconds))
@@ -0,0 +1,242 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from logging import Logger
+import logging
+from typing import Dict, List, Optional, Set
+
+from google.cloud import firestore
+
+logger: Logger = logging.getLogger(__name__)
+
+# Firestore permite como máximo 500 escrituras por transacción
+FIRESTORE_MAX_WRITES = 500
+
+
+class CompanyLeaseStore(ABC):
+    """
+    Reservas (leases) de empresas por scraper: cada empresa la procesa un solo worker
+    hasta que la libera, la renueva o expira el TTL. Un lease expirado vuelve al pool.
+
+    Al terminar, el lease se marca como completado (complete) en lugar de liberarse:
+    el estado de scraping llega a BigQuery con retraso (CDC de Pub/Sub o MERGE
+    acumulado) y, mientras tanto, la empresa debe seguir excluida de otros scrapers.
+    """
+
+    purge_interval_seconds = 300
+
+    def __init__(self) -> None:
+        self._last_purge = 0.0
+
+    @abstractmethod
+    def claim(self, worker_id: str, biz_identifiers: List[str], ttl_seconds: int) -> List[str]:
+        """Reserva atómicamente las empresas libres (o expiradas) y retorna las reservadas"""
+
+    @abstractmethod
+    def renew(self, biz_identifier: str, worker_id: str, ttl_seconds: int) -> bool:
+        """Extiende el lease si pertenece a worker_id, no expiró y no está completado"""
+
+    @abstractmethod
+    def complete(self, biz_identifier: str, worker_id: str, ttl_seconds: int) -> bool:
+        """
+        Marca el lease como completado y lo mantiene ttl_seconds más, para que la
+        empresa siga excluida hasta que su estado llegue a BigQuery. False si otro
+        worker tiene un lease vigente sobre la empresa.
+        """
+
+    @abstractmethod
+    def release(self, biz_identifier: str, worker_id: Optional[str] = None) -> bool:
+        """Libera el lease (si se indica worker_id, solo si le pertenece)"""
+
+    @abstractmethod
+    def active_identifiers(self) -> Set[str]:
+        """biz_identifiers con un lease vigente (incluidos los completados)"""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Elimina los leases expirados; retorna cuántos se eliminaron"""
+
+    def maybe_purge_expired(self) -> None:
+        """Purga como máximo una vez cada purge_interval_seconds"""
+        now = time.monotonic()
+        if now - self._last_purge < self.purge_interval_seconds:
+            return
+        self._last_purge = now
+        try:
+            purged = self.purge_expired()
+            if purged:
+                logger.info("✅ Leases expirados devueltos al pool: %s", purged)
+        except Exception as error:
+            logger.error("❌ Error purgando leases expirados: %s", error)
+
+
+class InMemoryLeaseStore(CompanyLeaseStore):
+    """Leases en memoria del proceso: para pruebas locales o un único worker"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._leases: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, worker_id: str, biz_identifiers: List[str], ttl_seconds: int) -> List[str]:
+        now = time.time()
+        claimed = []
+        with self._lock:
+            for biz_identifier in biz_identifiers:
+                lease = self._leases.get(biz_identifier)
+                if lease and lease["expires_at"] > now and (lease["worker_id"] != worker_id or lease.get("done")):
+                    continue
+                self._leases[biz_identifier] = {"worker_id": worker_id, "expires_at": now + ttl_seconds}
+                claimed.append(biz_identifier)
+        return claimed
+
+    def renew(self, biz_identifier: str, worker_id: str, ttl_seconds: int) -> bool:
+        now = time.time()
+        with self._lock:
+            lease = self._leases.get(biz_identifier)
+            if not lease or lease["worker_id"] != worker_id or lease["expires_at"] <= now or lease.get("done"):
+                return False
+            lease["expires_at"] = now + ttl_seconds
+            return True
+
+    def complete(self, biz_identifier: str, worker_id: str, ttl_seconds: int) -> bool:
+        now = time.time()
+        with self._lock:
+            lease = self._leases.get(biz_identifier)
+            if lease and lease["expires_at"] > now and lease["worker_id"] != worker_id:
+                return False
+            self._leases[biz_identifier] = {"worker_id": worker_id, "expires_at": now + ttl_seconds, "done": True}
+            return True
+
+    def release(self, biz_identifier: str, worker_id: Optional[str] = None) -> bool:
+        with self._lock:
+            lease = self._leases.get(biz_identifier)
+            if not lease or (worker_id is not None and lease["worker_id"] != worker_id):
+                return False
+            del self._leases[biz_identifier]
+            return True
+
+    def active_identifiers(self) -> Set[str]:
+        now = time.time()
+        with self._lock:
+            return {key for key, lease in self._leases.items() if lease["expires_at"] > now}
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, lease in self._leases.items() if lease["expires_at"] <= now]
+            for key in expired:
+                del self._leases[key]
+        return len(expired)
+
+
+class FirestoreLeaseStore(CompanyLeaseStore):
+    """
+    Leases compartidos entre instancias en una colección de Firestore: un documento
+    por biz_identifier con worker_id y expires_at (se puede configurar una política
+    TTL de Firestore sobre expires_at para borrar los expirados automáticamente).
+    """
+
+    def __init__(self, db: firestore.Client, collection: str) -> None:
+        super().__init__()
+        self.db = db
+        self.collection = collection
+
+    def claim(self, worker_id: str, biz_identifiers: List[str], ttl_seconds: int) -> List[str]:
+        collection = self.db.collection(self.collection)
+
+        @firestore.transactional
+        def claim_in_transaction(transaction, references):
+            now = datetime.now(timezone.utc)
+            expires_at = now + timedelta(seconds=ttl_seconds)
+            claimed = []
+            for snapshot in transaction.get_all(references):
+                lease = snapshot.to_dict() if snapshot.exists else None
+                if lease and lease["expires_at"] > now and (lease["worker_id"] != worker_id or lease.get("done")):
+                    continue
+                transaction.set(snapshot.reference, {"worker_id": worker_id, "expires_at": expires_at})
+                claimed.append(snapshot.id)
+            return claimed
+
+        claimed = []
+        for start in range(0, len(biz_identifiers), FIRESTORE_MAX_WRITES):
+            references = [
+                collection.document(biz_identifier)
+                for biz_identifier in biz_identifiers[start:start + FIRESTORE_MAX_WRITES]
+            ]
+            claimed.extend(claim_in_transaction(self.db.transaction(), references))
+        return claimed
+
+    def renew(self, biz_identifier: str, worker_id: str, ttl_seconds: int) -> bool:
+        reference = self.db.collection(self.collection).document(biz_identifier)
+
+        @firestore.transactional
+        def renew_in_transaction(transaction):
+            now = datetime.now(timezone.utc)
+            snapshot = reference.get(transaction=transaction)
+            lease = snapshot.to_dict() if snapshot.exists else None
+            if not lease or lease["worker_id"] != worker_id or lease["expires_at"] <= now or lease.get("done"):
+                return False
+            transaction.update(reference, {"expires_at": now + timedelta(seconds=ttl_seconds)})
+            return True
+
+        return renew_in_transaction(self.db.transaction())
+
+    def complete(self, biz_identifier: str, worker_id: str, ttl_seconds: int) -> bool:
+        reference = self.db.collection(self.collection).document(biz_identifier)
+
+        @firestore.transactional
+        def complete_in_transaction(transaction):
+            now = datetime.now(timezone.utc)
+            snapshot = reference.get(transaction=transaction)
+            lease = snapshot.to_dict() if snapshot.exists else None
+            if lease and lease["expires_at"] > now and lease["worker_id"] != worker_id:
+                return False
+            transaction.set(reference, {
+                "worker_id": worker_id,
+                "expires_at": now + timedelta(seconds=ttl_seconds),
+                "done": True,
+            })
+            return True
+
+        return complete_in_transaction(self.db.transaction())
+
+    def release(self, biz_identifier: str, worker_id: Optional[str] = None) -> bool:
+        reference = self.db.collection(self.collection).document(biz_identifier)
+
+        @firestore.transactional
+        def release_in_transaction(transaction):
+            snapshot = reference.get(transaction=transaction)
+            lease = snapshot.to_dict() if snapshot.exists else None
+            if not lease or (worker_id is not None and lease["worker_id"] != worker_id):
+                return False
+            transaction.delete(reference)
+            return True
+
+        return release_in_transaction(self.db.transaction())
+
+    def active_identifiers(self) -> Set[str]:
+        now = datetime.now(timezone.utc)
+        query = self.db.collection(self.collection).where(
+            filter=firestore.FieldFilter("expires_at", ">", now)
+        ).select([])
+        return {snapshot.id for snapshot in query.stream()}
+
+    def purge_expired(self) -> int:
+        now = datetime.now(timezone.utc)
+        query = self.db.collection(self.collection).where(
+            filter=firestore.FieldFilter("expires_at", "<=", now)
+        ).select([])
+        purged = 0
+        batch = self.db.batch()
+        for snapshot in query.stream():
+            # Precondición: no borrar un lease que otro worker reclamó después de la consulta
+            batch.delete(snapshot.reference, option=self.db.write_option(last_update_time=snapshot.update_time))
+            purged += 1
+            if purged % FIRESTORE_MAX_WRITES == 0:
+                batch.commit()
+                batch = self.db.batch()
+        if purged % FIRESTORE_MAX_WRITES:
+            batch.commit()
+        return purged
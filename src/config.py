@@ -6,7 +6,6 @@ Maneja variables de entorno y configuraciones del proyecto
 import os
 from dotenv import load_dotenv
 import json
-from secret_manager import SecretManager
 # Cargar variables de entorno desde .env
 load_dotenv()
 
@@ -20,12 +19,35 @@ class Config:
     BIGQUERY_DATASET = os.getenv('BIGQUERY_DATASET', 'raw_in_scrapper')
     SOURCE_TABLE_NAME = os.getenv('GOOGLE_BIGQUERY_TABLE','clay_scraped_companies')
     DESTINATION_TABLE_NAME = os.getenv("GOOGLE_BIGQUERY_TABLE_DESTINATION","clay_contacts_info")
+    # Actualización de estado de empresas: "pubsub" (un mensaje por empresa) o "merge" (MERGE en bloque)
+    COMPANY_STATUS_UPDATE_MODE = os.getenv('COMPANY_STATUS_UPDATE_MODE', 'pubsub')
+    COMPANY_STATUS_FLUSH_SIZE = int(os.getenv('COMPANY_STATUS_FLUSH_SIZE', '1000'))  # Empresas por MERGE
+    COMPANY_STATUS_FLUSH_SECONDS = float(os.getenv('COMPANY_STATUS_FLUSH_SECONDS', '30'))  # Espera máxima antes del MERGE
+    COMPANY_STATUS_MAX_PENDING = int(os.getenv('COMPANY_STATUS_MAX_PENDING', '10000'))  # Sin escribir antes de responder 503
+    COMPANIES_STREAM_PAGE_SIZE = int(os.getenv('COMPANIES_STREAM_PAGE_SIZE', '1000'))  # Filas por página en modo NDJSON
     # Configuración Pub/Sub
     PUBSUB_TOPIC_CONTACTS = os.getenv('PUBSUB_TOPIC_CONTACTS', 'enriched_contacts')
     PUBSUB_TOPIC_COMPANIES = os.getenv('PUBSUB_TOPIC_COMPANIES', 'scraped_companies')
+    PUBSUB_BATCH_MAX_MESSAGES = int(os.getenv('PUBSUB_BATCH_MAX_MESSAGES', '100'))
+    PUBSUB_BATCH_MAX_BYTES = int(os.getenv('PUBSUB_BATCH_MAX_BYTES', str(1024 * 1024)))
+    PUBSUB_BATCH_MAX_LATENCY = float(os.getenv('PUBSUB_BATCH_MAX_LATENCY', '0.05'))  # Segundos
+    PUBSUB_PUBLISH_TIMEOUT = float(os.getenv('PUBSUB_PUBLISH_TIMEOUT', '30'))  # Segundos por confirmación
+    PUBSUB_FLOW_CONTROL_MAX_MESSAGES = int(os.getenv('PUBSUB_FLOW_CONTROL_MAX_MESSAGES', '1000'))  # Mensajes sin confirmar
+    PUBSUB_FLOW_CONTROL_MAX_BYTES = int(os.getenv('PUBSUB_FLOW_CONTROL_MAX_BYTES', str(10 * 1024 * 1024)))
+    PUBSUB_FLOW_CONTROL_BEHAVIOR = os.getenv('PUBSUB_FLOW_CONTROL_BEHAVIOR', 'block')  # block | error | ignore
+    CONTACTS_BATCH_MAX_ITEMS = int(os.getenv('CONTACTS_BATCH_MAX_ITEMS', '5000'))
     # Configuración Cloud Tasks
     CLOUD_TASKS_QUEUE = os.getenv('CLOUD_TASKS_QUEUE', 'waterfall-enrichment-queue')
     CLOUD_TASKS_LOCATION = os.getenv('CLOUD_TASKS_LOCATION', 'us-central1')
+    CLOUD_TASKS_MAX_CONCURRENCY = int(os.getenv('CLOUD_TASKS_MAX_CONCURRENCY', '8'))  # Tareas creadas en paralelo por worker (executor compartido)
+    CLOUD_TASKS_DEDUP_TTL_SECONDS = float(os.getenv('CLOUD_TASKS_DEDUP_TTL_SECONDS', '3600'))  # Recuerda las tareas creadas para omitir reintentos sin RPC
+    CLOUD_TASKS_DEDUP_MAX_ENTRIES = int(os.getenv('CLOUD_TASKS_DEDUP_MAX_ENTRIES', '100000'))
+
+    # Ritmo de despacho a Clay: chunks por segundo por webhook (0 = sin límite, todo se crea de inmediato)
+    DISPATCH_RATE_CHUNKS_PER_SECOND = float(os.getenv('DISPATCH_RATE_CHUNKS_PER_SECOND', '0'))
+    DISPATCH_WEBHOOK_RATES = json.loads(os.getenv('DISPATCH_WEBHOOK_RATES', '{}'))  # {"https://api.clay.com/...": 2.5}
+    DISPATCH_SCHEDULER_BACKEND = os.getenv('DISPATCH_SCHEDULER_BACKEND', 'memory')  # memory | firestore (compartido entre instancias)
+    DISPATCH_SCHEDULER_COLLECTION = os.getenv('DISPATCH_SCHEDULER_COLLECTION', 'dispatch_watermarks')
     CLOUD_TASKS_URL = os.getenv('CLOUD_TASKS_URL', 'https://api.clay.com/v3/sources/webhook/pull-in-data-from-a-webhook-6b71c86f-e6b9-47bb-a355-9d38c07488fe')
 
     """Clase de configuración para el Waterfall Enrichment"""
@@ -39,12 +61,28 @@ class Config:
     CLAY_WEBHOOK_HEADER = os.getenv('CLAY_WEBHOOK_HEADER', 'x-clay-webhook-auth')
     CLAY_LIMITS = os.getenv('CLAY_LIMITS', '50000')
     CLAY_LIMIT_ADVERTISING = os.getenv('CLAY_LIMIT_ADVERTISING', '40000')
+    # Lease local de bloques de cuota (evita ir a Firestore en cada enriquecimiento)
+    QUOTA_LEASE_ENABLED = os.getenv('QUOTA_LEASE_ENABLED', 'False').lower() == 'true'
+    QUOTA_LEASE_BLOCK_SIZE = int(os.getenv('QUOTA_LEASE_BLOCK_SIZE', '50'))  # Unidades por bloque
+    QUOTA_LEASE_TTL_SECONDS = float(os.getenv('QUOTA_LEASE_TTL_SECONDS', '300'))
+    QUOTA_LEASE_HEADROOM_FRACTION = float(os.getenv('QUOTA_LEASE_HEADROOM_FRACTION', '0.1'))  # Máx. fracción del margen por bloque
 
     #Configuración de Firebase
     FIREBASE_PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID', 'qa-cdp-mx')
     # Para bases de datos específicas, usa el nombre. Para la base de datos por defecto, usa '(default)'
     FIREBASE_DATABASE = os.getenv('FIREBASE_DATABASE', 'leads')
     FIREBASE_COLLECTION = os.getenv('FIREBASE_COLLECTION', 'enrichment')
+    # Shards por contador (0 o 1 = un solo documento). Migrar con POST /admin/counters/migrate.
+    # Requiere QUOTA_LEASE_ENABLED (Config.validate): la reserva transaccional lee todos los
+    # shards y solo escala si va a Firestore una vez por bloque de cuota y no una vez por request
+    FIREBASE_COUNTER_SHARDS = int(os.getenv('FIREBASE_COUNTER_SHARDS', '0'))
+
+    # Leases de empresas para scrapers en paralelo (GET /companies?worker_id=...)
+    COMPANY_LEASE_BACKEND = os.getenv('COMPANY_LEASE_BACKEND', 'firestore')  # firestore | memory
+    COMPANY_LEASE_COLLECTION = os.getenv('COMPANY_LEASE_COLLECTION', 'company_leases')
+    COMPANY_LEASE_TTL_SECONDS = int(os.getenv('COMPANY_LEASE_TTL_SECONDS', '900'))  # 15 minutos
+    COMPANY_LEASE_OVERFETCH_FACTOR = int(os.getenv('COMPANY_LEASE_OVERFETCH_FACTOR', '3'))  # Filas pedidas por empresa a reservar
+    COMPANY_LEASE_MAX_ROUNDS = int(os.getenv('COMPANY_LEASE_MAX_ROUNDS', '5'))  # Consultas a BigQuery por request para llenar el lote
 
 
     FIREBASE_DOCUMENT_REQUEST_IMPORT = os.getenv('FIREBASE_DOCUMENT_REQUEST_IMPORT', 'requests_webhook_import')
@@ -54,6 +92,9 @@ class Config:
 
     SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN', '')
     SLACK_CHANNEL = os.getenv('SLACK_CHANNEL', 'avisos-enrichment')
+    SLACK_QUEUE_SIZE = int(os.getenv('SLACK_QUEUE_SIZE', '100'))  # Mensajes pendientes antes de descartar
+    SLACK_COALESCE_SECONDS = float(os.getenv('SLACK_COALESCE_SECONDS', '300'))  # Ventana para agrupar alertas iguales
+    SLACK_SUMMARY_SECONDS = float(os.getenv('SLACK_SUMMARY_SECONDS', '60'))  # Intervalo del resumen de enriquecimientos
 
     # Configuración Flask
     FLASK_HOST = os.getenv('FLASK_HOST', '0.0.0.0')
@@ -62,6 +103,44 @@ class Config:
     
     # Timeout para requests
     REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', '300'))  # 5 minutos
+
+    # Pipeline de /contacts/enrichment: hilos compartidos y timeout por etapa (segundos)
+    ENRICHMENT_PIPELINE_WORKERS = int(os.getenv('ENRICHMENT_PIPELINE_WORKERS', '16'))
+    ENRICHMENT_LOOKUP_TIMEOUT = float(os.getenv('ENRICHMENT_LOOKUP_TIMEOUT', '20'))
+    ENRICHMENT_ENCODE_TIMEOUT = float(os.getenv('ENRICHMENT_ENCODE_TIMEOUT', '10'))
+    ENRICHMENT_QUOTA_TIMEOUT = float(os.getenv('ENRICHMENT_QUOTA_TIMEOUT', '10'))
+    ENRICHMENT_DISPATCH_TIMEOUT = float(os.getenv('ENRICHMENT_DISPATCH_TIMEOUT', '60'))
+
+    # Modo acumulador: contactos de varios requests se despachan juntos en chunks llenos
+    ENRICHMENT_BATCHING_DEFAULT = os.getenv('ENRICHMENT_BATCHING_DEFAULT', 'False').lower() == 'true'  # Sin ?batch= en el request
+    ENRICHMENT_BATCH_MAX_DELAY_SECONDS = float(os.getenv('ENRICHMENT_BATCH_MAX_DELAY_SECONDS', '5'))  # Espera máxima de un contacto
+    ENRICHMENT_BATCH_MAX_CONTACTS = int(os.getenv('ENRICHMENT_BATCH_MAX_CONTACTS', '50000'))  # Contactos en espera por worker
+    ENRICHMENT_BATCH_TTL_SECONDS = float(os.getenv('ENRICHMENT_BATCH_TTL_SECONDS', '3600'))  # Tiempo que se conserva el estado de un lote
+    ENRICHMENT_BATCH_STATUS_BACKEND = os.getenv('ENRICHMENT_BATCH_STATUS_BACKEND', 'firestore')  # firestore | memory
+    ENRICHMENT_BATCH_STATUS_COLLECTION = os.getenv('ENRICHMENT_BATCH_STATUS_COLLECTION', 'enrichment_batches')
+
+    # Servidor WSGI (gunicorn.conf.py). En Cloud Run: --concurrency = WORKERS * THREADS
+    GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', os.getenv('MAX_WORKERS', '1')))
+    GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '8'))
+    # Cloud Run envía SIGKILL 10s después de SIGTERM: requests en curso + vaciado deben caber en ese margen
+    CLOUD_RUN_TERMINATION_SECONDS = int(os.getenv('CLOUD_RUN_TERMINATION_SECONDS', '10'))
+    # 0 = derivado en gunicorn.conf.py del request más largo, acotado por CLOUD_RUN_TERMINATION_SECONDS - 1
+    GUNICORN_GRACEFUL_TIMEOUT = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '0'))
+    WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'True').lower() == 'true'  # Crear los clientes al arrancar cada worker
+    SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '5'))  # Segundos en total para vaciar pendientes al cerrar
+
+    # Logging: JSON de una línea por registro, escrito desde un hilo aparte (QueueListener)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # json | text
+    LOG_MAX_FIELD_CHARS = int(os.getenv('LOG_MAX_FIELD_CHARS', '2000'))  # Strings más largos se truncan
+    LOG_MAX_ITEMS = int(os.getenv('LOG_MAX_ITEMS', '50'))  # Listas/dicts más grandes se resumen como "<list de N elementos>"
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # Registros en cola; si se llena se descartan
+    LOG_DEBUG_SAMPLING = os.getenv('LOG_DEBUG_SAMPLING', '')  # "main=0.01,enrichment_pipeline=0.1"
+
+    # Profiling de requests: header X-Profile o ?profile=1 (con API key), o una fracción al azar
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # 0.01 = 1% de los requests
+    PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', '30'))  # Funciones por reporte
+    PROFILE_MAX_REPORTS = int(os.getenv('PROFILE_MAX_REPORTS', '50'))  # Reportes guardados en memoria por worker
     
     # Configuración de reintentos y timeouts
     MAX_RETRIES = int(os.getenv('MAX_RETRIES', '3'))  # Número máximo de reintentos
@@ -96,5 +175,10 @@ class Config:
         
         if missing_vars:
             raise ValueError(f"Faltan las siguientes variables de entorno: {', '.join(missing_vars)}")
+
+        if cls.FIREBASE_COUNTER_SHARDS > 1 and not cls.QUOTA_LEASE_ENABLED:
+            # Sin lease cada request hace la transacción de reserva, que lee todos los shards:
+            # las reservas concurrentes compiten igual que con un solo documento
+            raise ValueError("FIREBASE_COUNTER_SHARDS > 1 requiere QUOTA_LEASE_ENABLED=true")
         
         return True 
\ No newline at end of file
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+import time
+import uuid
+from dataclasses import dataclass
+from logging import Logger
+import logging
+from typing import Dict, List, Optional
+
+from google.cloud import firestore
+
+logger: Logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SlotReservation:
+    """Resultado de DispatchScheduler.reserve_slots"""
+    webhook_url: str
+    # Inicio del primer slot (epoch en segundos) y separación entre slots
+    start: float
+    interval: float
+    # Segundos desde ahora para programar cada tarea, en orden de chunk
+    delays: List[float]
+    # Identifica la reserva que movió la marca por última vez (ver release_slots)
+    reservation_id: str
+
+    @property
+    def end(self) -> float:
+        """Marca del webhook tras la reserva"""
+        return self.start + len(self.delays) * self.interval
+
+
+class DispatchScheduler(ABC):
+    """
+    Reparte en el tiempo las tareas hacia cada webhook de Clay según un ritmo máximo
+    (chunks por segundo), para que una lista grande no llegue de golpe.
+
+    Por webhook se guarda una marca de "próximo slot libre" compartida entre requests:
+    cada request reserva N slots consecutivos a partir de max(ahora, marca) y mueve la
+    marca al final. Con un backlog sostenido las tareas se programan a ritmo constante
+    (schedule_time de Cloud Tasks) en vez de en ráfagas.
+
+    Los slots finales que no se usaron (chunks duplicados o que fallaron) se devuelven
+    con release_slots, siempre que ningún otro request haya reservado después.
+    """
+
+    def __init__(self, chunks_per_second: float, webhook_rates: Optional[Dict[str, float]] = None) -> None:
+        self.chunks_per_second = chunks_per_second
+        # Ritmo propio por URL de webhook; el resto usa chunks_per_second
+        self.webhook_rates = webhook_rates or {}
+
+    def rate_for(self, webhook_url: str) -> float:
+        return self.webhook_rates.get(webhook_url, self.chunks_per_second)
+
+    def reserve_slots(self, webhook_url: str, count: int) -> Optional[SlotReservation]:
+        """
+        Reserva count slots consecutivos para el webhook.
+
+        Returns:
+            SlotReservation con los segundos desde ahora para programar cada tarea, o
+            None si el webhook no tiene límite de ritmo (las tareas se crean sin
+            schedule_time)
+        """
+        rate = self.rate_for(webhook_url)
+        if rate <= 0 or count <= 0:
+            return None
+        interval = 1.0 / rate
+        now = time.time()
+        reservation_id = uuid.uuid4().hex
+        start = self._advance(webhook_url, now, count * interval, reservation_id)
+        delays = [max(0.0, start + index * interval - now) for index in range(count)]
+        if delays[-1] > 60:
+            logger.info("Backlog del webhook: %s chunks programados hasta dentro de %.0fs", count, delays[-1])
+        return SlotReservation(webhook_url, start, interval, delays, reservation_id)
+
+    def release_slots(self, reservation: SlotReservation, unused: int) -> bool:
+        """
+        Devuelve los últimos unused slots de la reserva. Solo se puede si esta fue la
+        última reserva del webhook: si otro request reservó después, devolverlos dejaría
+        un hueco que se llenaría encima de sus slots. Se compara el id de la reserva y no
+        el valor de la marca, que otra reserva puede volver a dejar igual.
+
+        Returns:
+            True si se movió la marca
+        """
+        unused = min(unused, len(reservation.delays))
+        if unused <= 0:
+            return False
+        released = self._rollback(
+            reservation.webhook_url, reservation.reservation_id, reservation.end - unused * reservation.interval
+        )
+        if released:
+            logger.info("Devueltos %s slots sin usar del webhook", unused)
+        return released
+
+    @abstractmethod
+    def _advance(self, webhook_url: str, now: float, duration: float, reservation_id: str) -> float:
+        """
+        Mueve la marca del webhook duration segundos, la asocia a reservation_id y
+        retorna el inicio del tramo reservado
+        """
+
+    @abstractmethod
+    def _rollback(self, webhook_url: str, reservation_id: str, watermark: float) -> bool:
+        """Mueve la marca a watermark solo si la última reserva es reservation_id (una sola vez)"""
+
+
+class InMemoryDispatchScheduler(DispatchScheduler):
+    """Marcas por proceso: suficiente con una instancia (o un ritmo repartido entre ellas)"""
+
+    def __init__(self, chunks_per_second: float, webhook_rates: Optional[Dict[str, float]] = None) -> None:
+        super().__init__(chunks_per_second, webhook_rates)
+        self._next_free: Dict[str, float] = {}
+        self._last_reservation: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def _advance(self, webhook_url: str, now: float, duration: float, reservation_id: str) -> float:
+        with self._lock:
+            start = max(now, self._next_free.get(webhook_url, 0.0))
+            self._next_free[webhook_url] = start + duration
+            self._last_reservation[webhook_url] = reservation_id
+            return start
+
+    def _rollback(self, webhook_url: str, reservation_id: str, watermark: float) -> bool:
+        with self._lock:
+            if self._last_reservation.get(webhook_url) != reservation_id:
+                return False
+            self._next_free[webhook_url] = watermark
+            self._last_reservation[webhook_url] = None
+            return True
+
+
+class FirestoreDispatchScheduler(DispatchScheduler):
+    """
+    Marcas compartidas entre instancias: un documento por webhook con next_free_at
+    (epoch en segundos), actualizado en una transacción por request.
+    """
+
+    def __init__(self, db: firestore.Client, collection: str, chunks_per_second: float, webhook_rates: Optional[Dict[str, float]] = None) -> None:
+        super().__init__(chunks_per_second, webhook_rates)
+        self.db = db
+        self.collection = collection
+
+    def _reference(self, webhook_url: str):
+        # La URL tiene "/": el id del documento es un hash, la URL queda como campo
+        document_id = hashlib.sha256(webhook_url.encode("utf-8")).hexdigest()[:32]
+        return self.db.collection(self.collection).document(document_id)
+
+    def _advance(self, webhook_url: str, now: float, duration: float, reservation_id: str) -> float:
+        reference = self._reference(webhook_url)
+
+        @firestore.transactional
+        def advance_in_transaction(transaction) -> float:
+            snapshot = reference.get(transaction=transaction)
+            watermark = (snapshot.to_dict() or {}).get("next_free_at", 0.0) if snapshot.exists else 0.0
+            start = max(now, watermark)
+            transaction.set(reference, {
+                "webhook_url": webhook_url,
+                "next_free_at": start + duration,
+                "reservation_id": reservation_id,
+            })
+            return start
+
+        return advance_in_transaction(self.db.transaction())
+
+    def _rollback(self, webhook_url: str, reservation_id: str, watermark: float) -> bool:
+        reference = self._reference(webhook_url)
+
+        @firestore.transactional
+        def rollback_in_transaction(transaction) -> bool:
+            snapshot = reference.get(transaction=transaction)
+            if not snapshot.exists or (snapshot.to_dict() or {}).get("reservation_id") != reservation_id:
+                return False
+            transaction.update(reference, {"next_free_at": watermark, "reservation_id": None})
+            return True
+
+        return rollback_in_transaction(self.db.transaction())
@@ -0,0 +1,399 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from logging import Logger
+import logging
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from chunker import ContactChunker
+from enrichment_pipeline import EnrichmentStageTimeout
+from metrics import ENRICHMENT_BATCHER_FLUSHES, ENRICHMENT_CHUNKS
+from serialization import dumps
+
+if TYPE_CHECKING:
+    # batch_status importa google.cloud.firestore: main.py importa este módulo al arrancar
+    from batch_status import BatchStatusStore
+
+logger: Logger = logging.getLogger(__name__)
+
+
+class EnrichmentBatcherFullError(Exception):
+    """El acumulador ya tiene el máximo de contactos en espera"""
+
+
+class _PayloadBuffer:
+    """Contactos en espera para un mismo base_payload, en orden de llegada"""
+
+    def __init__(self, chunker: ContactChunker) -> None:
+        self.chunker = chunker
+        # (contacto, tamaño serializado, batch_id, instante de llegada en time.monotonic())
+        self.entries: List[Tuple[Dict, int, str, float]] = []
+        self.contacts_bytes = 0
+        self.urls = set()
+        self.oldest: Optional[float] = None
+
+    def is_full(self) -> bool:
+        """True si lo acumulado ya no cabe en un solo chunk"""
+        return self.chunker.payload_size(self.contacts_bytes, len(self.entries)) > self.chunker.max_payload_bytes
+
+
+class EnrichmentBatcher:
+    """
+    Modo acumulador de /contacts/enrichment para clientes que envían pocos contactos
+    por request: en vez de despachar un chunk casi vacío por request, los contactos
+    (ya filtrados por EnrichmentPipeline.screen) se acumulan por forma de base_payload
+    y se despachan como chunks llenos.
+
+    Un buffer se vacía cuando lo acumulado supera el presupuesto de bytes del chunk
+    (se despachan los chunks llenos y el resto sigue esperando) o cuando su contacto
+    más antiguo cumple max_delay_seconds (se despacha todo). Cada despacho pasa por
+    EnrichmentPipeline.dispatch: reserva de cuota, ritmo por webhook y nombres de
+    tarea deterministas, igual que un request normal.
+
+    Los buffers vencidos o llenos se despachan en el propio request que llega (submit
+    o status) y, entre requests, desde un hilo aparte. En Cloud Run con CPU solo
+    durante requests ese hilo casi no corre: sin CPU siempre asignada, lo último que
+    quede en espera sale con el siguiente request a la instancia o al recibir SIGTERM.
+
+    Cada request recibe un batch_id; status(batch_id) informa cuántos de sus contactos
+    siguen en espera, se despacharon, fallaron o fueron rechazados por cuota. Los
+    lotes terminados se conservan batch_ttl_seconds (máximo max_batches). Con
+    status_store cada cambio de un lote se copia ahí, para consultarlo desde
+    cualquier instancia.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        max_delay_seconds: float = 5,
+        max_buffered_contacts: int = 50000,
+        batch_ttl_seconds: float = 3600,
+        max_batches: int = 100000,
+        status_store: Optional["BatchStatusStore"] = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.max_delay_seconds = max_delay_seconds
+        self.max_buffered_contacts = max_buffered_contacts
+        self.batch_ttl_seconds = batch_ttl_seconds
+        self.max_batches = max_batches
+        self.status_store = status_store
+
+        self._buffers: Dict[str, _PayloadBuffer] = {}
+        self._buffered = 0
+        self._batches: "OrderedDict[str, Dict]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        # Serializa las copias a status_store para que la última escrita sea la más reciente
+        self._persist_lock = threading.Lock()
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name="enrichment-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, data: Dict) -> Tuple[Dict, int]:
+        """
+        Filtra los contactos del body y acumula los no scrapeados.
+
+        Returns:
+            (body de la respuesta, status HTTP): 202 con el batch_id, 413 si algún
+            contacto no cabe solo en un chunk o 429 si la cuota ya está agotada
+        Raises:
+            EnrichmentBatcherFullError: Si el acumulador está lleno
+            EnrichmentStageTimeout: Si alguna etapa del filtrado supera su timeout
+        """
+        if self._closed:
+            raise RuntimeError("ENRICHMENT_BATCHER_CLOSED")
+
+        timings: Dict[str, float] = {}
+        chunker, pending, rejection = self.pipeline.screen(data, timings)
+        if rejection is not None:
+            return rejection
+
+        batch_id = uuid.uuid4().hex
+        # Misma forma de payload = mismo sobre: los contactos pueden compartir chunk
+        key = dumps(chunker.base_payload, sort_keys=True)
+        now = time.time()
+        batch = {
+            "batch_id": batch_id,
+            "status": "pending",
+            "contacts": len(data["contacts"]),
+            "already_scraped": len(data["contacts"]) - len(pending),
+            "pending": 0,
+            "dispatched": 0,
+            "duplicated": 0,
+            "failed": 0,
+            "rejected": 0,
+            "errors": [],
+            "created_at": now,
+            "updated_at": now,
+        }
+
+        with self._condition:
+            added_at = time.monotonic()
+            if self._buffered + len(pending) > self.max_buffered_contacts:
+                raise EnrichmentBatcherFullError(
+                    f"{self._buffered} contactos en espera, máximo {self.max_buffered_contacts}"
+                )
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = _PayloadBuffer(chunker)
+            for contact, size in pending:
+                url = contact.get("web_linkedin_url")
+                if url and url in buffer.urls:
+                    # Ya está en espera (otro request o un reintento): se envía una sola vez
+                    batch["duplicated"] += 1
+                    continue
+                if url:
+                    buffer.urls.add(url)
+                buffer.entries.append((contact, size, batch_id, added_at))
+                buffer.contacts_bytes += size
+                batch["pending"] += 1
+            new_deadline = bool(buffer.entries) and buffer.oldest is None
+            if new_deadline:
+                buffer.oldest = added_at
+            elif not buffer.entries:
+                del self._buffers[key]
+            self._buffered += batch["pending"]
+            if not batch["pending"]:
+                batch["status"] = "completed"
+            self._remember(batch)
+            if new_deadline or (buffer.entries and buffer.is_full()):
+                # El hilo puede estar esperando sin plazo: se despierta para recalcularlo
+                self._condition.notify()
+            buffered = self._buffered
+
+        logger.info("✅ Lote %s: %s contactos en espera (%s en el acumulador)", batch_id, batch["pending"], buffered)
+        self._persist([batch_id])
+        # El request que llena (o encuentra vencido) un buffer lo despacha: no depende del hilo
+        self._flush_due()
+        return {
+            "success": True,
+            "message": "Contactos agregados al acumulador",
+            "batch_id": batch_id,
+            "contacts_buffered": batch["pending"],
+            "contacts_already_scraped": batch["already_scraped"],
+            "contacts_duplicated": batch["duplicated"],
+            "max_delay_seconds": self.max_delay_seconds,
+            "stages": timings,
+            "timestamp": datetime.now().isoformat()
+        }, 202
+
+    def status(self, batch_id: str) -> Optional[Dict]:
+        """
+        Estado del lote, o None si no existe (o ya expiró). Busca primero en este
+        worker y luego en status_store (lotes aceptados por otra instancia).
+        """
+        self._flush_due()
+        with self._condition:
+            batch = self._batches.get(batch_id)
+            if batch is not None:
+                return self._snapshot(batch)
+        if self.status_store is None:
+            return None
+        return self.status_store.get(batch_id)
+
+    def buffered_count(self) -> int:
+        with self._condition:
+            return self._buffered
+
+    def flush(self, force: bool = True, reason: str = "manual") -> int:
+        """
+        Despacha lo acumulado: con force todo, si no solo los chunks llenos y los
+        buffers que cumplieron max_delay_seconds. Retorna los contactos despachados.
+        """
+        with self._flush_lock:
+            return self._flush(force, reason)
+
+    def _flush_due(self) -> None:
+        """Despacha en el request actual los buffers llenos o vencidos, si no hay otro flush en curso"""
+        with self._condition:
+            due = not self._closed and self._should_flush()
+        if not due or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flush(force=False, reason="request")
+        except Exception as error_message:
+            logger.error("❌ Error en flush del acumulador desde el request: %s", error_message)
+        finally:
+            self._flush_lock.release()
+
+    def _flush(self, force: bool, reason: str) -> int:
+        flushed = 0
+        for chunker, entries, flush_reason in self._take(force, reason):
+            try:
+                flushed += self._dispatch(chunker, entries, flush_reason)
+            except Exception as error_message:
+                # Un buffer con error no debe perder los que se sacaron después
+                logger.error("❌ Error despachando %s contactos acumulados: %s", len(entries), error_message)
+                self._settle(entries, [len(entries)], ["failed"], {0: f"Error interno del servidor: {error_message}"})
+        return flushed
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Detiene el hilo y despacha todo lo que quede en espera"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join(timeout)
+        self.flush(force=True, reason="shutdown")
+
+    def _take(self, force: bool, reason: str) -> List[Tuple[ContactChunker, List[Tuple[Dict, int, str, float]], str]]:
+        """Saca del acumulador los contactos a despachar, agrupados por base_payload, con el motivo"""
+        work = []
+        now = time.monotonic()
+        with self._condition:
+            for key, buffer in list(self._buffers.items()):
+                expired = now - buffer.oldest >= self.max_delay_seconds
+                full = self._full_chunk_entries(buffer) if not force and not expired and buffer.is_full() else 0
+                if force or expired or full is None:
+                    taken = buffer.entries
+                    flush_reason = reason if force else ("delay" if expired else "size")
+                    del self._buffers[key]
+                elif full:
+                    # Se despachan los chunks llenos; el último (incompleto) sigue esperando
+                    taken, buffer.entries = buffer.entries[:full], buffer.entries[full:]
+                    buffer.contacts_bytes = sum(size for _, size, _, _ in buffer.entries)
+                    buffer.urls = {contact.get("web_linkedin_url") for contact, _, _, _ in buffer.entries} - {None}
+                    # El plazo de max_delay_seconds corre desde el contacto más antiguo que queda
+                    buffer.oldest = buffer.entries[0][3]
+                    flush_reason = "size"
+                else:
+                    continue
+                self._buffered -= len(taken)
+                work.append((buffer.chunker, taken, flush_reason))
+        return work
+
+    @staticmethod
+    def _full_chunk_entries(buffer: _PayloadBuffer) -> Optional[int]:
+        """
+        Cuántos contactos del inicio del buffer forman chunks llenos (el último chunk,
+        incompleto, no cuenta); None si algún contacto no cabe solo en un chunk.
+        """
+        try:
+            chunks = buffer.chunker.chunk(
+                [contact for contact, _, _, _ in buffer.entries], [size for _, size, _, _ in buffer.entries]
+            )
+        except ValueError:
+            # No debería pasar (screen rechaza esos contactos): se despacha todo y _dispatch lo marca fallido
+            return None
+        return sum(len(chunk) for chunk in chunks[:-1])
+
+    def _dispatch(self, chunker: ContactChunker, entries: List[Tuple[Dict, int, str, float]], reason: str) -> int:
+        ENRICHMENT_BATCHER_FLUSHES.inc(reason=reason)
+        try:
+            chunks = chunker.chunk([contact for contact, _, _, _ in entries], [size for _, size, _, _ in entries])
+        except ValueError as error_message:
+            logger.error("❌ No se pudieron agrupar %s contactos acumulados: %s", len(entries), error_message)
+            self._settle(entries, [len(entries)], ["failed"], {0: str(error_message)})
+            return 0
+        ENRICHMENT_CHUNKS.inc(len(chunks))
+
+        try:
+            outcome = self.pipeline.dispatch(chunker.base_payload, chunks, {})
+            chunk_states = outcome.chunk_states
+            errors = outcome.errors
+        except EnrichmentStageTimeout as error_message:
+            chunk_states = ["failed"] * len(chunks)
+            error = str(error_message)
+            if error_message.in_progress and error_message.stage == "dispatch":
+                error += " (las tareas se siguen creando en segundo plano: no reenviar estos contactos)"
+            errors = {index: error for index in range(len(chunks))}
+        except Exception as error_message:
+            logger.error("❌ Error despachando %s contactos acumulados: %s", len(entries), error_message)
+            chunk_states = ["failed"] * len(chunks)
+            errors = {index: f"Error interno del servidor: {error_message}" for index in range(len(chunks))}
+
+        self._settle(entries, [len(chunk) for chunk in chunks], chunk_states, errors)
+
+        dispatched = sum(len(chunk) for chunk, state in zip(chunks, chunk_states) if state not in ("failed", "rejected"))
+        if dispatched:
+            # Se informa en el resumen periódico de Slack, no con un mensaje por flush
+            self.pipeline.slack_notifier.record_success(dispatched)
+        logger.info("✅ Flush del acumulador (%s): %s contactos en %s chunks", reason, len(entries), len(chunks))
+        return dispatched
+
+    def _settle(self, entries: List[Tuple[Dict, int, str, float]], chunk_lengths: List[int], chunk_states: List[str], errors: Dict[int, str]) -> None:
+        """Asigna a cada lote el estado del chunk en que salió cada uno de sus contactos"""
+        # Los chunks conservan el orden de los contactos: se reparten por posición
+        position = 0
+        now = time.time()
+        touched = set()
+        with self._condition:
+            for index, chunk_length in enumerate(chunk_lengths):
+                state = chunk_states[index]
+                for _, _, batch_id, _ in entries[position:position + chunk_length]:
+                    batch = self._batches.get(batch_id)
+                    if batch is None:
+                        continue
+                    touched.add(batch_id)
+                    batch["pending"] -= 1
+                    batch[state] += 1
+                    if index in errors and errors[index] not in batch["errors"]:
+                        batch["errors"].append(errors[index])
+                    batch["updated_at"] = now
+                    if not batch["pending"]:
+                        batch["status"] = self._final_status(batch)
+                position += chunk_length
+        self._persist(touched)
+
+    def _persist(self, batch_ids: Iterable[str]) -> None:
+        """Copia el estado actual de los lotes a status_store; un error no afecta el despacho"""
+        if self.status_store is None or not batch_ids:
+            return
+        with self._persist_lock:
+            with self._condition:
+                snapshots = [self._snapshot(self._batches[batch_id]) for batch_id in batch_ids if batch_id in self._batches]
+            try:
+                self.status_store.save(snapshots)
+            except Exception as error_message:
+                logger.error("❌ Error guardando el estado de %s lotes: %s", len(snapshots), error_message)
+
+    @staticmethod
+    def _snapshot(batch: Dict) -> Dict:
+        return {**batch, "errors": list(batch["errors"])}
+
+    def _remember(self, batch: Dict) -> None:
+        """Registra el lote y descarta los terminados más viejos (se llama con el lock tomado)"""
+        self._batches[batch["batch_id"]] = batch
+        expired_before = time.time() - self.batch_ttl_seconds
+        while self._batches:
+            oldest = next(iter(self._batches.values()))
+            over_capacity = len(self._batches) > self.max_batches
+            expired = not oldest["pending"] and oldest["updated_at"] < expired_before
+            if not over_capacity and not expired:
+                break
+            self._batches.popitem(last=False)
+
+    @staticmethod
+    def _final_status(batch: Dict) -> str:
+        if not batch["failed"] and not batch["rejected"]:
+            return "completed"
+        return "partial" if batch["dispatched"] or batch["duplicated"] else "failed"
+
+    def _next_deadline(self) -> Optional[float]:
+        oldest = [buffer.oldest for buffer in self._buffers.values() if buffer.oldest is not None]
+        return min(oldest) + self.max_delay_seconds if oldest else None
+
+    def _should_flush(self) -> bool:
+        if any(buffer.is_full() for buffer in self._buffers.values()):
+            return True
+        deadline = self._next_deadline()
+        return deadline is not None and time.monotonic() >= deadline
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and not self._should_flush():
+                    deadline = self._next_deadline()
+                    if deadline is None:
+                        self._condition.wait()
+                    else:
+                        self._condition.wait(max(deadline - time.monotonic(), 0.01))
+                if self._closed:
+                    return
+            try:
+                self.flush(force=False)
+            except Exception as error_message:
+                logger.error("❌ Error en flush del acumulador de enriquecimiento: %s", error_message)
+                time.sleep(min(self.max_delay_seconds, 5))
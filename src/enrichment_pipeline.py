@@ -0,0 +1,464 @@
+import time
+from dataclasses import dataclass, field
+from concurrent.futures import Executor, Future, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from logging import Logger
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from chunker import ContactChunker, MAX_PAYLOAD_BYTES
+from metrics import (
+    ENRICHMENT_CHUNKS,
+    ENRICHMENT_CONTACTS_ALREADY_SCRAPED,
+    ENRICHMENT_DUPLICATE_CHUNKS,
+    ENRICHMENT_QUOTA_REJECTIONS,
+    ENRICHMENT_STAGE_SECONDS,
+)
+
+logger: Logger = logging.getLogger(__name__)
+
+DEFAULT_STAGE_TIMEOUTS = {
+    "lookup": 20.0,
+    "encode": 10.0,
+    "quota_check": 10.0,
+    "reserve": 10.0,
+    "schedule": 10.0,
+    "dispatch": 60.0,
+}
+
+
+class EnrichmentStageTimeout(Exception):
+    """
+    Una etapa del pipeline de enriquecimiento superó su timeout. in_progress indica
+    que la etapa ya estaba corriendo y sigue en segundo plano (no se pudo cancelar).
+    """
+
+    def __init__(self, stage: str, timeout: float, in_progress: bool = False) -> None:
+        super().__init__(f"STAGE_TIMEOUT: la etapa {stage} superó {timeout}s")
+        self.stage = stage
+        self.timeout = timeout
+        self.in_progress = in_progress
+
+
+@dataclass
+class DispatchOutcome:
+    """Resultado de EnrichmentPipeline.dispatch para un grupo de chunks"""
+    # Estado de cada chunk, por índice: dispatched, duplicated, failed o rejected
+    chunk_states: List[str]
+    # Error de cada chunk fallido o rechazado, por índice
+    errors: Dict[int, str] = field(default_factory=dict)
+    # Documentos cuyo límite impidió reservar cuota (todos los chunks nuevos rechazados)
+    limit_exceeded: List[str] = field(default_factory=list)
+    # Chunks omitidos sin RPC porque su tarea se creó hace poco en este worker
+    cached_duplicates: int = 0
+    dispatch_window_seconds: float = 0.0
+
+    @property
+    def dispatched(self) -> int:
+        return self.chunk_states.count("dispatched")
+
+    @property
+    def duplicated(self) -> int:
+        return self.chunk_states.count("duplicated")
+
+    @property
+    def failed(self) -> int:
+        return self.chunk_states.count("failed")
+
+
+class EnrichmentPipeline:
+    """
+    Flujo de /contacts/enrichment como pipeline de etapas con timeout propio.
+
+    Las etapas independientes corren en paralelo en un executor compartido:
+        lookup       URLs ya scrapeadas en BigQuery
+        encode       serialización de cada contacto (tamaños para el chunker)
+        quota_check  lectura de contadores en Firestore (o recarga del bloque de cuota
+                     local), para rechazar temprano si el límite ya se alcanzó
+    y luego, con sus resultados:
+        chunk        cortes de chunk a partir de los tamaños ya calculados
+        reserve      reserva atómica de cuota
+        schedule     slots de despacho según el ritmo del webhook (DispatchScheduler)
+        dispatch     creación concurrente de las tareas de Cloud Tasks
+    Las notificaciones de Slack ya salen del request (SlackNotifier), así la latencia
+    total se acerca a la de la etapa más lenta y no a la suma de todas.
+    """
+
+    def __init__(
+        self,
+        bigquery_service,
+        firestore_service,
+        cloud_tasks_service,
+        slack_notifier,
+        executor: Executor,
+        destination_table: str,
+        collection: str,
+        documents: List[str],
+        limit: int,
+        advertising_threshold: int,
+        webhook_url: str,
+        webhook_headers: Dict,
+        max_payload_bytes: int = MAX_PAYLOAD_BYTES,
+        quota_leaser=None,
+        dispatch_scheduler=None,
+        stage_timeouts: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.bigquery_service = bigquery_service
+        self.firestore_service = firestore_service
+        self.cloud_tasks_service = cloud_tasks_service
+        self.slack_notifier = slack_notifier
+        self.executor = executor
+        self.destination_table = destination_table
+        self.collection = collection
+        self.documents = documents
+        self.limit = limit
+        self.advertising_threshold = advertising_threshold
+        self.webhook_url = webhook_url
+        self.webhook_headers = webhook_headers
+        self.max_payload_bytes = max_payload_bytes
+        self.quota_leaser = quota_leaser
+        self.dispatch_scheduler = dispatch_scheduler
+        self.stage_timeouts = {**DEFAULT_STAGE_TIMEOUTS, **(stage_timeouts or {})}
+
+    def run(self, data: Dict) -> Tuple[Dict, int]:
+        """
+        Ejecuta el enriquecimiento para el body del request.
+
+        Returns:
+            (body de la respuesta, status HTTP)
+        Raises:
+            EnrichmentStageTimeout: Si alguna etapa supera su timeout
+        """
+        timings: Dict[str, float] = {}
+        chunker, pending, rejection = self.screen(data, timings)
+        if rejection is not None:
+            return rejection
+
+        if not pending:
+            return {
+                "success": True,
+                "message": "Todas las contactos ya fueron scrapeadas",
+                "stages": timings,
+                "timestamp": datetime.now().isoformat()
+            }, 200
+
+        contacts_not_scraped = [contact for contact, _ in pending]
+        chunks = self._timed("chunk", timings, chunker.chunk, contacts_not_scraped, [size for _, size in pending])
+        ENRICHMENT_CHUNKS.inc(len(chunks))
+
+        outcome = self.dispatch(chunker.base_payload, chunks, timings)
+        if outcome.limit_exceeded:
+            return self._limit_response(outcome.limit_exceeded, timings), 429
+
+        if outcome.cached_duplicates == len(chunks):
+            return {
+                "success": True,
+                "message": "Todos los chunks ya habían sido despachados",
+                "chunks_dispatched": 0,
+                "chunks_duplicated": outcome.cached_duplicates,
+                "stages": timings,
+                "timestamp": datetime.now().isoformat()
+            }, 200
+
+        # Se informa en el resumen periódico de Slack, no con un mensaje por request
+        self.slack_notifier.record_success(len(contacts_not_scraped))
+
+        if outcome.failed:
+            # Despacho parcial (207) o total fallido (500): se informa qué chunks no se crearon
+            return {
+                "success": False,
+                "error": f"No se pudieron crear {outcome.failed} de {len(chunks)} tareas",
+                "chunks_dispatched": outcome.dispatched,
+                "chunks_duplicated": outcome.duplicated,
+                "dispatch_window_seconds": outcome.dispatch_window_seconds,
+                "chunks_failed": [
+                    {"index": index, "contacts": len(chunks[index]), "error": error}
+                    for index, error in sorted(outcome.errors.items())
+                ],
+                "stages": timings,
+                "timestamp": datetime.now().isoformat()
+            }, 207 if outcome.dispatched or outcome.duplicated else 500
+
+        return {
+            "success": True,
+            "message": "Tarea creada correctamente",
+            "chunks_dispatched": outcome.dispatched,
+            "chunks_duplicated": outcome.duplicated,
+            "dispatch_window_seconds": outcome.dispatch_window_seconds,
+            "stages": timings,
+            "timestamp": datetime.now().isoformat()
+        }, 200
+
+    def screen(self, data: Dict, timings: Dict[str, float]) -> Tuple[ContactChunker, List[Tuple[Dict, int]], Optional[Tuple[Dict, int]]]:
+        """
+        Etapas previas al chunking: lookup, encode y quota_check en paralelo.
+
+        Returns:
+            (chunker del base_payload del body, [(contacto no scrapeado, tamaño)],
+             respuesta 429 si la cuota ya está agotada, 413 si algún contacto no
+             cabe solo en un chunk, o None)
+        """
+        contacts = data["contacts"]
+        base_payload = {k: v for k, v in data.items() if k != "contacts"}
+        chunker = ContactChunker(base_payload, self.max_payload_bytes)
+
+        contacts_urls = [
+            contact.get("web_linkedin_url")
+            for contact in contacts
+            if contact.get("web_linkedin_url")
+        ]
+
+        # Etapas independientes en paralelo
+        lookup = self._submit("lookup", timings, self._lookup, contacts_urls)
+        encode = self._submit("encode", timings, chunker.contact_sizes, contacts)
+        quota_check = self._submit("quota_check", timings, self._quota_check)
+
+        blocked_documents = self._wait("quota_check", quota_check)
+        if blocked_documents:
+            ENRICHMENT_QUOTA_REJECTIONS.inc(stage="quota_check")
+            self._notify_limit_exceeded(blocked_documents, 1)
+            return chunker, [], (self._limit_response(blocked_documents, timings), 429)
+
+        scraped_urls = self._wait("lookup", lookup)
+        sizes = self._wait("encode", encode)
+
+        pending = [
+            (contact, size)
+            for contact, size in zip(contacts, sizes)
+            if contact.get("web_linkedin_url") not in scraped_urls
+        ]
+        ENRICHMENT_CONTACTS_ALREADY_SCRAPED.inc(len(contacts) - len(pending))
+        logger.info("✅ Contacts not scraped: %s de %s", len(pending), len(contacts))
+
+        # Un contacto que no cabe solo en un chunk nunca podrá enviarse: se rechaza el request
+        oversized = [
+            index for index, (contact, size) in enumerate(zip(contacts, sizes))
+            if contact.get("web_linkedin_url") not in scraped_urls
+            and chunker.payload_size(size, 1) > self.max_payload_bytes
+        ]
+        if oversized:
+            logger.warning("⚠️ %s contactos superan el límite de %s bytes por payload", len(oversized), self.max_payload_bytes)
+            return chunker, [], ({
+                "success": False,
+                "error": "CONTACT_PAYLOAD_EXCEEDS_100KB_LIMIT",
+                "contacts_oversized": oversized,
+                "max_payload_bytes": self.max_payload_bytes,
+                "stages": timings,
+                "timestamp": datetime.now().isoformat()
+            }, 413)
+        return chunker, pending, None
+
+    def dispatch(self, base_payload: Dict, chunks: List[List[Dict]], timings: Dict[str, float]) -> DispatchOutcome:
+        """
+        Reserva cuota, programa y crea una tarea por chunk ({**base_payload, "contacts": chunk}).
+
+        Raises:
+            EnrichmentStageTimeout: Si alguna etapa supera su timeout
+        """
+        # Nombre de tarea determinista por chunk: un reintento del cliente no vuelve a
+        # crear (ni a cobrar cuota por) los chunks que ya se despacharon
+        json_payloads = [{**base_payload, "contacts": chunk} for chunk in chunks]
+        task_ids = self._timed("task_ids", timings, self._task_ids, json_payloads)
+        pending_indexes = [
+            index for index, task_id in enumerate(task_ids)
+            if not self.cloud_tasks_service.was_recently_created(task_id)
+        ]
+        outcome = DispatchOutcome(chunk_states=["duplicated"] * len(chunks))
+        outcome.cached_duplicates = len(chunks) - len(pending_indexes)
+        if outcome.cached_duplicates:
+            ENRICHMENT_DUPLICATE_CHUNKS.inc(outcome.cached_duplicates, source="cache")
+            logger.info("Chunks ya despachados recientemente, se omiten: %s de %s", outcome.cached_duplicates, len(chunks))
+
+        if not pending_indexes:
+            return outcome
+
+        count_to_increment = len(pending_indexes)
+        # Si la reserva vence su timeout pero termina después, la cuota se devuelve al confirmarse
+        reservation = self._wait(
+            "reserve", self._submit("reserve", timings, self._reserve, count_to_increment),
+            on_abandon=self._refund_abandoned_reservation
+        )
+        if not reservation.reserved:
+            ENRICHMENT_QUOTA_REJECTIONS.inc(stage="reserve")
+            self._notify_limit_exceeded(reservation.limit_exceeded, count_to_increment)
+            outcome.limit_exceeded = reservation.limit_exceeded
+            for index in pending_indexes:
+                outcome.chunk_states[index] = "rejected"
+                outcome.errors[index] = f"Límite excedido en el documento: {', '.join(reservation.limit_exceeded)}"
+            return outcome
+
+        for document_name in reservation.threshold_exceeded:
+            self.slack_notifier.notify(
+                f"Umbral de advertising excedido en el documento: {document_name} con el valor de {count_to_increment} y el umbral es {self.advertising_threshold}",
+                key=f"threshold:{document_name}"
+            )
+
+        slots = None
+        try:
+            # Con ritmo por webhook, las tareas se programan en slots consecutivos en vez de en ráfaga
+            if self.dispatch_scheduler is not None:
+                slots = self._wait("schedule", self._submit(
+                    "schedule", timings, self.dispatch_scheduler.reserve_slots, self.webhook_url, count_to_increment
+                ))
+            scheduled_seconds = slots.delays if slots is not None else None
+            outcome.dispatch_window_seconds = scheduled_seconds[-1] if scheduled_seconds else 0.0
+
+            # Un despacho que vence su timeout ya no se puede cancelar: las tareas se
+            # siguen creando y sus duplicados se descuentan de la cuota al terminar
+            dispatch_results = self._wait("dispatch", self._submit(
+                "dispatch", timings,
+                self.cloud_tasks_service.create_http_tasks_bulk,
+                url=self.webhook_url,
+                json_payloads=[json_payloads[index] for index in pending_indexes],
+                headers=self.webhook_headers,
+                task_ids=[task_ids[index] for index in pending_indexes],
+                scheduled_seconds=scheduled_seconds
+            ), on_abandon=self._settle_abandoned_dispatch)
+        except EnrichmentStageTimeout as error:
+            if not (error.stage == "dispatch" and error.in_progress):
+                # No se creó ninguna tarea: la cuota reservada y los slots vuelven
+                self._refund(count_to_increment)
+                self._release_slots(slots, count_to_increment)
+            raise
+
+        server_duplicates = 0
+        for result in dispatch_results:
+            # Índices de los resultados -> índices de chunk
+            index = pending_indexes[result["index"]]
+            if not result["success"]:
+                outcome.chunk_states[index] = "failed"
+                outcome.errors[index] = result["error"]
+            elif result["duplicate"]:
+                server_duplicates += 1
+            else:
+                outcome.chunk_states[index] = "dispatched"
+        logger.info("✅ Tareas creadas: %s de %s (%s duplicadas)", outcome.dispatched, len(chunks), outcome.duplicated)
+
+        if server_duplicates:
+            # La tarea ya existía en Cloud Tasks: la cuota ya se había contado en el intento anterior
+            ENRICHMENT_DUPLICATE_CHUNKS.inc(server_duplicates, source="server")
+            self._refund(server_duplicates)
+
+        # Los slots de los últimos chunks duplicados o fallidos no los usa ninguna tarea
+        unused_slots = 0
+        for index in reversed(pending_indexes):
+            if outcome.chunk_states[index] == "dispatched":
+                break
+            unused_slots += 1
+        self._release_slots(slots, unused_slots)
+        return outcome
+
+    def _task_ids(self, json_payloads: List[Dict]) -> List[str]:
+        return [self.cloud_tasks_service.task_id_for(self.webhook_url, json_payload) for json_payload in json_payloads]
+
+    def _lookup(self, contacts_urls: List[str]) -> set:
+        scraped_urls = self.bigquery_service.verify_if_contacts_was_scraped(self.destination_table, contacts_urls)
+        return scraped_urls if scraped_urls is not None else set()
+
+    def _quota_check(self) -> List[str]:
+        """Documentos que ya no admiten ni un chunk más"""
+        if self.quota_leaser is not None:
+            rejected = self.quota_leaser.prefetch()
+            return rejected.limit_exceeded if rejected is not None else []
+        counts = self.firestore_service.get_current_counts(self.collection, self.documents)
+        return [document_name for document_name, count in counts.items() if count >= self.limit]
+
+    def _reserve(self, amount: int):
+        if self.quota_leaser is not None:
+            # Se consume del bloque de cuota local; solo va a Firestore al agotarse
+            return self.quota_leaser.acquire(amount)
+        # Valida e incrementa los contadores en una sola transacción
+        return self.firestore_service.reserve_quota(
+            collection=self.collection,
+            documents=self.documents,
+            amount=amount,
+            limit=self.limit,
+            advertising_threshold=self.advertising_threshold
+        )
+
+    def _refund(self, amount: int) -> None:
+        """Devuelve cuota reservada para chunks que resultaron duplicados"""
+        try:
+            if self.quota_leaser is not None:
+                self.quota_leaser.refund(amount)
+            else:
+                self.firestore_service.release_quota(self.collection, self.documents, amount)
+        except Exception as error_message:
+            # Conservador: la cuota queda contada de más, nunca de menos
+            logger.error("❌ Error devolviendo %s unidades de cuota de chunks duplicados: %s", amount, error_message)
+
+    def _release_slots(self, slots, unused: int) -> None:
+        """Devuelve al DispatchScheduler los slots finales que ninguna tarea usó"""
+        if slots is None or not unused:
+            return
+        try:
+            self.dispatch_scheduler.release_slots(slots, unused)
+        except Exception as error_message:
+            # Conservador: la marca queda adelantada, las tareas siguientes solo se retrasan
+            logger.error("❌ Error devolviendo %s slots de despacho: %s", unused, error_message)
+
+    def _refund_abandoned_reservation(self, future: Future) -> None:
+        """Devuelve la cuota de una reserva que se confirmó después de su timeout"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        reservation = future.result()
+        if reservation.reserved:
+            logger.warning("⚠️ Reserva de %s unidades confirmada tras su timeout, se devuelve", reservation.amount)
+            self._refund(reservation.amount)
+
+    def _settle_abandoned_dispatch(self, future: Future) -> None:
+        """Registra el resultado de un despacho que terminó después de su timeout"""
+        if future.cancelled() or future.exception() is not None:
+            logger.error("❌ Despacho en segundo plano terminado con error: %s", None if future.cancelled() else future.exception())
+            return
+        results = future.result()
+        server_duplicates = sum(1 for result in results if result["success"] and result["duplicate"])
+        failed = sum(1 for result in results if not result["success"])
+        logger.warning(
+            "⚠️ Despacho terminado tras su timeout: %s tareas, %s duplicadas, %s fallidas",
+            len(results) - server_duplicates - failed, server_duplicates, failed
+        )
+        if server_duplicates:
+            ENRICHMENT_DUPLICATE_CHUNKS.inc(server_duplicates, source="server")
+            self._refund(server_duplicates)
+
+    def _notify_limit_exceeded(self, documents: List[str], count_to_increment: int) -> None:
+        for document_name in documents:
+            self.slack_notifier.notify(
+                f"Límite excedido en el documento: {document_name} con el valor de {count_to_increment} y el límite es {self.limit}, si es una tabla se debe borrar las filas, si es un webhook se debe crear un nuevo webhook y cambiar la variable del url en cloud Run",
+                key=f"limit:{document_name}"
+            )
+
+    def _limit_response(self, documents: List[str], timings: Dict[str, float]) -> Dict:
+        return {
+            "success": False,
+            "error": f"Límite excedido en el documento: {', '.join(documents)}",
+            "stages": timings,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def _submit(self, stage: str, timings: Dict[str, float], fn: Callable, *args, **kwargs) -> Future:
+        return self.executor.submit(self._timed, stage, timings, fn, *args, **kwargs)
+
+    def _timed(self, stage: str, timings: Dict[str, float], fn: Callable, *args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[stage] = time.perf_counter() - start_time
+            ENRICHMENT_STAGE_SECONDS.observe(timings[stage], stage=stage)
+
+    def _wait(self, stage: str, future: Future, on_abandon: Optional[Callable[[Future], None]] = None):
+        """
+        Resultado de la etapa dentro de su timeout. Si vence y la etapa ya estaba
+        corriendo (no se puede cancelar), on_abandon se llama con el future al terminar.
+        """
+        timeout = self.stage_timeouts[stage]
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            in_progress = not future.cancel()
+            if in_progress and on_abandon is not None:
+                future.add_done_callback(on_abandon)
+            logger.error("❌ La etapa %s superó su timeout de %ss (en curso: %s)", stage, timeout, in_progress)
+            raise EnrichmentStageTimeout(stage, timeout, in_progress)
@@ -1,32 +1,158 @@
 from google.cloud import firestore
 from google.cloud.firestore_v1.base_client import BaseClient # Para tipado
 from google.cloud.firestore_v1.client import Client
+from dataclasses import dataclass, field
 from logging import Logger
 import logging
+import random
+from typing import Dict, List
+from metrics import timed
 # Inicialización del cliente de Firestore.
 logger: Logger = logging.getLogger(__name__)
+
+# Subcolección con los shards de cada contador: {collection}/{document}/shards/{i}
+SHARDS_SUBCOLLECTION = "shards"
+
+
+@dataclass
+class QuotaReservation:
+    """Resultado de FirestoreService.reserve_quota"""
+    reserved: bool
+    amount: int
+    # Valor de cada contador tras la reserva (o el actual si no se reservó)
+    counts: Dict[str, int] = field(default_factory=dict)
+    # Documentos cuyo límite se superaría: si hay alguno no se reserva nada
+    limit_exceeded: List[str] = field(default_factory=list)
+    # Documentos que con esta reserva superan el umbral de advertising
+    threshold_exceeded: List[str] = field(default_factory=list)
+
+
 class FirestoreService:
+    """
+    Contadores de cuota en Firestore.
+
+    Con counter_shards > 1 cada contador se reparte en N sub-documentos (shards):
+    las escrituras (reserva y devolución de cuota) van a un shard al azar, así no
+    compiten por un solo documento (~1 escritura sostenida por segundo por documento),
+    y las lecturas suman el documento base más todos sus shards con un solo get_all.
+    Los contadores sin migrar (solo el campo count del documento base) se siguen
+    leyendo correctamente.
 
-    def __init__(self, project:str, database:str):
+    La reserva (reserve_quota) sigue siendo una transacción que lee todos los shards
+    para validar el límite y cualquier escritura en un shard invalida las reservas en
+    curso: los shards no agregan capacidad de escritura a la reserva, solo a
+    increment_current_count y release_quota (escrituras sin lectura). Por eso solo
+    sirven si las reservas son por bloque (QuotaLeaser): Config.validate exige
+    QUOTA_LEASE_ENABLED con FIREBASE_COUNTER_SHARDS. Los contadores existentes se
+    migran con migrate_counter_to_shards (POST /admin/counters/migrate).
+    """
+
+    def __init__(self, project:str, database:str, counter_shards:int = 0):
+        self.counter_shards = counter_shards
         try:
             self.db: Client = firestore.Client(project=project,database=database)
-            logger.info(f"✅ Cliente de Firestore inicializado: proyecto={project}")
+            logger.info("✅ Cliente de Firestore inicializado: proyecto=%s", project)
         except Exception as e:
-            logger.error(
-                f"❌ Error inicializando cliente de Firestore: {e}\n"
-                f"   Proyecto: {project}\n"
-            )
+            logger.error("❌ Error inicializando cliente de Firestore: %s (proyecto=%s)", e, project)
             raise
 
+    def _shard_references(self, collection:str, document_name:str) -> list:
+        document = self.db.collection(collection).document(document_name)
+        return [document.collection(SHARDS_SUBCOLLECTION).document(str(shard)) for shard in range(self.counter_shards)]
+
+    def _counter_references(self, collection:str, document_name:str) -> list:
+        """Documento base del contador más sus shards (si el contador está shardeado)"""
+        document = self.db.collection(collection).document(document_name)
+        if self.counter_shards <= 1:
+            return [document]
+        return [document] + self._shard_references(collection, document_name)
+
+    def _increment_reference(self, collection:str, document_name:str):
+        """Documento que recibe un incremento: un shard al azar o el documento base"""
+        if self.counter_shards <= 1:
+            return self.db.collection(collection).document(document_name)
+        return random.choice(self._shard_references(collection, document_name))
+
+    def _sum_counts(self, snapshots, documents_by_path:Dict[str, str]) -> Dict[str, int]:
+        counts = {document_name: 0 for document_name in documents_by_path.values()}
+        for snapshot in snapshots:
+            if snapshot.exists:
+                document_name = documents_by_path[snapshot.reference.path]
+                counts[document_name] += (snapshot.to_dict() or {}).get('count', 0)
+        return counts
+
+    @timed("firestore")
     def get_current_count(self,collection:str, document_name:str) -> int:
-        return self.db.collection(collection).document(document_name).get().to_dict()['count']
+        if self.counter_shards <= 1:
+            return self.db.collection(collection).document(document_name).get().to_dict()['count']
+        references = self._counter_references(collection, document_name)
+        documents_by_path = {reference.path: document_name for reference in references}
+        return self._sum_counts(self.db.get_all(references), documents_by_path)[document_name]
+
+    @timed("firestore")
+    def get_current_counts(self, collection:str, documents:List[str]) -> Dict[str, int]:
+        """Valor actual de varios contadores con una sola lectura (get_all)"""
+        references = []
+        documents_by_path = {}
+        for document_name in documents:
+            for reference in self._counter_references(collection, document_name):
+                references.append(reference)
+                documents_by_path[reference.path] = document_name
+        return self._sum_counts(self.db.get_all(references), documents_by_path)
 
+    @timed("firestore")
     def update_current_count(self,collection:str, document_name:str, count:int) -> None:
-        self.db.collection(collection).document(document_name).set({'count': count})
+        if self.counter_shards <= 1:
+            self.db.collection(collection).document(document_name).set({'count': count})
+            return
+        # El valor queda en el documento base y los shards vuelven a cero
+        batch = self.db.batch()
+        batch.set(self.db.collection(collection).document(document_name), {'count': count}, merge=True)
+        for reference in self._shard_references(collection, document_name):
+            batch.set(reference, {'count': 0})
+        batch.commit()
     
+    @timed("firestore")
     def increment_current_count(self,collection:str, document_name:str, increment:int) -> None:
-        logger.info(f"Incrementando contador de {document_name} en {collection} en {increment} unidades")
-        self.db.collection(collection).document(document_name).update({'count': firestore.Increment(increment)})
+        """Incrementa el contador sin leerlo ni validar el límite (un shard al azar si está shardeado)"""
+        logger.info("Incrementando contador de %s en %s en %s unidades", document_name, collection, increment)
+        if self.counter_shards <= 1:
+            self.db.collection(collection).document(document_name).update({'count': firestore.Increment(increment)})
+            return
+        self._increment_reference(collection, document_name).set({'count': firestore.Increment(increment)}, merge=True)
+
+    def migrate_counter_to_shards(self, collection:str, document_name:str) -> int:
+        """
+        Mueve el campo count del documento base al shard 0 (en una transacción) y crea
+        los shards restantes en cero. Es idempotente: una segunda ejecución no mueve nada.
+
+        Returns:
+            Unidades movidas del documento base al shard 0
+        """
+        if self.counter_shards <= 1:
+            raise ValueError("COUNTER_SHARDS_NOT_CONFIGURED: counter_shards debe ser mayor a 1")
+
+        document = self.db.collection(collection).document(document_name)
+        shards = self._shard_references(collection, document_name)
+
+        @firestore.transactional
+        def migrate_in_transaction(transaction) -> int:
+            snapshots = {snapshot.reference.path: snapshot for snapshot in transaction.get_all([document] + shards)}
+            base_snapshot = snapshots.get(document.path)
+            base_count = (base_snapshot.to_dict() or {}).get('count', 0) if base_snapshot and base_snapshot.exists else 0
+
+            for shard in shards:
+                shard_snapshot = snapshots.get(shard.path)
+                if not (shard_snapshot and shard_snapshot.exists):
+                    transaction.set(shard, {'count': 0})
+            if base_count:
+                transaction.set(shards[0], {'count': firestore.Increment(base_count)}, merge=True)
+            transaction.set(document, {'count': 0, 'num_shards': self.counter_shards}, merge=True)
+            return base_count
+
+        moved = migrate_in_transaction(self.db.transaction())
+        logger.info("✅ Contador %s/%s migrado a %s shards (%s unidades movidas)", collection, document_name, self.counter_shards, moved)
+        return moved
 
     def calculate_new_count(self,collection:str, document_name:str, count:int) -> int:
         return self.get_current_count(collection, document_name) + count
@@ -62,25 +188,117 @@ class FirestoreService:
             if limit_exceeded is not None:
                 if limit_exceeded:
                     logger.error(
-                        f"LÍMITE EXCEDIDO: El límite de {document_name} ({limit}) sería superado. "
-                        f"Actual: {current_count}, Intento agregar: {new_count}, "
-                        f"Nuevo total: {new_count_result}"
-                        f"se debe realizar una limpieza de tabla o webhook y enviar la notificacion a slack"
+                        "LÍMITE EXCEDIDO: El límite de %s (%s) sería superado. "
+                        "Actual: %s, Intento agregar: %s, Nuevo total: %s. "
+                        "Se debe realizar una limpieza de tabla o webhook y enviar la notificacion a slack",
+                        document_name, limit, current_count, new_count, new_count_result
                     )
                 # Verificar umbral de advertising y loguear si se supera
             advertising_threshold_exceeded = new_count_result > advertising_threshold
             if advertising_threshold_exceeded is not None:
                 if advertising_threshold_exceeded:
                     logger.warning(
-                        f"⚠️ UMBRAL DE ADVERTISING SUPERADO: "
-                        f"El contador de {document_name} ({new_count_result}) ha superado el umbral de advertising "
-                        f"({advertising_threshold}). Límite total: {limit}"
+                        "⚠️ UMBRAL DE ADVERTISING SUPERADO: El contador de %s (%s) ha superado "
+                        "el umbral de advertising (%s). Límite total: %s",
+                        document_name, new_count_result, advertising_threshold, limit
                     )
             
             return limit_exceeded, advertising_threshold_exceeded
             
         except Exception as error:
-            logger.error(f"❌ Error validando límites en Firebase: {error}")
+            logger.error("❌ Error validando límites en Firebase: %s", error)
             raise
-    
-    
\ No newline at end of file
+
+    @timed("firestore")
+    def reserve_quota(
+        self,
+        collection: str,
+        documents: List[str],
+        amount: int,
+        limit: int = 50000,
+        advertising_threshold: int = 40000
+    ) -> QuotaReservation:
+        """
+        Valida y reserva amount unidades en varios contadores de forma atómica.
+
+        Lee todos los contadores con un solo get_all dentro de una transacción y solo
+        los incrementa si ninguno supera el límite, así dos requests concurrentes no
+        pueden pasar la validación a la vez y superar el límite entre ambos.
+
+        Con contadores shardeados la transacción lee todos los shards (para sumar) pero
+        escribe en uno solo; como cualquier escritura en un shard invalida las demás
+        transacciones en curso, solo se usa con QuotaLeaser (una reserva por bloque).
+
+        Args:
+            collection: Nombre de la colección en Firebase
+            documents: Documentos contador a validar e incrementar
+            amount: Unidades a reservar en cada contador
+            limit: Límite máximo de cada contador
+            advertising_threshold: Umbral de advertencia de cada contador
+        Returns:
+            QuotaReservation indicando si se reservó y qué límite o umbral se superó
+        """
+        references = []
+        documents_by_path = {}
+        for document_name in documents:
+            for reference in self._counter_references(collection, document_name):
+                references.append(reference)
+                documents_by_path[reference.path] = document_name
+
+        @firestore.transactional
+        def reserve_in_transaction(transaction) -> QuotaReservation:
+            current_counts = self._sum_counts(transaction.get_all(references), documents_by_path)
+            new_counts = {document_name: current_counts.get(document_name, 0) + amount for document_name in documents}
+            limit_exceeded = [document_name for document_name in documents if new_counts[document_name] > limit]
+            threshold_exceeded = [document_name for document_name in documents if new_counts[document_name] > advertising_threshold]
+
+            if limit_exceeded:
+                return QuotaReservation(
+                    reserved=False,
+                    amount=amount,
+                    counts={document_name: current_counts.get(document_name, 0) for document_name in documents},
+                    limit_exceeded=limit_exceeded,
+                    threshold_exceeded=threshold_exceeded,
+                )
+
+            for document_name in documents:
+                transaction.set(
+                    self._increment_reference(collection, document_name),
+                    {'count': firestore.Increment(amount)},
+                    merge=True
+                )
+            return QuotaReservation(
+                reserved=True,
+                amount=amount,
+                counts=new_counts,
+                threshold_exceeded=threshold_exceeded,
+            )
+
+        try:
+            reservation = reserve_in_transaction(self.db.transaction())
+        except Exception as error:
+            logger.error("❌ Error reservando cuota en Firebase: %s", error)
+            raise
+
+        if reservation.limit_exceeded:
+            logger.error(
+                "LÍMITE EXCEDIDO: reservar %s superaría el límite (%s) en %s. Contadores actuales: %s",
+                amount, limit, reservation.limit_exceeded, reservation.counts
+            )
+        elif reservation.threshold_exceeded:
+            logger.warning(
+                "⚠️ UMBRAL DE ADVERTISING SUPERADO en %s (%s). Contadores: %s",
+                reservation.threshold_exceeded, advertising_threshold, reservation.counts
+            )
+        return reservation
+
+    @timed("firestore")
+    def release_quota(self, collection: str, documents: List[str], amount: int) -> None:
+        """Devuelve amount unidades reservadas y no usadas a cada contador, en un solo batch"""
+        if amount <= 0:
+            return
+        batch = self.db.batch()
+        for document_name in documents:
+            batch.set(self._increment_reference(collection, document_name), {'count': firestore.Increment(-amount)}, merge=True)
+        batch.commit()
+        logger.info("Devueltas %s unidades de cuota a %s en %s", amount, documents, collection)
@@ -0,0 +1,75 @@
+"""
+Configuración de gunicorn, tomada de Config.
+
+Los clientes de Google (gRPC) no son fork-safe: el master solo importa la app y
+cada worker crea sus propios clientes después del fork (post_fork). Al recibir
+SIGTERM, gunicorn deja de aceptar conexiones, la app rechaza con 503 los requests
+que aún lleguen (conexiones keep-alive), termina los que están en curso y en
+worker_exit se vacían los pendientes (Pub/Sub, MERGE, cuota, Slack).
+"""
+import logging
+import signal
+
+from config import Config
+
+bind = f"{Config.FLASK_HOST}:{Config.PORT}"
+workers = Config.GUNICORN_WORKERS
+threads = Config.GUNICORN_THREADS
+worker_class = "gthread"
+timeout = Config.REQUEST_TIMEOUT
+# El request más largo posible: REQUEST_TIMEOUT o la suma de las etapas de /contacts/enrichment
+# (lookup, encode, quota_check, reserve, schedule y dispatch)
+longest_request_seconds = max(
+    Config.REQUEST_TIMEOUT,
+    Config.ENRICHMENT_LOOKUP_TIMEOUT + Config.ENRICHMENT_ENCODE_TIMEOUT
+    + 3 * Config.ENRICHMENT_QUOTA_TIMEOUT + Config.ENRICHMENT_DISPATCH_TIMEOUT
+)
+# Tiempo que se le da a los requests en curso tras SIGTERM: el más largo posible, pero
+# nunca más de lo que Cloud Run espera antes del SIGKILL (con 1s de margen)
+graceful_timeout = Config.GUNICORN_GRACEFUL_TIMEOUT or int(min(
+    longest_request_seconds, Config.CLOUD_RUN_TERMINATION_SECONDS - 1
+))
+keepalive = 5
+
+# La app se importa una vez en el master (arranque más rápido y memoria compartida);
+# los clientes se crean perezosamente en cada worker
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+
+
+def post_fork(server, worker):
+    from wsgi import services
+
+    # El registry ya se resetea con os.register_at_fork; se repite por si el master
+    # llegó a crear algún cliente antes del fork
+    services.reset()
+    if Config.WARMUP_ON_START:
+        warm = services.warm_up()
+        server.log.info("Worker %s inicializado: %s", worker.pid, warm)
+
+
+def post_worker_init(worker):
+    from wsgi import begin_shutdown
+
+    # gunicorn ya instaló su handler de SIGTERM (init_signals): se encadena el de la app
+    gunicorn_handler = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        begin_shutdown()
+        gunicorn_handler(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
+def worker_exit(server, worker):
+    from logging_setup import stop_logging
+    from wsgi import shutdown_services
+
+    server.log.info("Worker %s terminando, vaciando pendientes", worker.pid)
+    shutdown_services()
+    # Escribe lo que quede en la cola de logs antes de cerrar los handlers
+    stop_logging()
+    logging.shutdown()
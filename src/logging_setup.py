@@ -0,0 +1,233 @@
+"""
+Logging estructurado y no bloqueante.
+
+- Los handlers del request solo encolan el registro (QueueHandler); un hilo aparte
+  (QueueListener) lo serializa a JSON y lo escribe en stdout, así la E/S no corre en
+  el hilo del request. Si la cola se llena el registro se descarta en lugar de
+  bloquear, y se informa cuántos se perdieron.
+- JSON de una línea con "severity" y "message" (formato que Cloud Logging reconoce),
+  más los campos pasados en extra={...}.
+- Truncado por campo: los argumentos grandes (strings, listas, dicts) se resumen
+  antes de formatear el mensaje, de modo que un log accidental de un payload no
+  cuesta megabytes de formateo.
+- Muestreo por logger de los registros DEBUG (p. ej. payloads completos):
+  LOG_DEBUG_SAMPLING="main=0.01,enrichment_pipeline=0.1".
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from serialization import dumps
+
+# Atributos propios de LogRecord: todo lo demás viene de extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+def truncate_value(value, max_chars: int, max_items: int):
+    """Versión acotada de value para loguear: strings cortados y colecciones resumidas"""
+    if isinstance(value, str):
+        if len(value) > max_chars:
+            return f"{value[:max_chars]}…(+{len(value) - max_chars} caracteres)"
+        return value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        if len(value) > max_items:
+            return f"<{type(value).__name__} de {len(value)} elementos>"
+        return [truncate_value(item, max_chars, max_items) for item in value]
+    if isinstance(value, dict):
+        if len(value) > max_items:
+            return f"<dict de {len(value)} claves>"
+        return {str(key): truncate_value(item, max_chars, max_items) for key, item in value.items()}
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea con severity, message, logger y los campos extra"""
+
+    def __init__(self, max_field_chars: int = 2000, max_items: int = 50) -> None:
+        super().__init__()
+        self.max_field_chars = max_field_chars
+        self.max_items = max_items
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": truncate_value(record.getMessage(), self.max_field_chars, self.max_items),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                value = truncate_value(value, self.max_field_chars, self.max_items)
+                entry[key] = value if isinstance(value, (str, int, float, bool, list, dict, type(None))) else str(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return dumps(entry).decode("utf-8")
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los DEBUG de cada logger (por prefijo de nombre)"""
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        # Prefijos más largos primero: "main.x" gana sobre "main"
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return random.random() < rate
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca bloquea el hilo del request. A diferencia del handler
+    estándar no formatea el registro aquí: solo resume los argumentos grandes y
+    resuelve el mensaje; la serialización a JSON la hace el QueueListener.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_field_chars: int = 2000, max_items: int = 50) -> None:
+        super().__init__(log_queue)
+        self.max_field_chars = max_field_chars
+        self.max_items = max_items
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, dict):
+            record.args = {key: truncate_value(arg, self.max_field_chars, self.max_items) for key, arg in record.args.items()}
+        elif record.args:
+            record.args = tuple(truncate_value(arg, self.max_field_chars, self.max_items) for arg in record.args)
+        # Se resuelve ya el mensaje: los argumentos podrían cambiar antes de que el listener lo lea
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _DroppedRecordsReporter(logging.Handler):
+    """Informa en el propio stream de salida cuántos registros se descartaron por cola llena"""
+
+    def __init__(self, queue_handler: BoundedQueueHandler, target: logging.Handler) -> None:
+        super().__init__()
+        self.queue_handler = queue_handler
+        self.target = target
+        self._reported = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        dropped = self.queue_handler.dropped
+        if dropped > self._reported:
+            warning = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "⚠️ Cola de logs llena: %d registros descartados", (dropped - self._reported,), None
+            )
+            self._reported = dropped
+            self.target.handle(warning)
+
+
+class _LoggingPipeline:
+    def __init__(self, handler: logging.Handler, queue_size: int, max_field_chars: int, max_items: int, sampling: Dict[str, float]) -> None:
+        self.handler = handler
+        self.queue_size = queue_size
+        self.queue_handler = BoundedQueueHandler(queue.Queue(queue_size), max_field_chars, max_items)
+        if sampling:
+            self.queue_handler.addFilter(DebugSamplingFilter(sampling))
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            reporter = _DroppedRecordsReporter(self.queue_handler, self.handler)
+            self.listener = logging.handlers.QueueListener(
+                self.queue_handler.queue, reporter, self.handler, respect_handler_level=True
+            )
+            self.listener.start()
+
+    def stop(self) -> None:
+        """Vacía la cola y detiene el hilo de escritura"""
+        with self._lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+        self.handler.flush()
+
+    def restart_after_fork(self) -> None:
+        # El hilo del listener no sobrevive al fork y la cola puede haber quedado con
+        # su lock tomado: el hijo arranca con cola y listener nuevos
+        self.queue_handler.queue = queue.Queue(self.queue_size)
+        self._lock = threading.Lock()
+        self.listener = None
+        self.start()
+
+
+_pipeline: Optional[_LoggingPipeline] = None
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """"main=0.01,enrichment_pipeline=0.1" -> {"main": 0.01, "enrichment_pipeline": 0.1}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(
+    level: str = "INFO",
+    json_format: bool = True,
+    max_field_chars: int = 2000,
+    max_items: int = 50,
+    queue_size: int = 10000,
+    debug_sampling: Optional[Dict[str, float]] = None,
+) -> None:
+    """
+    Configura el logger raíz: QueueHandler en los hilos de la app y un QueueListener
+    que escribe en stdout (JSON o texto). Idempotente: una segunda llamada no hace nada.
+    """
+    global _pipeline
+    if _pipeline is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if json_format:
+        stream_handler.setFormatter(JsonFormatter(max_field_chars, max_items))
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    _pipeline = _LoggingPipeline(stream_handler, queue_size, max_field_chars, max_items, debug_sampling or {})
+    _pipeline.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_pipeline.queue_handler)
+    root.setLevel(level.upper())
+
+    atexit.register(stop_logging)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_pipeline.restart_after_fork)
+
+
+def stop_logging() -> None:
+    """Escribe lo que quede en la cola (al cerrar el worker)"""
+    if _pipeline is not None:
+        _pipeline.stop()
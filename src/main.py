@@ -1,27 +1,38 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from config import Config
 import logging
-from bigquery_services import BigQueryService
-from pub_sub_services import PubSubService
-from firebase_services import FirestoreService
-from slack_service import SlackService
+from logging_setup import parse_sampling, setup_logging
+from service_errors import CompanyStatusBufferFullError, PublishBackpressureError
 import time 
+import threading
 
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from functools import wraps
-from cloud_tasks import CloudTasks
+from concurrent.futures import ThreadPoolExecutor
+from service_registry import ServiceRegistry
+from chunker import MAX_PAYLOAD_BYTES
+from enrichment_pipeline import EnrichmentStageTimeout
+from enrichment_batcher import EnrichmentBatcherFullError
+import metrics
+from serialization import dumps
 import json
+import base64
+from typing import Optional
+
+
+def has_valid_api_key(request) -> bool:
+    # La API Key se espera en el encabezado 'X-API-Key'
+    key_from_request = request.headers.get('X-API-Key')
+
+    # Compara la clave de la solicitud con la clave almacenada
+    return bool(key_from_request) and key_from_request == Config.API_KEY
 
 
 def require_api_key(func):
     @wraps(func)
     def decorated_function(*args, **kwargs):
-        # La API Key se espera en el encabezado 'X-API-Key'
-        key_from_request = request.headers.get('X-API-Key')
-        
-        # Compara la clave de la solicitud con la clave almacenada
-        if key_from_request and key_from_request == Config.API_KEY:
+        if has_valid_api_key(request):
             return func(*args, **kwargs)
         else:
             return jsonify({"error": "Unauthorized"}), 401
@@ -29,9 +40,16 @@ def require_api_key(func):
 
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Una configuración inválida debe impedir el arranque, no fallar en el primer request
+Config.validate()
+
+setup_logging(
+    level=Config.LOG_LEVEL,
+    json_format=Config.LOG_FORMAT == "json",
+    max_field_chars=Config.LOG_MAX_FIELD_CHARS,
+    max_items=Config.LOG_MAX_ITEMS,
+    queue_size=Config.LOG_QUEUE_SIZE,
+    debug_sampling=parse_sampling(Config.LOG_DEBUG_SAMPLING)
 )
 logger = logging.getLogger(__name__)
 
@@ -39,46 +57,407 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Habilitar CORS para requests cross-origin
 
-bigquery_service = None
-pub_sub_services = None
-cloud_tasks_service = None
+services = ServiceRegistry()
+
+# Los módulos de servicio (y con ellos los clientes de Google Cloud, gRPC y Slack)
+# se importan dentro de cada fábrica: el arranque del worker solo paga Flask y la
+# configuración, y cada cliente se carga la primera vez que un request lo necesita.
+
+
+def _build_bigquery():
+    from bigquery_services import BigQueryService
+    return BigQueryService(
+        project=Config.GOOGLE_CLOUD_PROJECT_ID,
+        dataset=Config.BIGQUERY_DATASET
+    )
+
+
+def _build_pubsub():
+    from pub_sub_services import PubSubService
+    return PubSubService(
+        project_id=Config.GOOGLE_CLOUD_PROJECT_ID,
+        max_messages=Config.PUBSUB_BATCH_MAX_MESSAGES,
+        max_bytes=Config.PUBSUB_BATCH_MAX_BYTES,
+        max_latency=Config.PUBSUB_BATCH_MAX_LATENCY,
+        flow_control_max_messages=Config.PUBSUB_FLOW_CONTROL_MAX_MESSAGES,
+        flow_control_max_bytes=Config.PUBSUB_FLOW_CONTROL_MAX_BYTES,
+        flow_control_behavior=Config.PUBSUB_FLOW_CONTROL_BEHAVIOR
+    )
+
+
+def _build_cloud_tasks():
+    from cloud_tasks import CloudTasks
+    return CloudTasks(
+        project=Config.GOOGLE_CLOUD_PROJECT_ID,
+        location=Config.CLOUD_TASKS_LOCATION,
+        queue=Config.CLOUD_TASKS_QUEUE,
+        max_concurrency=Config.CLOUD_TASKS_MAX_CONCURRENCY,
+        dedup_ttl_seconds=Config.CLOUD_TASKS_DEDUP_TTL_SECONDS,
+        dedup_max_entries=Config.CLOUD_TASKS_DEDUP_MAX_ENTRIES
+    )
+
+
+def _build_firestore():
+    from firebase_services import FirestoreService
+    return FirestoreService(
+        project=Config.FIREBASE_PROJECT_ID,
+        database=Config.FIREBASE_DATABASE,
+        counter_shards=Config.FIREBASE_COUNTER_SHARDS
+    )
+
+
+def _build_slack():
+    from slack_service import SlackService
+    return SlackService(
+        bot_token=Config.SLACK_BOT_TOKEN,
+        channel=Config.SLACK_CHANNEL
+    )
+
+
+def _build_quota_leaser():
+    from quota_leasing import QuotaLeaser
+    return QuotaLeaser(
+        services.get("firestore"),
+        collection=Config.FIREBASE_COLLECTION,
+        documents=[Config.FIREBASE_DOCUMENT_TABLES, Config.FIREBASE_DOCUMENT_REQUEST_APOLLO, Config.FIREBASE_DOCUMENT_REQUEST_IMPORT],
+        limit=int(Config.CLAY_LIMITS),
+        advertising_threshold=int(Config.CLAY_LIMIT_ADVERTISING),
+        block_size=Config.QUOTA_LEASE_BLOCK_SIZE,
+        lease_ttl_seconds=Config.QUOTA_LEASE_TTL_SECONDS,
+        headroom_fraction=Config.QUOTA_LEASE_HEADROOM_FRACTION
+    )
+
+
+def _build_company_status_buffer():
+    from status_buffer import CompanyStatusBuffer
+    return CompanyStatusBuffer(
+        services.get("bigquery"),
+        Config.SOURCE_TABLE_NAME,
+        max_size=Config.COMPANY_STATUS_FLUSH_SIZE,
+        max_delay_seconds=Config.COMPANY_STATUS_FLUSH_SECONDS,
+        max_pending=Config.COMPANY_STATUS_MAX_PENDING
+    )
+
+
+def _build_slack_notifier():
+    from slack_notifier import SlackNotifier
+    return SlackNotifier(
+        services.get("slack"),
+        queue_size=Config.SLACK_QUEUE_SIZE,
+        coalesce_window_seconds=Config.SLACK_COALESCE_SECONDS,
+        summary_interval_seconds=Config.SLACK_SUMMARY_SECONDS
+    )
+
+
+def _build_enrichment_pipeline():
+    from enrichment_pipeline import EnrichmentPipeline
+    return EnrichmentPipeline(
+        bigquery_service=services.get("bigquery"),
+        firestore_service=services.get("firestore"),
+        cloud_tasks_service=services.get("cloud_tasks"),
+        slack_notifier=services.get("slack_notifier"),
+        executor=services.get("pipeline_executor"),
+        destination_table=Config.DESTINATION_TABLE_NAME,
+        collection=Config.FIREBASE_COLLECTION,
+        documents=[Config.FIREBASE_DOCUMENT_TABLES, Config.FIREBASE_DOCUMENT_REQUEST_APOLLO, Config.FIREBASE_DOCUMENT_REQUEST_IMPORT],
+        limit=int(Config.CLAY_LIMITS),
+        advertising_threshold=int(Config.CLAY_LIMIT_ADVERTISING),
+        webhook_url=Config.CLAY_WEBHOOK_URL,
+        webhook_headers={
+            "Content-type": "application/json",
+            f'{Config.CLAY_WEBHOOK_HEADER}': f'{Config.CLAY_WEBHOOK_KEY}'
+        },
+        max_payload_bytes=MAX_PAYLOAD_BYTES,
+        quota_leaser=services.get("quota_leaser") if Config.QUOTA_LEASE_ENABLED else None,
+        dispatch_scheduler=(
+            services.get("dispatch_scheduler")
+            if Config.DISPATCH_RATE_CHUNKS_PER_SECOND > 0 or Config.DISPATCH_WEBHOOK_RATES
+            else None
+        ),
+        stage_timeouts={
+            "lookup": Config.ENRICHMENT_LOOKUP_TIMEOUT,
+            "encode": Config.ENRICHMENT_ENCODE_TIMEOUT,
+            "quota_check": Config.ENRICHMENT_QUOTA_TIMEOUT,
+            "reserve": Config.ENRICHMENT_QUOTA_TIMEOUT,
+            "schedule": Config.ENRICHMENT_QUOTA_TIMEOUT,
+            "dispatch": Config.ENRICHMENT_DISPATCH_TIMEOUT
+        }
+    )
+
+
+def _build_enrichment_batcher():
+    from enrichment_batcher import EnrichmentBatcher
+    return EnrichmentBatcher(
+        services.get("enrichment_pipeline"),
+        max_delay_seconds=Config.ENRICHMENT_BATCH_MAX_DELAY_SECONDS,
+        max_buffered_contacts=Config.ENRICHMENT_BATCH_MAX_CONTACTS,
+        batch_ttl_seconds=Config.ENRICHMENT_BATCH_TTL_SECONDS,
+        status_store=(
+            services.get("enrichment_batch_status")
+            if Config.ENRICHMENT_BATCH_STATUS_BACKEND == "firestore"
+            else None
+        )
+    )
+
 
+def _build_enrichment_batch_status():
+    from batch_status import FirestoreBatchStatusStore
+    return FirestoreBatchStatusStore(
+        services.get("firestore").db,
+        Config.ENRICHMENT_BATCH_STATUS_COLLECTION,
+        ttl_seconds=Config.ENRICHMENT_BATCH_TTL_SECONDS
+    )
 
-def get_services():
-    try: 
-        # Inicializar BigQuery service
-        bigquery_service = BigQueryService(
-            project=Config.GOOGLE_CLOUD_PROJECT_ID,
-            dataset=Config.BIGQUERY_DATASET
-        )
-        pub_sub_services = PubSubService(
-            project_id= Config.GOOGLE_CLOUD_PROJECT_ID
-            )
-        cloud_tasks_service = CloudTasks(
-            project=Config.GOOGLE_CLOUD_PROJECT_ID,
-            location=Config.CLOUD_TASKS_LOCATION,
-            queue=Config.CLOUD_TASKS_QUEUE
+
+def _build_company_leases():
+    if Config.COMPANY_LEASE_BACKEND == "firestore":
+        from company_leases import FirestoreLeaseStore
+        return FirestoreLeaseStore(services.get("firestore").db, Config.COMPANY_LEASE_COLLECTION)
+    from company_leases import InMemoryLeaseStore
+    return InMemoryLeaseStore()
+
+
+
+def _build_dispatch_scheduler():
+    if Config.DISPATCH_SCHEDULER_BACKEND == "firestore":
+        from dispatch_scheduler import FirestoreDispatchScheduler
+        return FirestoreDispatchScheduler(
+            services.get("firestore").db,
+            Config.DISPATCH_SCHEDULER_COLLECTION,
+            Config.DISPATCH_RATE_CHUNKS_PER_SECOND,
+            Config.DISPATCH_WEBHOOK_RATES
         )
+    from dispatch_scheduler import InMemoryDispatchScheduler
+    return InMemoryDispatchScheduler(Config.DISPATCH_RATE_CHUNKS_PER_SECOND, Config.DISPATCH_WEBHOOK_RATES)
+
+
+def _build_request_profiler():
+    from profiling import RequestProfiler
+    return RequestProfiler(
+        sample_rate=Config.PROFILE_SAMPLE_RATE,
+        top_n=Config.PROFILE_TOP_N,
+        max_reports=Config.PROFILE_MAX_REPORTS
+    )
+
+services.register("bigquery", _build_bigquery)
+services.register("pubsub", _build_pubsub)
+services.register("cloud_tasks", _build_cloud_tasks)
+services.register("firestore", _build_firestore)
+services.register("slack", _build_slack)
+services.register("quota_leaser", _build_quota_leaser, required=False)
+services.register("company_status_buffer", _build_company_status_buffer, required=False)
+services.register("slack_notifier", _build_slack_notifier, required=False)
+services.register("pipeline_executor", lambda: ThreadPoolExecutor(
+    max_workers=Config.ENRICHMENT_PIPELINE_WORKERS,
+    thread_name_prefix="enrichment"
+), required=False)
+services.register("enrichment_pipeline", _build_enrichment_pipeline, required=False)
+services.register("enrichment_batcher", _build_enrichment_batcher, required=False)
+services.register("enrichment_batch_status", _build_enrichment_batch_status, required=False)
+services.register("company_leases", _build_company_leases, required=False)
+services.register("dispatch_scheduler", _build_dispatch_scheduler, required=False)
+services.register("request_profiler", _build_request_profiler, required=False)
 
-        logger.info("✅ Servicios inicializados correctamente")
+def get_services():
+    """Retorna las instancias compartidas del worker (se crean una sola vez por proceso)"""
+    try:
+        bigquery_service = services.get("bigquery")
+        pub_sub_services = services.get("pubsub")
+        cloud_tasks_service = services.get("cloud_tasks")
     except Exception as e:
-        logger.error(f"❌ Error inicializando servicios: {e}")
+        logger.error("❌ Error inicializando servicios: %s", e)
         raise
 
     return bigquery_service , pub_sub_services, cloud_tasks_service
 
 def get_cloud_tasks_service():
     try:
-        cloud_tasks_service = CloudTasks(
-            project=Config.GOOGLE_CLOUD_PROJECT_ID,
-            location=Config.CLOUD_TASKS_LOCATION,
-            queue=Config.CLOUD_TASKS_QUEUE
-        )
-        return cloud_tasks_service
+        return services.get("cloud_tasks")
     except Exception as e:
-        logger.error(f"❌ Error inicializando Cloud Tasks: {e}")
+        logger.error("❌ Error inicializando Cloud Tasks: %s", e)
         raise
 
+def shutdown_services(timeout: float = None):
+    """
+    Vacía lo pendiente de los servicios ya inicializados antes de que el worker
+    termine (SIGTERM de Cloud Run / gunicorn): contactos en el acumulador de
+    enriquecimiento, MERGE pendiente, mensajes de Pub/Sub sin confirmar, cuota local
+    no usada y notificaciones de Slack; al final cierra los executors compartidos
+    (Cloud Tasks y pipeline).
+
+    timeout es el total para todos los pasos: cada uno recibe lo que queda del plazo.
+    """
+    timeout = Config.SHUTDOWN_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    steps = [
+        # Primero: su flush todavía usa la cuota local, Cloud Tasks y el executor del pipeline
+        ("enrichment_batcher", lambda service, remaining: service.close(remaining)),
+        ("company_status_buffer", lambda service, remaining: service.close(remaining)),
+        ("pubsub", lambda service, remaining: service.drain(remaining)),
+        ("quota_leaser", lambda service, remaining: service.release()),
+        ("slack_notifier", lambda service, remaining: service.close(remaining)),
+        ("cloud_tasks", lambda service, remaining: service.close()),
+        ("pipeline_executor", lambda service, remaining: service.shutdown(wait=False)),
+    ]
+    for name, close in steps:
+        if not services.is_warm(name):
+            continue
+        try:
+            close(services.get(name), max(0.0, deadline - time.monotonic()))
+            logger.info("✅ Servicio %s cerrado correctamente", name)
+        except Exception as e:
+            logger.error("❌ Error cerrando servicio %s: %s", name, e)
+
+def build_contact_message(data: dict) -> dict:
+    """Normaliza un contacto recibido al formato de la tabla de contactos"""
+    return {
+        "biz_name": data.get("biz_name",""),
+        "biz_identifier": data.get("biz_identifier",""),
+        "full_name": data.get("full_name",""),
+        "role": data.get("role",""),
+        "phone_number": data.get("phone_number",""),
+        "cat": data.get("cat",""),
+        "web_linkedin_url": data.get("web_linkedin_url",""),
+        "src_scraped_dt": int(datetime.now().timestamp() * 1000000),
+        "src_scraped_name": data.get("src_scraped_name",""),
+        "phone_flg": int(data.get("phone_exists", False)),
+    }
+
+def parse_contacts_batch(request) -> list:
+    """
+    Obtiene la lista de contactos del body: arreglo JSON, objeto {"contacts": [...]}
+    o NDJSON (un contacto por línea, Content-Type application/x-ndjson)
+    """
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        data = [
+            json.loads(line)
+            for line in request.get_data(as_text=True).splitlines()
+            if line.strip()
+        ]
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("contacts")
+
+    if not isinstance(data, list) or not all(isinstance(contact, dict) for contact in data):
+        raise ValueError("El body debe ser un arreglo de contactos o {\"contacts\": [...]}")
+    return data
+
+def wants_ndjson(request) -> bool:
+    """True si el cliente pidió NDJSON con ?format=ndjson o con el header Accept"""
+    if request.args.get("format", "").lower() == "ndjson":
+        return True
+    return request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson"
+
+def json_response(body, status_code: int = 200) -> Response:
+    """Como jsonify, pero serializado con serialization.dumps (orjson si está instalado)"""
+    return Response(dumps(body), status=status_code, mimetype="application/json")
+
+def encode_cursor(biz_identifier: str) -> str:
+    """Cursor opaco para la siguiente página del feed de empresas"""
+    return base64.urlsafe_b64encode(dumps({"after": biz_identifier})).decode("ascii")
+
+def decode_cursor(cursor: str) -> str:
+    """Retorna el biz_identifier del cursor; ValueError si el cursor no es válido"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(payload["after"])
+    except Exception as error:
+        raise ValueError(f"Cursor inválido: {cursor}") from error
+
+def claim_companies(bigquery_service, lease_store, worker_id: str, batch_size: int, after_identifier: Optional[str]):
+    """
+    Reserva hasta batch_size empresas no scrapeadas para worker_id.
+
+    Pide a BigQuery COMPANY_LEASE_OVERFETCH_FACTOR veces batch_size filas y las va
+    reservando en tramos de lo que falta; las que ya tienen lease de otro scraper (o
+    están completadas) se saltan y, si no se llena el lote, se consulta el siguiente
+    tramo del keyspace, como máximo COMPANY_LEASE_MAX_ROUNDS consultas. Así los
+    scrapers concurrentes no se quedan con lotes casi vacíos y la consulta no depende
+    de cuántos leases haya activos.
+
+    Returns:
+        (empresas reservadas, biz_identifier de la última fila examinada o None si
+        ya no quedan empresas después de ella)
+    """
+    fetch_size = batch_size * Config.COMPANY_LEASE_OVERFETCH_FACTOR
+    claimed_rows = []
+    last_examined = None
+    for _ in range(Config.COMPANY_LEASE_MAX_ROUNDS):
+        try:
+            rows = list(bigquery_service.obtener_empresas_no_scrapeadas_batch(
+                fetch_size, Config.SOURCE_TABLE_NAME, after_identifier=after_identifier
+            ))
+        except Exception:
+            if not claimed_rows:
+                raise
+            # Lo ya reservado se entrega: descartarlo dejaría esos leases sin usar hasta el TTL
+            logger.warning("⚠️ Error consultando más empresas para %s; se entregan %s reservadas", worker_id, len(claimed_rows))
+            return claimed_rows, last_examined
+
+        position = 0
+        while position < len(rows) and len(claimed_rows) < batch_size:
+            candidates = rows[position:position + batch_size - len(claimed_rows)]
+            claimed = set(lease_store.claim(
+                worker_id,
+                [company["biz_identifier"] for company in candidates],
+                Config.COMPANY_LEASE_TTL_SECONDS
+            ))
+            claimed_rows.extend(company for company in candidates if company["biz_identifier"] in claimed)
+            position += len(candidates)
+
+        if position:
+            last_examined = after_identifier = rows[position - 1]["biz_identifier"]
+        if len(rows) < fetch_size and position == len(rows):
+            # Se examinó todo lo que queda en la tabla
+            return claimed_rows, None
+        if len(claimed_rows) >= batch_size:
+            break
+    return claimed_rows, last_examined
+
+def companies_query_error(error_message, cursor: Optional[str], start_time: float):
+    """
+    503 para un error de BigQuery en GET /companies: el cliente debe reintentar con el
+    mismo cursor (un 200 con data=[] se confundiría con el fin de la paginación).
+    """
+    logger.error("❌ Error consultando empresas no scrapeadas en BigQuery: %s", error_message)
+    return jsonify({
+        "success": False,
+        "error": f"Error consultando BigQuery: {error_message}",
+        "retry": True,
+        "cursor": cursor,
+        "time_taken": time.time() - start_time,
+        "timestamp": datetime.now().isoformat()
+    }), 503
+
+def stream_ndjson(rows, page_size: Optional[int] = None):
+    """
+    Serializa cada fila como una línea JSON sin acumular el resultado en memoria.
+    Con page_size (solo si el cliente pagina con ?cursor=) y una página completa,
+    agrega una última línea {"next_cursor": "..."}.
+    """
+    count = 0
+    last_identifier = None
+    try:
+        for row in rows:
+            count += 1
+            last_identifier = row.get("biz_identifier")
+            yield dumps(row) + b"\n"
+    except Exception as error_message:
+        # Los headers ya se enviaron: solo se puede cortar el stream y registrar el error
+        logger.error("❌ Error transmitiendo resultados NDJSON tras %s filas: %s", count, error_message)
+        raise
+    if page_size and count >= page_size and last_identifier is not None:
+        yield dumps({"next_cursor": encode_cursor(last_identifier)}) + b"\n"
+    logger.info("✅ Filas transmitidas en NDJSON: %s", count)
+
+def wants_batching(request) -> bool:
+    """Modo acumulador de /contacts/enrichment: ?batch=1 / ?batch=0, o el default de Config"""
+    flag = request.args.get("batch")
+    if flag is None:
+        return Config.ENRICHMENT_BATCHING_DEFAULT
+    return flag.lower() in ("1", "true")
+
 def validate_request_data(request):
     if not request.is_json:
         return jsonify({
@@ -90,9 +469,179 @@ def validate_request_data(request):
 
 
 
+# SIGTERM recibido (gunicorn.conf.py): los requests nuevos se rechazan y los que están
+# en curso tienen hasta graceful_timeout para terminar
+shutdown_started = threading.Event()
+
+# Probes que siguen respondiendo durante el cierre
+SHUTDOWN_ALLOWED_PATHS = ("/status", "/metrics")
+
+def begin_shutdown() -> None:
+    """Marca el inicio del cierre del worker; lo llama el handler de SIGTERM"""
+    if not shutdown_started.is_set():
+        shutdown_started.set()
+        logger.info("Cierre del worker iniciado: se rechazan los requests nuevos")
+
+@app.before_request
+def reject_during_shutdown():
+    """
+    Tras SIGTERM un request nuevo no alcanzaría a terminar antes del SIGKILL de Cloud
+    Run (p. ej. un enriquecimiento que ya reservó cuota): se responde 503 para que el
+    cliente lo reintente en otra instancia.
+    """
+    if not shutdown_started.is_set() or request.path in SHUTDOWN_ALLOWED_PATHS:
+        return None
+    response = jsonify({
+        "success": False,
+        "error": "La instancia se está cerrando, reintentar el request",
+        "retry": True,
+        "timestamp": datetime.now().isoformat()
+    })
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+def profile_requested(request) -> bool:
+    """Perfilado explícito: header X-Profile o ?profile=1, solo con API key válida"""
+    flag = request.headers.get("X-Profile") or request.args.get("profile")
+    if not flag or flag.lower() not in ("1", "true"):
+        return False
+    return has_valid_api_key(request)
+
+@app.before_request
+def start_request_profile():
+    requested = profile_requested(request)
+    if not requested and Config.PROFILE_SAMPLE_RATE <= 0:
+        return
+    profiler = services.get("request_profiler")
+    reason = profiler.should_profile(requested)
+    if reason is None:
+        return
+    profile = profiler.start()
+    if profile is None:
+        logger.info("Profiler ocupado, %s %s corre sin perfilar", request.method, request.path)
+        return
+    g.profile = (profile, reason, time.perf_counter())
+
+@app.after_request
+def stop_request_profile(response):
+    profile_state = g.pop("profile", None)
+    if profile_state is not None:
+        profile, reason, started = profile_state
+        profile_id = services.get("request_profiler").stop(
+            profile, request.method, request.path, reason, time.perf_counter() - started
+        )
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+@app.teardown_request
+def discard_request_profile(error=None):
+    # Si el request terminó en una excepción no manejada after_request no corre:
+    # se detiene igual para liberar el profiler
+    profile_state = g.pop("profile", None)
+    if profile_state is not None:
+        profile, reason, started = profile_state
+        services.get("request_profiler").stop(
+            profile, request.method, request.path, reason, time.perf_counter() - started
+        )
+
+@app.route("/debug/profiles", methods=['GET'])
+@require_api_key
+def list_request_profiles():
+    """Perfiles guardados en este worker (sin el reporte), del más reciente al más antiguo"""
+    return jsonify({
+        "success": True,
+        "data": services.get("request_profiler").summaries(),
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+@app.route("/debug/profiles/<string:profile_id>", methods=['GET'])
+@require_api_key
+def get_request_profile(profile_id):
+    """Reporte top-N de un perfil (texto de pstats, ordenado por tiempo acumulado)"""
+    report = services.get("request_profiler").get(profile_id)
+    if report is None:
+        return jsonify({
+            "success": False,
+            "error": f"Perfil no encontrado: {profile_id}",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    return Response(report["report"], mimetype="text/plain")
+
+@app.route("/admin/counters/migrate", methods=['POST'])
+@require_api_key
+def migrate_quota_counters():
+    """
+        Migra los contadores de cuota a FIREBASE_COUNTER_SHARDS shards: mueve el count
+        del documento base al shard 0 y crea los demás en cero. Es idempotente; se
+        ejecuta una vez después de subir FIREBASE_COUNTER_SHARDS.
+    """
+    if Config.FIREBASE_COUNTER_SHARDS <= 1:
+        return jsonify({
+            "success": False,
+            "error": "FIREBASE_COUNTER_SHARDS debe ser mayor a 1 para migrar los contadores",
+            "timestamp": datetime.now().isoformat()
+        }), 400
+    try:
+        firestore_service = services.get("firestore")
+        documents = [Config.FIREBASE_DOCUMENT_TABLES, Config.FIREBASE_DOCUMENT_REQUEST_APOLLO, Config.FIREBASE_DOCUMENT_REQUEST_IMPORT]
+        moved = {
+            document_name: firestore_service.migrate_counter_to_shards(Config.FIREBASE_COLLECTION, document_name)
+            for document_name in documents
+        }
+    except Exception as error_message:
+        logger.error("❌ Error migrando contadores a shards: %s", error_message)
+        return jsonify({
+            "success": False,
+            "error": f"Error interno del servidor: {error_message}",
+            "timestamp": datetime.now().isoformat()
+        }), 500
+    return jsonify({
+        "success": True,
+        "shards": Config.FIREBASE_COUNTER_SHARDS,
+        "moved": moved,
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
 @app.route("/status", methods=['GET'])
 def health_check():
-    return {"status": "OK"}
+    """
+        Probe de readiness: indica si cada cliente compartido ya está inicializado.
+        Con ?warmup=true inicializa los que falten antes de responder.
+    """
+    if request.args.get("warmup", "false").lower() == "true":
+        services.warm_up()
+
+    services_status = services.status()
+    response = {
+        "status": "OK",
+        "ready": services.is_ready(),
+        "services": services_status
+    }
+    if services.is_warm("company_status_buffer"):
+        response["company_status_buffer"] = services.get("company_status_buffer").stats()
+    return response
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+    """
+        Métricas del worker en formato de texto de Prometheus: latencia de cada
+        llamada externa (BigQuery, Pub/Sub, Cloud Tasks, Firestore, Slack), de cada
+        etapa de /contacts/enrichment y contadores de chunks, contactos ya scrapeados
+        y rechazos por cuota.
+    """
+    for name, service_status in services.status().items():
+        metrics.SERVICE_WARM.set(1 if service_status["warm"] else 0, service=name)
+    if services.is_warm("company_status_buffer"):
+        buffer_stats = services.get("company_status_buffer").stats()
+        for field in ("pending", "flushes", "failed_flushes", "rows_flushed"):
+            metrics.COMPANY_STATUS_BUFFER.set(buffer_stats[field], field=field)
+    if services.is_warm("pubsub"):
+        metrics.PUBSUB_PENDING_MESSAGES.set(services.get("pubsub").pending_count())
+    if services.is_warm("quota_leaser"):
+        metrics.QUOTA_LEASE_REMAINING.set(services.get("quota_leaser").remaining())
+    if services.is_warm("enrichment_batcher"):
+        metrics.ENRICHMENT_BATCHER_BUFFERED.set(services.get("enrichment_batcher").buffered_count())
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/companies", methods=['GET'])
 def get_companies_from_bigquery():
@@ -104,6 +653,23 @@ def get_companies_from_bigquery():
                 'biz_identifier': str
             }
         ]
+
+        Con ?format=ndjson o "Accept: application/x-ndjson" la respuesta se transmite
+        como NDJSON (una empresa por línea) sin cargar el resultado completo en memoria.
+
+        Paginación: la respuesta JSON siempre incluye "next_cursor". En NDJSON la línea
+        final {"next_cursor": "..."} solo se agrega si el request trae el parámetro
+        cursor (vacío en la primera página: ?format=ndjson&cursor=), así los clientes
+        que no paginan reciben solo líneas de empresas. Si la consulta a BigQuery falla
+        la respuesta es 503 con "retry": true y el mismo "cursor": se reintenta con él.
+
+        Con ?worker_id=<id> (o el header X-Worker-Id) cada llamada reserva un lote
+        disjunto de empresas para ese scraper durante COMPANY_LEASE_TTL_SECONDS; el
+        lease se renueva o completa con PATCH /companies/<biz_identifier> y, si expira,
+        la empresa vuelve al pool. En este modo next_cursor apunta a la última fila
+        examinada, no a la última entregada: avanza también sobre las empresas que
+        tenía reservadas otro scraper. Si ese lease expira, la empresa queda detrás
+        del cursor y se recupera al volver a pedir sin cursor.
         """
     start_time = time.time()
     
@@ -113,27 +679,90 @@ def get_companies_from_bigquery():
 """
         #data = request.get_json()
         #batch_size = data.get('batch_size', 1000)
-        batch_size = request.args.get('batch_size', 1000)
+        batch_size = request.args.get('batch_size', 1000, type=int)
+        worker_id = request.args.get('worker_id') or request.headers.get('X-Worker-Id')
+        cursor = request.args.get('cursor')
+        # ?cursor= (aunque vacío) indica que el cliente pagina y espera la línea next_cursor en NDJSON
+        paginated = cursor is not None
+        try:
+            after_identifier = decode_cursor(cursor) if cursor else None
+        except ValueError as error_message:
+            return jsonify({
+                "success": False,
+                "error": str(error_message),
+                "timestamp": datetime.now().isoformat()
+            }), 400
         
         bigquery_service, _, _ = get_services()
-        # Obtener empresas no scrapeadas
-        companies = bigquery_service.obtener_empresas_no_scrapeadas_batch(batch_size, Config.SOURCE_TABLE_NAME)
-        
-        logger.info(f"✅ Empresas no scrapeadas obtenidas correctamente: {len(companies)}")
-        
-        # Procesa los resultados y los convierte en una lista de diccionarios.
-        results = [dict(company) for company in companies]
-        return jsonify({
+
+        if wants_ndjson(request) and not worker_id:
+            # Modo streaming: una empresa por línea a medida que se descargan las páginas
+            try:
+                companies = bigquery_service.iterar_empresas_no_scrapeadas(
+                    batch_size, Config.SOURCE_TABLE_NAME,
+                    page_size=Config.COMPANIES_STREAM_PAGE_SIZE,
+                    after_identifier=after_identifier
+                )
+            except Exception as error_message:
+                return companies_query_error(error_message, cursor, start_time)
+            return Response(
+                stream_with_context(stream_ndjson(companies, batch_size if paginated else None)),
+                mimetype="application/x-ndjson"
+            )
+
+        lease = None
+        if worker_id:
+            # Modo lease: se entregan solo las empresas que este worker logró reservar
+            lease_store = services.get("company_leases")
+            lease_store.maybe_purge_expired()
+            try:
+                results, last_examined = claim_companies(
+                    bigquery_service, lease_store, worker_id, batch_size, after_identifier
+                )
+            except Exception as error_message:
+                return companies_query_error(error_message, cursor, start_time)
+            next_cursor = encode_cursor(last_examined) if last_examined else None
+            lease = {
+                "worker_id": worker_id,
+                "ttl_seconds": Config.COMPANY_LEASE_TTL_SECONDS,
+                "expires_at": (datetime.now() + timedelta(seconds=Config.COMPANY_LEASE_TTL_SECONDS)).isoformat()
+            }
+            logger.info("✅ Empresas reservadas para %s: %s", worker_id, len(results))
+        else:
+            # Obtener empresas no scrapeadas
+            try:
+                companies = bigquery_service.obtener_empresas_no_scrapeadas_batch(
+                    batch_size, Config.SOURCE_TABLE_NAME, after_identifier=after_identifier
+                )
+            except Exception as error_message:
+                return companies_query_error(error_message, cursor, start_time)
+
+            logger.info("✅ Empresas no scrapeadas obtenidas correctamente: %s", len(companies))
+
+            # Las Row de BigQuery se serializan directamente, sin copiarlas a dict
+            results = list(companies)
+
+            # Página completa: puede haber más empresas después de la última entregada
+            next_cursor = encode_cursor(results[-1]["biz_identifier"]) if results and len(results) >= batch_size else None
+
+        if wants_ndjson(request):
+            if next_cursor and paginated:
+                results.append({"next_cursor": next_cursor})
+            return Response(stream_with_context(stream_ndjson(results)), mimetype="application/x-ndjson")
+
+        return json_response({
             "success": True,
             "data": results,
+            "next_cursor": next_cursor,
+            "lease": lease,
             "time_taken": time.time() - start_time,
             "timestamp": datetime.now().isoformat()
-        }), 200
+        }, 200)
 
     except Exception as error_message:
         # Manejo de errores: Si algo falla, devuelve un error 500.
         # Es crucial para identificar problemas en un entorno de producción.
-        print(f"Error al ejecutar la consulta de BigQuery: {error_message}")
+        logger.error("❌ Error al ejecutar la consulta de BigQuery: %s", error_message)
         return jsonify({
             "success": False,
             "error": f"Error interno del servidor: {error_message}",
@@ -146,6 +775,17 @@ def get_companies_from_bigquery():
 def patch_companies_in_bigquery(biz_identifier):
     """
         Actualizar empresas en BigQuery
+
+        Con COMPANY_STATUS_UPDATE_MODE=merge la actualización se acumula y se escribe
+        en BigQuery junto con otras en un solo MERGE (por tamaño o por tiempo). Si los
+        MERGE fallan y se acumulan COMPANY_STATUS_MAX_PENDING empresas sin escribir,
+        responde 503 para que el scraper reintente.
+
+        Si el body incluye "worker_id" (o el header X-Worker-Id), tras publicar la
+        actualización el lease de la empresa se marca como completado y se mantiene
+        COMPANY_LEASE_TTL_SECONDS más: el estado llega a BigQuery con retraso (CDC o
+        MERGE) y mientras tanto otro scraper no debe volver a reservarla. Con
+        {"renew_lease": true} solo se renueva el lease, sin publicar nada.
         """
     start_time = time.time()
     
@@ -157,12 +797,23 @@ def patch_companies_in_bigquery(biz_identifier):
                 "timestamp": datetime.now().isoformat()
             }), 400
             
-        logger.info(f"✅ Iniciando actualización de empresas en BigQuery")
+        logger.info("✅ Iniciando actualización de empresas en BigQuery")
         
         _, pub_sub_services, _ = get_services()
         topic_name = Config.PUBSUB_TOPIC_COMPANIES
 
         data = request.get_json()
+        worker_id = data.get("worker_id") or request.headers.get("X-Worker-Id")
+
+        if data.get("renew_lease"):
+            renewed = services.get("company_leases").renew(biz_identifier, worker_id, Config.COMPANY_LEASE_TTL_SECONDS)
+            return jsonify({
+                "success": renewed,
+                "message": f"Lease renovado: {biz_identifier}" if renewed else f"El lease de {biz_identifier} no pertenece a {worker_id} o ya expiró",
+                "time_taken": time.time() - start_time,
+                "timestamp": datetime.now().isoformat()
+            }), 200 if renewed else 409
+
         data = {
             "biz_name": data.get("biz_name"),
             "biz_identifier": data.get("biz_identifier"),
@@ -170,22 +821,56 @@ def patch_companies_in_bigquery(biz_identifier):
             "scrapping_d": f"{date.today().strftime('%Y-%m-%d')}",
             "_CHANGE_TYPE": "UPSERT"
         }
-        logger.info(f"✅ Datos a publicar en Pub/Sub: {data}")
-        logger.info(f"✅ Topic name: {topic_name}")
+        if Config.COMPANY_STATUS_UPDATE_MODE == "merge":
+            # Se acumula y se escribe junto con otras empresas en un solo MERGE
+            pending = services.get("company_status_buffer").add(
+                data["biz_identifier"], data["biz_name"], data["contact_found_flg"]
+            )
+            logger.info("✅ Actualización de %s encolada para MERGE (%s pendientes)", biz_identifier, pending)
+            message_id = None
+        else:
+            logger.debug("Datos a publicar en Pub/Sub (topic %s): %s", topic_name, data)
 
-        pub_sub_services.publish_message(topic_name, data)
+            message_id = pub_sub_services.publish_message(topic_name, data, timeout=Config.PUBSUB_PUBLISH_TIMEOUT)
 
        # bigquery_service.actualizar_empresas_scrapeadas(Config.SOURCE_TABLE_NAME, biz_identifier, biz_name, contact_found_flg)
 
+        if worker_id:
+            try:
+                # No se libera: la empresa sigue excluida hasta que scrapping_d llegue a BigQuery
+                services.get("company_leases").complete(biz_identifier, worker_id, Config.COMPANY_LEASE_TTL_SECONDS)
+            except Exception as lease_error:
+                # El lease expirará solo; no se falla una actualización ya publicada
+                logger.error("❌ Error completando lease de %s: %s", biz_identifier, lease_error)
+
         return jsonify({
             "success": True,
             "message": f"Empresa actualizada correctamente: {biz_identifier}",
+            "message_id": message_id,
             "time_taken": time.time() - start_time,
             "timestamp": datetime.now().isoformat()
         }), 200
 
+    except PublishBackpressureError as error_message:
+        logger.warning("⚠️ Pub/Sub saturado, se rechaza la actualización: %s", error_message)
+        return jsonify({
+            "success": False,
+            "error": f"Servicio saturado, reintentar más tarde: {error_message}",
+            "time_taken": time.time() - start_time,
+            "timestamp": datetime.now().isoformat()
+        }), 503
+
+    except CompanyStatusBufferFullError as error_message:
+        logger.warning("⚠️ Buffer de MERGE lleno, se rechaza la actualización: %s", error_message)
+        return jsonify({
+            "success": False,
+            "error": f"BigQuery no está escribiendo las actualizaciones, reintentar más tarde: {error_message}",
+            "time_taken": time.time() - start_time,
+            "timestamp": datetime.now().isoformat()
+        }), 503
+
     except Exception as error_message:
-        print(f"Error al actualizar empresas en BigQuery: {error_message}")
+        logger.error("❌ Error al actualizar empresas en BigQuery: %s", error_message)
         return jsonify({
             "success": False,
             "error": f"Error interno del servidor: {error_message}",
@@ -244,42 +929,35 @@ def post_contacts_to_bigquery():
                 "timestamp": datetime.now().isoformat()
             }), 400
 
-        logger.info(f"✅ Iniciando inserción de contactos en BigQuery")
+        logger.info("✅ Iniciando inserción de contactos en BigQuery")
 
         _ , pub_sub_services, _ = get_services()
 
-        data = request.get_json()
-        
-        data = {
-            "biz_name": data.get("biz_name",""),
-            "biz_identifier": data.get("biz_identifier",""),
-            "full_name": data.get("full_name",""),
-            "role": data.get("role",""),
-            "phone_number": data.get("phone_number",""),
-            "cat": data.get("cat",""),
-            "web_linkedin_url": data.get("web_linkedin_url",""),
-            "src_scraped_dt": int(datetime.now().timestamp() * 1000000),            
-            "src_scraped_name": data.get("src_scraped_name",""),
-            "phone_flg": int(data.get("phone_exists", False)),
-        }
+        data = build_contact_message(request.get_json())
         topic_name = Config.PUBSUB_TOPIC_CONTACTS
 
-        # Debug: verificar estructura de datos
-        logger.info(f"✅ Tipo de datos recibidos: {type(data)}")
-        logger.info(f"✅ Datos recibidos: {data}")
+        logger.debug("Contacto recibido: %s", data)
         # Publicar mensaje en Pub/Sub
-        publish_result = pub_sub_services.publish_message(topic_name, data)
+        publish_result = pub_sub_services.publish_message(topic_name, data, timeout=Config.PUBSUB_PUBLISH_TIMEOUT)
         
-        logger.info(f"✅ Mensaje publicado exitosamente en Pub/Sub.")
+        logger.info("✅ Mensaje publicado exitosamente en Pub/Sub.")
         return jsonify({
             "success": "True",
             "message": "Datos enviados exitosamente a Pub/Sub",
             "message_id": f"{publish_result}",
             "timestamp": datetime.now().isoformat()
         }), 200
+
+    except PublishBackpressureError as error_message:
+        logger.warning("⚠️ Pub/Sub saturado, se rechaza el contacto: %s", error_message)
+        return jsonify({
+            "success": "False",
+            "error": f"Servicio saturado, reintentar más tarde: {error_message}",
+            "timestamp": datetime.now().isoformat()
+        }), 503
         
     except Exception as error_message:
-        print(f"Error al publicar mensaje en Pub/Sub.")
+        logger.error("❌ Error al publicar mensaje en Pub/Sub: %s", error_message)
         return jsonify({
             "success": "False",
             "error": f"Error interno del servidor: {error_message}",
@@ -287,6 +965,96 @@ def post_contacts_to_bigquery():
         }), 500
 
 
+@app.route("/contacts/batch", methods=['POST'])
+def post_contacts_batch_to_bigquery():
+    """
+        Insertar varios contactos en una sola llamada publicándolos en Pub/Sub en batch.
+        Cada contacto recibe la misma normalización que en POST /contacts.
+
+        Body (Requerido), cualquiera de:
+        - Arreglo JSON: [{contacto}, {contacto}, ...]
+        - Objeto JSON: {"contacts": [{contacto}, ...]}
+        - NDJSON (Content-Type: application/x-ndjson): un contacto por línea
+
+    Retorna:
+    {
+        "success": True,
+        "published": 2,
+        "failed": 0,
+        "results": [
+            {"index": 0, "success": True, "message_id": "123", "error": None},
+            ...
+        ],
+        "time_taken": 0.12,
+        "timestamp": datetime.now().isoformat()
+    }
+    Si algunos contactos no se publican retorna 207; si no se publica ninguno, 500.
+        """
+    start_time = time.time()
+
+    try:
+        try:
+            contacts = parse_contacts_batch(request)
+        except ValueError as error_message:
+            return jsonify({
+                "success": False,
+                "error": f"Body inválido: {error_message}",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+
+        if not contacts:
+            return jsonify({
+                "success": False,
+                "error": "Contacts is required",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+
+        if len(contacts) > Config.CONTACTS_BATCH_MAX_ITEMS:
+            return jsonify({
+                "success": False,
+                "error": f"Máximo {Config.CONTACTS_BATCH_MAX_ITEMS} contactos por request",
+                "timestamp": datetime.now().isoformat()
+            }), 413
+
+        logger.info("✅ Iniciando inserción en batch de %s contactos", len(contacts))
+
+        _ , pub_sub_services, _ = get_services()
+        messages = [build_contact_message(contact) for contact in contacts]
+        results = pub_sub_services.publish_messages(
+            Config.PUBSUB_TOPIC_CONTACTS,
+            messages,
+            timeout=Config.PUBSUB_PUBLISH_TIMEOUT
+        )
+        published = sum(1 for result in results if result["success"])
+        failed = len(results) - published
+        logger.info("✅ Contactos publicados en Pub/Sub: %s de %s", published, len(results))
+
+        if not failed:
+            status_code = 200
+        elif published:
+            status_code = 207
+        else:
+            status_code = 500
+
+        return jsonify({
+            "success": not failed,
+            "published": published,
+            "failed": failed,
+            "results": results,
+            "time_taken": time.time() - start_time,
+            "timestamp": datetime.now().isoformat()
+        }), status_code
+
+    except Exception as error_message:
+        logger.error("❌ Error al publicar contactos en batch: %s", error_message)
+        return jsonify({
+            "success": False,
+            "error": f"Error interno del servidor: {error_message}",
+            "time_taken": time.time() - start_time,
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+
 @app.route("/apollo_enrichment", methods=['POST'])
 def post_waterfall_enrichment():
     """
@@ -300,10 +1068,8 @@ def post_waterfall_enrichment():
     url = Config.CLOUD_TASKS_URL
 
     try:
-        logger.info(f"✅ Datos recibidos: {data}")
-        logger.info(f"✅ URL: {url}")
-        logger.info(f"tipo de datos: {type(data)}")
-        logger.info(f"tipo de url: {type(url)}")
+        logger.info("✅ Creando tarea de enriquecimiento hacia %s", url, extra={"payload_keys": len(data or {})})
+        logger.debug("Payload de la tarea: %s", data)
         json_payload = data
 
         cloud_tasks_service.create_http_task(
@@ -319,14 +1085,14 @@ def post_waterfall_enrichment():
 
 
     except ValueError as error_message:
-        logger.error(f"❌ Error de validación: {error_message}")
+        logger.error("❌ Error de validación: %s", error_message)
         return jsonify({
             "success": False,
             "error": str(error_message),
             "timestamp": datetime.now().isoformat()
         }), 400
     except Exception as error_message:
-        logger.error(f"❌ Error al crear la tarea: {error_message}")
+        logger.error("❌ Error al crear la tarea: %s", error_message)
         return jsonify({
             "success": False,
             "error": f"Error interno del servidor: {error_message}",
@@ -371,8 +1137,17 @@ def post_contacts_enrichment():
             "Empresas ya scrapeadas anteriormente": ["biz_identifier1", "biz_identifier2", "biz_identifier3"],
             "Empresas no scrapeadas": ["biz_identifier4", "biz_identifier5", "biz_identifier6"],
             "msg: "Enriquecimiento creado correctamente para las empresas no scrapeadas"
+            "stages": {"lookup": 0.41, "encode": 0.02, "quota_check": 0.05, ...},
             "timestamp": datetime.now().isoformat()
         }
+        Con ?batch=1 (o ENRICHMENT_BATCHING_DEFAULT) los contactos no scrapeados se
+        acumulan con los de otros requests y se despachan en chunks llenos; retorna 202
+        con un batch_id para consultar en /contacts/enrichment/batches/<batch_id>.
+        Si algún contacto no scrapeado supera por sí solo el límite de payload de Clay
+        retorna 413 (CONTACT_PAYLOAD_EXCEEDS_100KB_LIMIT) con sus índices.
+        Si una etapa (BigQuery, Firestore, Cloud Tasks) supera su timeout retorna 504
+        indicando la etapa; si la que vence es la creación de tareas, que ya no se puede
+        cancelar, retorna 202 con "dispatch_in_progress": true y "retry": false.
         Si hay un error, retorna:
         {
             "success": False,
@@ -381,18 +1156,12 @@ def post_contacts_enrichment():
         }
     """
     try:
-        bigquery_service, _, cloud_tasks_service = get_services()
-        slack_service = SlackService(bot_token=Config.SLACK_BOT_TOKEN, channel=Config.SLACK_CHANNEL)
-        url = Config.CLAY_WEBHOOK_URL
-
-        headers = {
-            "Content-type": "application/json",
-            f'{Config.CLAY_WEBHOOK_HEADER}': f'{Config.CLAY_WEBHOOK_KEY}'
-        }
-        
-
         data = request.get_json()
-        logger.info(f"✅ Datos recibidos: {data}")
+        logger.info(
+            "✅ Enriquecimiento recibido: %d contactos", len(data.get("contacts") or []),
+            extra={"request_bytes": request.content_length}
+        )
+        logger.debug("Body del enriquecimiento: %s", data)
         if not data.get("contacts"):
             return jsonify({
                 "success": False,
@@ -400,151 +1169,87 @@ def post_contacts_enrichment():
                 "timestamp": datetime.now().isoformat()
             }), 400
 
-        contacts = data.get("contacts")
-        logger.info(f"✅ Contacts: {contacts}")
-        contacts_urls = [
-            contact.get("web_linkedin_url")
-            for contact in contacts
-            if contact.get("web_linkedin_url")
-        ]
-        logger.info(f"✅ Contacts URLs: {contacts_urls}")
-
-        contacts_already_scraped_df = bigquery_service.verify_if_contacts_was_scraped(Config.DESTINATION_TABLE_NAME, contacts_urls)
-        logger.info(f"✅ Contacts already scraped: {contacts_already_scraped_df}")
-        
-        # Extraer las URLs de los contactos ya scrapeados
-        if contacts_already_scraped_df is not None and not contacts_already_scraped_df.empty:
-            scraped_urls = set(contacts_already_scraped_df['web_linkedin_url'].tolist())
+        if wants_batching(request):
+            body, status_code = services.get("enrichment_batcher").submit(data)
         else:
-            scraped_urls = set()
-        
-        logger.info(f"✅ Scraped URLs: {scraped_urls}")
-        
-        # Filtrar los contactos que NO fueron scrapeados
-        contacts_not_scraped = [
-            contact for contact in contacts
-            if contact.get("web_linkedin_url") not in scraped_urls
-        ]
-        
-        logger.info(f"✅ Contacts not scraped: {len(contacts_not_scraped)} de {len(contacts)}")
-        
-        if not contacts_not_scraped:
-            return jsonify({
-                "success": True,
-                "message": "Todas las contactos ya fueron scrapeadas",
-                "timestamp": datetime.now().isoformat()
-            }), 200
-    
-        logger.info(f"✅ URL: {url}")
-        logger.info(f"tipo de datos: {type(contacts_not_scraped)}")
-
-        # El base_payload debe mantener los otros campos del request original (si los hay)
-        base_payload = {k: v for k, v in data.items() if k != "contacts"}
-        max_payload_bytes = 90 * 1024  # 900KB
-        logger.info(f"✅ Max payload bytes: {max_payload_bytes}")
-
-        def payload_size(contacts_chunk: list[dict]) -> int:
-            payload = {**base_payload, "contacts": contacts_chunk}
-            return len(json.dumps(payload).encode("utf-8"))
-
-        chunks = []
-        current_chunk = []
-
-        for contact in contacts_not_scraped:
-            tentative_chunk = current_chunk + [contact]
-            if payload_size(tentative_chunk) <= max_payload_bytes:
-                current_chunk = tentative_chunk
-                continue
-            logger.info(f"✅ Current chunk: {current_chunk}")
-            if not current_chunk:
-                raise ValueError("CONTACT_PAYLOAD_EXCEEDS_100KB_LIMIT")
-
-            chunks.append(current_chunk)
-            current_chunk = [contact]
-
-        if current_chunk:
-            chunks.append(current_chunk)
-
-        try:
-
-            firebase_service = FirestoreService(project=Config.FIREBASE_PROJECT_ID, database=Config.FIREBASE_DATABASE)
-            limit = int(Config.CLAY_LIMITS)
-            documents_names = [Config.FIREBASE_DOCUMENT_TABLES, Config.FIREBASE_DOCUMENT_REQUEST_APOLLO, Config.FIREBASE_DOCUMENT_REQUEST_IMPORT]
-            for document_name in documents_names:
-                count_to_increment = len(chunks)
-                limit_exceeded, advertising_threshold_exceeded = firebase_service.validate_limit_and_advertising_threshold(
-                    collection=Config.FIREBASE_COLLECTION,
-                    document_name=document_name,
-                    new_count= count_to_increment,
-                    advertising_threshold=int(Config.CLAY_LIMIT_ADVERTISING),
-                    limit=limit
-                )
-                if limit_exceeded:
-                    message = slack_service.format_message(
-                        {
-                            "text": f"Límite excedido en el documento: {document_name} con el valor de {count_to_increment} y el límite es {limit}, si es una tabla se debe borrar las filas, si es un webhook se debe crear un nuevo webhook y cambiar la variable del url en cloud Run"
-                        }
-                    )
-                    slack_service.send_message(message)
-                    return jsonify({
-                        "success": False,
-                        "error": f"Límite excedido en el documento: {document_name}",
-                        "timestamp": datetime.now().isoformat()
-                    }), 429
-                if advertising_threshold_exceeded:
-                    message = slack_service.format_message(
-                        {
-                            "text": f"Umbral de advertising excedido en el documento: {document_name} con el valor de {count_to_increment} y el umbral es {int(Config.CLAY_LIMIT_ADVERTISING)}"
-                        }
-                    )
-                    slack_service.send_message(message)
-
-            for document_name in documents_names:
-                firebase_service.increment_current_count(
-                    collection=Config.FIREBASE_COLLECTION,
-                    document_name=document_name,
-                    increment=len(chunks)
-                )
-            logger.info(f"✅ Enriquecimiento creado correctamente para las empresas no scrapeadas: {len(contacts)}")
-            message = slack_service.format_message(
-                {
-                    "text": f"Enriquecimiento creado correctamente para {len(contacts)} Contactos no scrapeados"
-                }
-            )
-            slack_service.send_message(message)
-            
+            body, status_code = services.get("enrichment_pipeline").run(data)
+        return jsonify(body), status_code
 
+    except EnrichmentBatcherFullError as error_message:
+        logger.warning("⚠️ Acumulador de enriquecimiento lleno, se rechaza el request: %s", error_message)
+        return jsonify({
+            "success": False,
+            "error": f"Servicio saturado, reintentar más tarde: {error_message}",
+            "timestamp": datetime.now().isoformat()
+        }), 503
 
-        except Exception as firebase_error:
-            error_message = str(firebase_error)
-            logger.error(f"❌ Error validando límites en Firebase: {error_message}")
+    except EnrichmentStageTimeout as error_message:
+        logger.error("❌ Timeout en el enriquecimiento: %s", error_message)
+        if error_message.stage == "dispatch" and error_message.in_progress:
+            # Las tareas se siguen creando: un reintento inmediato solo encontraría duplicados
             return jsonify({
-                "success": False,
-                "error": f"Error interno del servidor: {error_message}",
+                "success": True,
+                "message": "La creación de tareas sigue en curso; no reintentar el request",
+                "dispatch_in_progress": True,
+                "retry": False,
+                "stage": error_message.stage,
                 "timestamp": datetime.now().isoformat()
-            }), 500
-
-        for chunk in chunks:
-            json_payload = {**base_payload, "contacts": chunk}
-            cloud_tasks_service.create_http_task(
-                url=url,
-                json_payload=json_payload,
-                headers=headers
-            )
+            }), 202
+        return jsonify({
+            "success": False,
+            "error": str(error_message),
+            "stage": error_message.stage,
+            "timestamp": datetime.now().isoformat()
+        }), 504
 
+    except Exception as error_message:
+        logger.error("❌ Error al crear la tarea: %s", error_message)
         return jsonify({
-            "success": True,
-            "message": "Tarea creada correctamente",
+            "success": False,
+            "error": f"Error interno del servidor: {error_message}",
             "timestamp": datetime.now().isoformat()
-        }), 200
+        }), 500
 
+@app.route("/contacts/enrichment/batches/<string:batch_id>", methods=['GET'])
+def get_contacts_enrichment_batch(batch_id):
+    """
+        Estado de un lote del modo acumulador de /contacts/enrichment.
+
+        Retorna:
+        {
+            "batch_id": "...",
+            "status": "pending" | "completed" | "partial" | "failed",
+            "contacts": 12, "already_scraped": 2, "pending": 0,
+            "dispatched": 9, "duplicated": 1, "failed": 0, "rejected": 0,
+            "errors": [],
+            ...
+        }
+        Con ENRICHMENT_BATCH_STATUS_BACKEND=firestore el estado se consulta desde
+        cualquier instancia; con memory solo lo conoce el worker que aceptó el lote.
+        404 si el lote no existe o ya expiró.
+    """
+    try:
+        if services.is_warm("enrichment_batcher"):
+            batch = services.get("enrichment_batcher").status(batch_id)
+        elif Config.ENRICHMENT_BATCH_STATUS_BACKEND == "firestore":
+            # Esta instancia no aceptó lotes: el estado lo guardó la instancia que los recibió
+            batch = services.get("enrichment_batch_status").get(batch_id)
+        else:
+            batch = None
     except Exception as error_message:
-        logger.error(f"❌ Error al crear la tarea: {error_message}")
+        logger.error("❌ Error consultando el lote %s: %s", batch_id, error_message)
         return jsonify({
             "success": False,
             "error": f"Error interno del servidor: {error_message}",
             "timestamp": datetime.now().isoformat()
         }), 500
+    if batch is None:
+        return jsonify({
+            "success": False,
+            "error": f"Lote no encontrado: {batch_id}",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    return jsonify({"success": True, **batch, "timestamp": datetime.now().isoformat()}), 200
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8080, debug=False)
\ No newline at end of file
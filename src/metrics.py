@@ -0,0 +1,274 @@
+"""
+Métricas de proceso en formato de texto de Prometheus (sin dependencias externas).
+
+Las llamadas a servicios externos se instrumentan con el decorador timed en las
+clases de servicio; main.py expone todo en /metrics. Cada worker de gunicorn tiene
+su propio registro, así que con varios workers cada scrape ve solo el worker que
+atendió el request (en Cloud Run se usa un worker por instancia).
+"""
+import bisect
+import threading
+from abc import ABC, abstractmethod
+import time
+from functools import wraps
+from typing import Callable, Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Labels de {self.name}: se esperaban {self.label_names}, llegaron {tuple(labels)}")
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Líneas de muestras en formato de texto de Prometheus"""
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Un counter solo puede incrementarse")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de labels: [conteo por bucket (no acumulado)..., +Inf], suma
+        self._values: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, **labels) -> "_Timer":
+        """Context manager que observa la duración del bloque en segundos"""
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self._start, **self.labels)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-importar un módulo no debe duplicar (ni reiniciar) la métrica
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+EXTERNAL_CALL_SECONDS = REGISTRY.histogram(
+    "clay_external_call_duration_seconds",
+    "Duración de las llamadas a servicios externos",
+    ("service", "method"),
+)
+EXTERNAL_CALL_ERRORS = REGISTRY.counter(
+    "clay_external_call_errors_total",
+    "Llamadas a servicios externos que lanzaron una excepción",
+    ("service", "method"),
+)
+ENRICHMENT_STAGE_SECONDS = REGISTRY.histogram(
+    "clay_enrichment_stage_duration_seconds",
+    "Duración de cada etapa del pipeline de /contacts/enrichment",
+    ("stage",),
+)
+ENRICHMENT_CHUNKS = REGISTRY.counter(
+    "clay_enrichment_chunks_total",
+    "Chunks de contactos producidos por el chunker",
+)
+ENRICHMENT_CONTACTS_ALREADY_SCRAPED = REGISTRY.counter(
+    "clay_enrichment_contacts_already_scraped_total",
+    "Contactos descartados porque su URL ya estaba scrapeada",
+)
+ENRICHMENT_DUPLICATE_CHUNKS = REGISTRY.counter(
+    "clay_enrichment_duplicate_chunks_total",
+    "Chunks omitidos porque su tarea ya existía (cache local o ALREADY_EXISTS)",
+    ("source",),
+)
+ENRICHMENT_QUOTA_REJECTIONS = REGISTRY.counter(
+    "clay_enrichment_quota_rejections_total",
+    "Requests de enriquecimiento rechazados por límite de cuota",
+    ("stage",),
+)
+ENRICHMENT_BATCHER_FLUSHES = REGISTRY.counter(
+    "clay_enrichment_batcher_flushes_total",
+    "Despachos del acumulador de enriquecimiento por motivo (size, delay, shutdown)",
+    ("reason",),
+)
+
+# Gauges que /metrics actualiza en cada scrape a partir del estado de los servicios
+SERVICE_WARM = REGISTRY.gauge(
+    "clay_service_warm",
+    "1 si el servicio ya está inicializado en este worker",
+    ("service",),
+)
+COMPANY_STATUS_BUFFER = REGISTRY.gauge(
+    "clay_company_status_buffer",
+    "Estado del buffer de MERGE de empresas (pending, flushes, failed_flushes, rows_flushed)",
+    ("field",),
+)
+PUBSUB_PENDING_MESSAGES = REGISTRY.gauge(
+    "clay_pubsub_pending_messages",
+    "Mensajes publicados en Pub/Sub sin confirmación",
+)
+QUOTA_LEASE_REMAINING = REGISTRY.gauge(
+    "clay_quota_lease_remaining",
+    "Unidades de cuota que quedan en el bloque local de este worker",
+)
+ENRICHMENT_BATCHER_BUFFERED = REGISTRY.gauge(
+    "clay_enrichment_batcher_buffered_contacts",
+    "Contactos en espera en el acumulador de enriquecimiento",
+)
+
+
+def timed(service: str, method: str = None) -> Callable:
+    """
+    Decorador para métodos de servicio: observa la duración de cada llamada en
+    clay_external_call_duration_seconds y cuenta las que terminan en excepción.
+    """
+    def decorator(func: Callable) -> Callable:
+        labels = {"service": service, "method": method or func.__name__}
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                EXTERNAL_CALL_ERRORS.inc(**labels)
+                raise
+            finally:
+                EXTERNAL_CALL_SECONDS.observe(time.perf_counter() - start_time, **labels)
+        return wrapper
+    return decorator
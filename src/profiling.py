@@ -0,0 +1,104 @@
+import cProfile
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging import Logger
+import logging
+from typing import Dict, List, Optional
+
+logger: Logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """
+    Perfilado de requests con cProfile, bajo demanda o por muestreo.
+
+    - Bajo demanda: el handler pide explícitamente perfilar el request (header o query
+      flag autenticado con la API key).
+    - Continuo: con sample_rate > 0 se perfila esa fracción de los requests.
+
+    Solo un request se perfila a la vez por worker (lock no bloqueante): si ya hay
+    uno en curso, el siguiente corre sin profiler en vez de esperar. cProfile mide
+    el hilo del request; el trabajo que corre en el executor del pipeline aparece
+    como espera (su duración por etapa está en el campo "stages" de la respuesta).
+
+    Los reportes (top-N funciones por tiempo acumulado) quedan en un ring buffer en
+    memoria de max_reports entradas.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, top_n: int = 30, max_reports: int = 50) -> None:
+        self.sample_rate = sample_rate
+        self.top_n = top_n
+        self._reports: deque = deque(maxlen=max_reports)
+        self._reports_lock = threading.Lock()
+        self._active = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def should_profile(self, requested: bool) -> Optional[str]:
+        """Motivo para perfilar este request ("requested" o "sampled"), o None"""
+        if requested:
+            return "requested"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Arranca un profiler; None si ya hay otro request perfilándose"""
+        if not self._active.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except Exception as error_message:
+            # Otra herramienta de profiling activa en el proceso
+            self._active.release()
+            logger.warning("⚠️ No se pudo iniciar el profiler: %s", error_message)
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile, method: str, path: str, reason: str, duration_seconds: float) -> str:
+        """Detiene el profiler, guarda el reporte y retorna su id"""
+        try:
+            profile.disable()
+        finally:
+            self._active.release()
+
+        output = io.StringIO()
+        stats = pstats.Stats(profile, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+
+        profile_id = f"{int(time.time())}-{next(self._ids)}"
+        with self._reports_lock:
+            self._reports.append({
+                "id": profile_id,
+                "method": method,
+                "path": path,
+                "reason": reason,
+                "duration_seconds": duration_seconds,
+                "total_calls": stats.total_calls,
+                "timestamp": datetime.now().isoformat(),
+                "report": output.getvalue(),
+            })
+        logger.info("✅ Perfil %s guardado: %s %s (%.3fs, %s)", profile_id, method, path, duration_seconds, reason)
+        return profile_id
+
+    def summaries(self) -> List[Dict]:
+        """Resumen de los reportes guardados, del más reciente al más antiguo"""
+        with self._reports_lock:
+            reports = list(self._reports)
+        return [
+            {key: value for key, value in report.items() if key != "report"}
+            for report in reversed(reports)
+        ]
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        with self._reports_lock:
+            for report in self._reports:
+                if report["id"] == profile_id:
+                    return report
+        return None
@@ -1,20 +1,164 @@
 import os
+import threading
+import time
 from google.cloud import pubsub_v1
-import json
+from google.cloud.pubsub_v1.publisher.exceptions import FlowControlLimitError
+import logging
+from typing import Callable, Dict, List, Optional
+
+from service_errors import PublishBackpressureError
+from metrics import timed
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+LIMIT_EXCEEDED_BEHAVIORS = {
+    "block": pubsub_v1.types.LimitExceededBehavior.BLOCK,
+    "error": pubsub_v1.types.LimitExceededBehavior.ERROR,
+    "ignore": pubsub_v1.types.LimitExceededBehavior.IGNORE,
+}
+
 
 class PubSubService:
-    def __init__(self, project_id:str):
+    def __init__(
+        self,
+        project_id:str,
+        max_messages:int = 100,
+        max_bytes:int = 1024 * 1024,
+        max_latency:float = 0.01,
+        flow_control_max_messages:int = 1000,
+        flow_control_max_bytes:int = 10 * 1024 * 1024,
+        flow_control_behavior:str = "block",
+    ):
         self.project_id = project_id
-        self.publisher = pubsub_v1.PublisherClient()
+        # Los mensajes publicados se agrupan en un solo request hasta alcanzar
+        # max_messages, max_bytes o max_latency segundos (lo que ocurra primero)
+        batch_settings = pubsub_v1.types.BatchSettings(
+            max_messages=max_messages,
+            max_bytes=max_bytes,
+            max_latency=max_latency,
+        )
+        # Límite de mensajes sin confirmar: acota la memoria del buffer interno en picos
+        # de tráfico bloqueando ("block") o rechazando ("error") nuevos publish
+        publisher_options = pubsub_v1.types.PublisherOptions(
+            flow_control=pubsub_v1.types.PublishFlowControl(
+                message_limit=flow_control_max_messages,
+                byte_limit=flow_control_max_bytes,
+                limit_exceeded_behavior=LIMIT_EXCEEDED_BEHAVIORS[flow_control_behavior.lower()],
+            )
+        )
+        self.publisher = pubsub_v1.PublisherClient(
+            batch_settings=batch_settings,
+            publisher_options=publisher_options,
+        )
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def _publish(self, topic_path:str, data:dict):
+        """Publica sin esperar y registra el future como pendiente hasta que se resuelva"""
+        try:
+            future = self.publisher.publish(topic_path, dumps(data))
+        except FlowControlLimitError as error_message:
+            raise PublishBackpressureError(f"PUBSUB_FLOW_CONTROL_LIMIT: {error_message}") from error_message
+
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard_pending)
+        return future
+
+    def _discard_pending(self, future) -> None:
+        with self._pending_lock:
+            self._pending.discard(future)
 
-    def publish_message(self, topic_name:str, data : dict):
-        """Publish message to pubsub"""
+    @timed("pubsub")
+    def publish_message(
+        self,
+        topic_name:str,
+        data : dict,
+        wait:bool = True,
+        timeout:Optional[float] = 30,
+        callback:Optional[Callable] = None,
+    ):
+        """
+        Publica un mensaje en Pub/Sub.
+
+        Args:
+            topic_name: Nombre del topic
+            data: Mensaje a publicar (se serializa a JSON)
+            wait: Si es True espera la confirmación y retorna el message ID
+            timeout: Segundos máximos de espera por la confirmación (con wait=True)
+            callback: Función que recibe el future cuando se resuelve
+        Returns:
+            El message ID (wait=True) o el future de la publicación (wait=False)
+        Raises:
+            PublishBackpressureError: Si el flow control está en "error" y se alcanzó el límite
+            Exception: Si la publicación falla o no se confirma dentro del timeout
+        """
         topic_path = self.publisher.topic_path(self.project_id, topic_name)
 
-        try:
-            future = self.publisher.publish(topic_path, json.dumps(data).encode("utf-8"))
-    
-            return "OK"
-        except Exception as error_message:
-            raise error_message
-    
\ No newline at end of file
+        future = self._publish(topic_path, data)
+        if callback is not None:
+            future.add_done_callback(callback)
+        if not wait:
+            return future
+        return future.result(timeout=timeout)
+
+    @timed("pubsub")
+    def publish_messages(self, topic_name:str, messages:List[dict], timeout:float = 30) -> List[Dict]:
+        """
+        Publica varios mensajes aprovechando el batching del PublisherClient y espera
+        la confirmación de cada uno.
+
+        Args:
+            topic_name: Nombre del topic
+            messages: Mensajes a publicar
+            timeout: Segundos máximos de espera para todas las confirmaciones juntas
+        Returns:
+            Un resultado por mensaje, en el mismo orden:
+            {"index": int, "success": bool, "message_id": str | None, "error": str | None}
+        """
+        topic_path = self.publisher.topic_path(self.project_id, topic_name)
+
+        futures = []
+        for data in messages:
+            try:
+                futures.append(self._publish(topic_path, data))
+            except Exception as error_message:
+                futures.append(error_message)
+
+        deadline = time.monotonic() + timeout
+        results = []
+        for index, future in enumerate(futures):
+            if isinstance(future, Exception):
+                results.append({"index": index, "success": False, "message_id": None, "error": str(future)})
+                continue
+            try:
+                results.append({"index": index, "success": True, "message_id": future.result(timeout=max(0.0, deadline - time.monotonic())), "error": None})
+            except Exception as error_message:
+                results.append({"index": index, "success": False, "message_id": None, "error": str(error_message)})
+        return results
+
+    def pending_count(self) -> int:
+        """Mensajes publicados que todavía no tienen confirmación"""
+        with self._pending_lock:
+            return len(self._pending)
+
+    def drain(self, timeout:float = 30) -> int:
+        """
+        Envía los batches pendientes y espera sus confirmaciones (p. ej. antes de que
+        el worker termine por SIGTERM). Retorna cuántos mensajes quedaron sin confirmar.
+        """
+        with self._pending_lock:
+            pending = list(self._pending)
+        if pending:
+            logger.info("Esperando confirmación de %s mensajes de Pub/Sub", len(pending))
+
+        deadline = time.monotonic() + timeout
+        for future in pending:
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as error_message:
+                logger.error("❌ Mensaje de Pub/Sub sin confirmar al cerrar: %s", error_message)
+
+        self.publisher.stop()
+        return self.pending_count()
@@ -0,0 +1,192 @@
+import atexit
+import threading
+import time
+from logging import Logger
+import logging
+from typing import Dict, List, Optional
+
+from firebase_services import FirestoreService, QuotaReservation
+
+logger: Logger = logging.getLogger(__name__)
+
+
+class QuotaLeaser:
+    """
+    Lease local de bloques de cuota sobre los contadores de Firestore.
+
+    Cada worker reserva un bloque de N unidades en todos los contadores con una sola
+    transacción (FirestoreService.reserve_quota) y lo consume localmente bajo un lock,
+    de modo que la mayoría de los requests validan la cuota sin ir a Firestore.
+
+    - El tamaño del bloque se reduce a medida que el contador se acerca al límite
+      (como máximo headroom_fraction del margen restante), así ningún worker acapara
+      la cuota que queda y la suma de bloques nunca supera el límite.
+    - Las unidades no usadas se devuelven al expirar el lease (lease_ttl_seconds) o al
+      terminar el proceso. Si el proceso muere sin devolverlas quedan contadas como
+      usadas: el error es conservador, nunca se sobrepasa el límite.
+    """
+
+    def __init__(
+        self,
+        firestore_service: FirestoreService,
+        collection: str,
+        documents: List[str],
+        limit: int,
+        advertising_threshold: int,
+        block_size: int = 50,
+        lease_ttl_seconds: float = 300,
+        headroom_fraction: float = 0.1,
+    ) -> None:
+        self.firestore_service = firestore_service
+        self.collection = collection
+        self.documents = documents
+        self.limit = limit
+        self.advertising_threshold = advertising_threshold
+        self.block_size = block_size
+        self.lease_ttl_seconds = lease_ttl_seconds
+        self.headroom_fraction = headroom_fraction
+
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._leased_at: Optional[float] = None
+        # Valor de cada contador en Firestore tras la última reserva de bloque
+        self._counts: Dict[str, int] = {}
+        self._expiry_timer: Optional[threading.Timer] = None
+
+        atexit.register(self.release)
+
+    def acquire(self, amount: int) -> QuotaReservation:
+        """
+        Reserva amount unidades, localmente si el bloque vigente alcanza o reservando
+        un bloque nuevo en Firestore si no.
+        """
+        with self._lock:
+            if self._lease_expired():
+                self._release_locked()
+
+            if self._remaining < amount:
+                reservation = self._refill_locked(amount - self._remaining)
+                if not reservation.reserved:
+                    return reservation
+
+            self._remaining -= amount
+            counts = self._effective_counts_locked()
+            return QuotaReservation(
+                reserved=True,
+                amount=amount,
+                counts=counts,
+                threshold_exceeded=[
+                    document_name for document_name, count in counts.items()
+                    if count > self.advertising_threshold
+                ],
+            )
+
+    def prefetch(self, amount: int = 1) -> Optional[QuotaReservation]:
+        """
+        Asegura que el bloque local tenga al menos amount unidades, reservando uno nuevo
+        si hace falta, sin consumir nada. Permite adelantar la transacción de Firestore
+        mientras se hacen otras etapas del request.
+
+        Returns:
+            None si hay cuota local disponible, o la reserva rechazada si no la hay
+        """
+        with self._lock:
+            if self._lease_expired():
+                self._release_locked()
+            if self._remaining >= amount:
+                return None
+            reservation = self._refill_locked(amount - self._remaining)
+            return None if reservation.reserved else reservation
+
+    def refund(self, amount: int) -> None:
+        """
+        Devuelve amount unidades ya consumidas y no usadas (p. ej. tareas duplicadas):
+        vuelven al bloque local si el lease sigue vigente, o a Firestore si no.
+        """
+        if amount <= 0:
+            return
+        with self._lock:
+            if self._leased_at is not None and not self._lease_expired():
+                self._remaining += amount
+                return
+        self.firestore_service.release_quota(self.collection, self.documents, amount)
+
+    def release(self) -> None:
+        """Devuelve a Firestore las unidades del bloque que no se usaron"""
+        with self._lock:
+            self._release_locked()
+
+    def remaining(self) -> int:
+        with self._lock:
+            return self._remaining
+
+    def _lease_expired(self) -> bool:
+        return self._leased_at is not None and time.monotonic() - self._leased_at >= self.lease_ttl_seconds
+
+    def _next_block_size(self, needed: int) -> int:
+        if not self._counts:
+            return max(needed, self.block_size)
+        headroom = self.limit - max(self._counts.values())
+        return max(needed, min(self.block_size, int(headroom * self.headroom_fraction)))
+
+    def _refill_locked(self, needed: int) -> QuotaReservation:
+        block = self._next_block_size(needed)
+        reservation = self.firestore_service.reserve_quota(
+            collection=self.collection,
+            documents=self.documents,
+            amount=block,
+            limit=self.limit,
+            advertising_threshold=self.advertising_threshold,
+        )
+        if not reservation.reserved and block > needed:
+            # Cerca del límite: se intenta reservar solo lo necesario
+            reservation = self.firestore_service.reserve_quota(
+                collection=self.collection,
+                documents=self.documents,
+                amount=needed,
+                limit=self.limit,
+                advertising_threshold=self.advertising_threshold,
+            )
+            block = needed
+
+        self._counts = dict(reservation.counts)
+        if not reservation.reserved:
+            return reservation
+
+        self._remaining += block
+        self._leased_at = time.monotonic()
+        self._schedule_expiry_locked()
+        logger.info("✅ Bloque de cuota reservado: %s unidades (contadores: %s)", block, self._counts)
+        return reservation
+
+    def _effective_counts_locked(self) -> Dict[str, int]:
+        """Contadores descontando las unidades reservadas que aún no se usaron"""
+        return {document_name: count - self._remaining for document_name, count in self._counts.items()}
+
+    def _release_locked(self) -> None:
+        if self._expiry_timer is not None:
+            self._expiry_timer.cancel()
+            self._expiry_timer = None
+        if self._remaining <= 0:
+            self._leased_at = None
+            return
+        try:
+            self.firestore_service.release_quota(self.collection, self.documents, self._remaining)
+            self._counts = self._effective_counts_locked()
+            self._remaining = 0
+            self._leased_at = None
+        except Exception as error:
+            # Se conservan las unidades: se reintentará al próximo vencimiento o al salir
+            logger.error("❌ Error devolviendo %s unidades de cuota: %s", self._remaining, error)
+
+    def _schedule_expiry_locked(self) -> None:
+        if self._expiry_timer is not None:
+            self._expiry_timer.cancel()
+        self._expiry_timer = threading.Timer(self.lease_ttl_seconds, self._release_if_expired)
+        self._expiry_timer.daemon = True
+        self._expiry_timer.start()
+
+    def _release_if_expired(self) -> None:
+        with self._lock:
+            if self._lease_expired():
+                self._release_locked()
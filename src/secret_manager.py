@@ -20,7 +20,7 @@ class SecretManager:
         Returns:
             str: The getted secret as a string
         """
-        self.__logger.info(f"Getting secret {secret_name} secret manager")
+        self.__logger.info("Getting secret %s secret manager", secret_name)
 
         secret_path = (f"projects/{self.project_id}/secrets/{secret_name}/versions/latest")
         response: AccessSecretVersionResponse = self.__secret_manager_client.access_secret_version(request={"name": secret_path})
@@ -0,0 +1,59 @@
+"""
+Serialización JSON compartida por los servicios (payloads de Cloud Tasks, mensajes de
+Pub/Sub, tamaños del chunker, respuestas de /companies y logs).
+
+dumps() retorna bytes UTF-8 listos para enviar, sin pasar por str. Usa orjson si
+está instalado y, si no, json de la biblioteca estándar configurado para producir JSON
+equivalente: separadores compactos (",", ":"), caracteres no ASCII sin escapar y
+datetime/date en ISO 8601. No es idéntico en todos los casos: el exponente de los
+floats (orjson: 1e16, json: 1e+16), NaN/Infinity (orjson: null, json: NaN/Infinity)
+y los enteros de más de 64 bits (orjson lanza TypeError). Las filas de BigQuery (Row) y otros mapeos se serializan
+como objetos; cualquier otro tipo, como str(value).
+"""
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(value):
+    """Tipos que ninguno de los dos backends serializa por sí solo"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "keys") and hasattr(value, "items"):
+        # google.cloud.bigquery.Row y otros mapeos que no heredan de dict
+        return dict(value.items())
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def _stdlib_dumps(obj, sort_keys: bool = False) -> bytes:
+    return json.dumps(
+        obj, separators=(",", ":"), ensure_ascii=False, sort_keys=sort_keys, default=_default
+    ).encode("utf-8")
+
+
+def _orjson_dumps(obj, sort_keys: bool = False) -> bytes:
+    options = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        options |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(obj, default=_default, option=options)
+
+
+def dumps(obj, sort_keys: bool = False) -> bytes:
+    """
+    Serializa obj a JSON compacto en bytes UTF-8.
+
+    Args:
+        obj: Valor a serializar
+        sort_keys: Ordenar las claves de los objetos (salida canónica, p. ej. para hashes)
+    """
+    if orjson is not None:
+        return _orjson_dumps(obj, sort_keys)
+    return _stdlib_dumps(obj, sort_keys)
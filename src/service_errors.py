@@ -0,0 +1,14 @@
+"""
+Excepciones compartidas entre los servicios y los handlers HTTP.
+
+Viven en un módulo sin dependencias para que main.py pueda capturarlas sin
+importar los clientes de Google Cloud en el arranque del worker.
+"""
+
+
+class PublishBackpressureError(Exception):
+    """Se alcanzó el límite de mensajes/bytes pendientes y el flow control rechazó el mensaje"""
+
+
+class CompanyStatusBufferFullError(Exception):
+    """El buffer de MERGE llegó a max_pending actualizaciones sin escribir (BigQuery no responde)"""
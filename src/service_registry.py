@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from logging import Logger
+import logging
+from typing import Any, Callable, Dict
+
+logger: Logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    """
+    Registro de servicios de proceso: mantiene una única instancia de larga vida
+    por servicio (BigQuery, Pub/Sub, Cloud Tasks, Firestore, Slack) en cada worker.
+
+    - Inicialización perezosa: el cliente se construye la primera vez que se pide.
+    - Thread-safe: un lock por servicio, de modo que un cliente lento de inicializar
+      no bloquea a los demás.
+    - Fork-aware: los clientes gRPC no sobreviven a un fork, así que el proceso hijo
+      descarta las instancias heredadas y las vuelve a construir bajo demanda.
+    """
+
+    def __init__(self) -> None:
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._required: Dict[str, bool] = {}
+        self._instances: Dict[str, Any] = {}
+        self._init_seconds: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+        self._pid = os.getpid()
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def register(self, name: str, factory: Callable[[], Any], required: bool = True) -> None:
+        """
+        Registra (o reemplaza) la fábrica de un servicio y descarta la instancia previa.
+        Los servicios no requeridos (opcionales según la configuración) no cuentan
+        para el readiness ni se inicializan en warm_up.
+        """
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._required[name] = required
+            self._locks.setdefault(name, threading.Lock())
+            self._instances.pop(name, None)
+            self._init_seconds.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        """Devuelve la instancia del servicio, creándola la primera vez que se pide"""
+        self._check_fork()
+
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        if name not in self._factories:
+            raise KeyError(f"SERVICE_NOT_REGISTERED: {name}")
+
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+
+            start_time = time.perf_counter()
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                logger.error("❌ Error inicializando servicio %s: %s", name, e)
+                raise
+            self._init_seconds[name] = time.perf_counter() - start_time
+            self._instances[name] = instance
+            logger.info("✅ Servicio %s inicializado en %.3fs (pid=%s)", name, self._init_seconds[name], self._pid)
+            return instance
+
+    def is_warm(self, name: str) -> bool:
+        self._check_fork()
+        return name in self._instances
+
+    def warm_up(self) -> Dict[str, bool]:
+        """Inicializa los servicios requeridos; retorna cuáles quedaron listos"""
+        warm = {}
+        for name in [name for name, required in self._required.items() if required]:
+            try:
+                self.get(name)
+                warm[name] = True
+            except Exception:
+                warm[name] = False
+        return warm
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Estado de cada servicio registrado para el probe de readiness"""
+        self._check_fork()
+        return {
+            name: {
+                "warm": name in self._instances,
+                "required": self._required[name],
+                "init_seconds": self._init_seconds.get(name),
+            }
+            for name in self._factories
+        }
+
+    def is_ready(self) -> bool:
+        """True cuando todos los servicios requeridos están inicializados"""
+        self._check_fork()
+        return all(name in self._instances for name, required in self._required.items() if required)
+
+    def reset(self) -> None:
+        """Descarta todas las instancias (p. ej. en el hijo tras un fork)"""
+        self._instances = {}
+        self._init_seconds = {}
+        # Los locks heredados pueden haber quedado tomados por un hilo del padre
+        self._locks = {name: threading.Lock() for name in self._factories}
+        self._registry_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_fork(self) -> None:
+        # Respaldo para plataformas sin os.register_at_fork
+        if self._pid != os.getpid():
+            self.reset()
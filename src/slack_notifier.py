@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from logging import Logger
+import logging
+from typing import Dict, Optional
+
+from slack.errors import SlackApiError
+
+logger: Logger = logging.getLogger(__name__)
+
+
+class SlackNotifier:
+    """
+    Envía notificaciones a Slack desde un hilo en segundo plano, fuera del request.
+
+    - notify() solo encola (cola acotada); si la cola está llena el mensaje se descarta
+      y se registra en el log, nunca se bloquea la respuesta HTTP.
+    - Alertas con la misma key dentro de coalesce_window_seconds se agrupan: se envía
+      la primera y las siguientes se cuentan y se informan con la próxima alerta.
+    - record_success() acumula contactos encolados y se envía un resumen por intervalo.
+    - Respeta el Retry-After de Slack cuando responde 429.
+    """
+
+    def __init__(
+        self,
+        slack_service,
+        queue_size: int = 100,
+        coalesce_window_seconds: float = 300,
+        summary_interval_seconds: float = 60,
+        max_retries: int = 3,
+    ) -> None:
+        self.slack_service = slack_service
+        self.coalesce_window_seconds = coalesce_window_seconds
+        self.summary_interval_seconds = summary_interval_seconds
+        self.max_retries = max_retries
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        # key -> (último envío, alertas agrupadas desde entonces)
+        self._alerts: Dict[str, list] = {}
+        self._summary = {"contacts": 0, "requests": 0}
+        self._summary_started = time.monotonic()
+        self._closed = threading.Event()
+
+        self._worker = threading.Thread(target=self._run, name="slack-notifier", daemon=True)
+        self._worker.start()
+
+    def notify(self, text: str, key: Optional[str] = None) -> bool:
+        """Encola un mensaje; retorna False si se agrupó con uno reciente o se descartó"""
+        if key is not None:
+            now = time.monotonic()
+            with self._lock:
+                alert = self._alerts.get(key)
+                if alert and now - alert[0] < self.coalesce_window_seconds:
+                    alert[1] += 1
+                    return False
+                suppressed = alert[1] if alert else 0
+                self._alerts[key] = [now, 0]
+            if suppressed:
+                text = f"{text} ({suppressed} alertas iguales agrupadas en los últimos {int(self.coalesce_window_seconds)}s)"
+        return self._enqueue(text)
+
+    def record_success(self, contacts: int) -> None:
+        """Suma contactos encolados al resumen del intervalo en curso"""
+        with self._lock:
+            self._summary["contacts"] += contacts
+            self._summary["requests"] += 1
+
+    def close(self, timeout: Optional[float] = 10) -> None:
+        """Envía el resumen pendiente y espera a que se vacíe la cola"""
+        self._closed.set()
+        self._worker.join(timeout)
+
+    def _enqueue(self, text: str) -> bool:
+        try:
+            self._queue.put_nowait(text)
+            return True
+        except queue.Full:
+            logger.warning("⚠️ Cola de Slack llena, se descarta el mensaje: %.200s", text)
+            return False
+
+    def _take_summary(self) -> Optional[str]:
+        with self._lock:
+            elapsed = time.monotonic() - self._summary_started
+            contacts, requests = self._summary["contacts"], self._summary["requests"]
+            self._summary = {"contacts": 0, "requests": 0}
+            self._summary_started = time.monotonic()
+        if not requests:
+            return None
+        return f"Enriquecimiento creado correctamente para {contacts} Contactos no scrapeados en los últimos {int(elapsed)}s ({requests} requests)"
+
+    def _run(self) -> None:
+        next_summary = time.monotonic() + self.summary_interval_seconds
+        while True:
+            timeout = max(0.0, next_summary - time.monotonic())
+            if self._closed.is_set():
+                timeout = 0
+            try:
+                self._send(self._queue.get(timeout=timeout))
+                continue
+            except queue.Empty:
+                pass
+
+            if self._closed.is_set() or time.monotonic() >= next_summary:
+                summary = self._take_summary()
+                if summary:
+                    self._send(summary)
+                next_summary = time.monotonic() + self.summary_interval_seconds
+            if self._closed.is_set() and self._queue.empty():
+                return
+
+    def _send(self, text: str) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.slack_service.post_message(text)
+                return
+            except SlackApiError as error:
+                response = getattr(error, "response", None)
+                if getattr(response, "status_code", None) == 429 and attempt < self.max_retries:
+                    retry_after = float(response.headers.get("Retry-After", 1))
+                    logger.warning("⚠️ Slack rate limit, reintentando en %ss", retry_after)
+                    time.sleep(retry_after)
+                    continue
+                logger.error("Error sending message to Slack: %s", error)
+                return
+            except Exception as error:
+                logger.error("Error sending message to Slack: %s", error)
+                return
@@ -3,6 +3,7 @@ from slack.errors import SlackApiError
 from config import Config
 import logging
 from typing import Dict
+from metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -11,15 +12,20 @@ class SlackService:
         self.client = WebClient(token=bot_token)
         self.channel = channel
 
+    @timed("slack")
+    def post_message(self, text: str):
+        """Envía el mensaje; a diferencia de send_message, propaga SlackApiError (p. ej. 429)"""
+        return self.client.chat_postMessage(channel=self.channel, text=text)
+
     def send_message(self, message: Dict):
         try:
-            self.client.chat_postMessage(channel=self.channel, text=message['text'])
+            self.post_message(message['text'])
         except SlackApiError as e:
-            logger.error(f"Error sending message to Slack: {e}")
+            logger.error("Error sending message to Slack: %s", e)
             return False
         return True
 
     def format_message(self, message: Dict):
         return {
             'text': message['text']
-        }
\ No newline at end of file
+        }
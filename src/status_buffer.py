@@ -0,0 +1,179 @@
+import threading
+import time
+from logging import Logger
+import logging
+from typing import Dict, Optional
+
+from service_errors import CompanyStatusBufferFullError
+
+logger: Logger = logging.getLogger(__name__)
+
+
+class CompanyStatusBuffer:
+    """
+    Acumula actualizaciones de estado de scraping (biz_identifier, biz_name,
+    contact_found_flg) y las escribe en BigQuery con un solo MERGE cuando el buffer
+    llega a max_size o cuando la actualización más antigua cumple max_delay_seconds.
+
+    Los flush los hace un hilo en segundo plano y, si el buffer ya cumplió su plazo
+    o su tamaño, el propio request que llama a add (en Cloud Run sin CPU siempre
+    asignada el hilo casi no corre entre requests). Si un MERGE falla, las
+    actualizaciones vuelven al buffer (sin pisar otras más nuevas de la misma
+    empresa) y se reintentan en el siguiente flush; con max_pending empresas sin
+    escribir, add rechaza las nuevas con CompanyStatusBufferFullError en vez de
+    acumular en memoria sin límite.
+    """
+
+    def __init__(self, bigquery_service, table_name: str, max_size: int = 1000, max_delay_seconds: float = 30, max_pending: int = 10000) -> None:
+        self.bigquery_service = bigquery_service
+        self.table_name = table_name
+        self.max_size = max_size
+        self.max_delay_seconds = max_delay_seconds
+        self.max_pending = max_pending
+
+        self._pending: Dict[tuple, Dict] = {}
+        self._oldest_pending: Optional[float] = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        # Tras un MERGE fallido los requests no reintentan antes de este instante (monotonic)
+        self._retry_after = 0.0
+        self._closed = False
+
+        self._stats = {
+            "flushes": 0,
+            "failed_flushes": 0,
+            "rows_flushed": 0,
+            "last_flush_rows": 0,
+            "last_flush_seconds": None,
+            "last_flush_at": None,
+            "last_error": None,
+        }
+
+        self._worker = threading.Thread(target=self._run, name="company-status-buffer", daemon=True)
+        self._worker.start()
+
+    def add(self, biz_identifier: str, biz_name: str, contact_found_flg: bool) -> int:
+        """
+        Encola una actualización; retorna cuántas quedan pendientes.
+
+        Raises:
+            CompanyStatusBufferFullError: Si ya hay max_pending empresas sin escribir
+        """
+        if self._closed:
+            raise RuntimeError("COMPANY_STATUS_BUFFER_CLOSED")
+
+        key = (biz_identifier, biz_name)
+        with self._condition:
+            full = key not in self._pending and len(self._pending) >= self.max_pending
+        if full:
+            # Puede que BigQuery ya se haya recuperado y el hilo no haya tenido CPU para reintentar
+            self._flush_due()
+
+        with self._condition:
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                raise CompanyStatusBufferFullError(
+                    f"{len(self._pending)} actualizaciones sin escribir en BigQuery, máximo {self.max_pending}"
+                )
+            self._pending[key] = {
+                "biz_identifier": biz_identifier,
+                "biz_name": biz_name,
+                "contact_found_flg": contact_found_flg,
+            }
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            pending = len(self._pending)
+            due = self._should_flush()
+            if pending >= self.max_size:
+                self._condition.notify()
+
+        if due:
+            self._flush_due()
+        return pending
+
+    def flush(self) -> int:
+        """Escribe ahora todo lo pendiente; retorna el número de empresas enviadas"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush_due(self) -> None:
+        """Flush desde el request si no hay otro en curso; un error deja todo pendiente"""
+        if time.monotonic() < self._retry_after or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._flush()
+        except Exception:
+            # Ya se registró en _flush(); la actualización sigue en el buffer
+            pass
+        finally:
+            self._flush_lock.release()
+
+    def _flush(self) -> int:
+        with self._condition:
+            batch = self._pending
+            self._pending = {}
+            self._oldest_pending = None
+        if not batch:
+            return 0
+
+        start_time = time.perf_counter()
+        try:
+            self.bigquery_service.update_companies_scraped_status(self.table_name, list(batch.values()))
+        except Exception as error_message:
+            with self._condition:
+                # Las actualizaciones encoladas durante el flush son más nuevas: tienen prioridad
+                batch.update(self._pending)
+                self._pending = batch
+                if self._oldest_pending is None:
+                    self._oldest_pending = time.monotonic()
+                self._stats["failed_flushes"] += 1
+                self._stats["last_error"] = str(error_message)
+                self._retry_after = time.monotonic() + min(self.max_delay_seconds, 5)
+            logger.error("❌ Error en flush de %s actualizaciones de empresas: %s", len(batch), error_message)
+            raise
+
+        elapsed = time.perf_counter() - start_time
+        with self._condition:
+            self._stats["flushes"] += 1
+            self._stats["rows_flushed"] += len(batch)
+            self._stats["last_flush_rows"] = len(batch)
+            self._stats["last_flush_seconds"] = elapsed
+            self._stats["last_flush_at"] = time.time()
+        logger.info("✅ Flush de %s actualizaciones de empresas en %.3fs", len(batch), elapsed)
+        return len(batch)
+
+    def stats(self) -> Dict:
+        """Métricas de los flush realizados y del buffer actual"""
+        with self._condition:
+            return {**self._stats, "pending": len(self._pending)}
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Detiene el hilo y hace un último flush de lo pendiente"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join(timeout)
+        self.flush()
+
+    def _should_flush(self) -> bool:
+        if not self._pending:
+            return False
+        if len(self._pending) >= self.max_size:
+            return True
+        return time.monotonic() - self._oldest_pending >= self.max_delay_seconds
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and not self._should_flush():
+                    if self._oldest_pending is None:
+                        self._condition.wait()
+                    else:
+                        remaining = self.max_delay_seconds - (time.monotonic() - self._oldest_pending)
+                        self._condition.wait(max(remaining, 0.01))
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # Ya se registró en flush(); se espera al próximo disparo para reintentar
+                time.sleep(min(self.max_delay_seconds, 5))
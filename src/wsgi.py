@@ -0,0 +1,8 @@
+"""
+Punto de entrada WSGI para producción.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from main import app, begin_shutdown, services, shutdown_services
+
+__all__ = ["app", "begin_shutdown", "services", "shutdown_services"]